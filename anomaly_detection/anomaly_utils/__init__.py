@@ -1,3 +1,11 @@
 from .stream_generator import StreamGenerator
+from .csv_tailer import CSVTailer
+from .checkpoint import Checkpoint
+from .anomaly_sink import AnomalySink
+from .process_pool import StickyProcessPool
+from .shm_ring import ShmRing
+from .trace_archive import TraceArchive, TraceArchiveWriter
+from .pid_rollup import PidRollup
+from .load_shedder import LoadShedder
 
-__all__ = ['StreamGenerator']
\ No newline at end of file
+__all__ = ['StreamGenerator', 'CSVTailer', 'Checkpoint', 'AnomalySink', 'StickyProcessPool', 'ShmRing', 'TraceArchive', 'TraceArchiveWriter', 'PidRollup', 'LoadShedder']
\ No newline at end of file
@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class AnomalySink:
+    """Single writer for an anomaly file shared by many detectors.
+
+    Detectors hand their anomaly lines to ``write``, which only enqueues
+    them. A background thread owns the file handle and writes the queued
+    lines in batches, either once ``batch_size`` lines are waiting or
+    ``flush_interval`` seconds after the oldest one arrived. The queue is
+    bounded, so producers block instead of growing memory when the disk
+    falls behind. The file is rotated like ``logging.RotatingFileHandler``
+    once it exceeds ``max_bytes`` or is older than ``rotate_interval``.
+
+    The number of lines written per key is tracked in memory, so callers can
+    report new anomalies without reading the file back.
+
+    Besides plain lines, ``write`` accepts ``AnomalyRecord`` objects. They are
+    written as CSV lines and, when a ``store`` is given, also appended to that
+    ``AnomalyStore`` by the writer thread.
+
+    Args:
+        path (str): Anomaly file, appended to.
+        max_queue (int, optional): Maximum number of pending ``write`` calls.
+            Defaults to 1024.
+        batch_size (int, optional): Lines that trigger an immediate write.
+            Defaults to 1024.
+        flush_interval (float, optional): Maximum delay in seconds before
+            queued lines are written. Defaults to 1.0.
+        max_bytes (int, optional): Rotate when the file would grow past this
+            size, 0 disables. Defaults to 0.
+        rotate_interval (float, optional): Rotate files older than this many
+            seconds, 0 disables. Defaults to 0.
+        backup_count (int, optional): Rotated files to keep (path.1 is the
+            newest). Defaults to 5.
+        store (AnomalyStore, optional): Columnar store receiving the written
+            records. Defaults to None.
+    """
+
+    def __init__(self, path: str, max_queue: int = 1024, batch_size: int = 1024, flush_interval: float = 1.0,
+                 max_bytes: int = 0, rotate_interval: float = 0, backup_count: int = 5, store=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.store = store
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="anomaly-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, lines: list, key: str = None):
+        """Queue anomalies for writing.
+
+        Args:
+            lines (list): ``AnomalyRecord`` objects, or lines including their
+                trailing newline.
+            key (str, optional): Counter to add the lines to, typically the
+                monitored data file. Defaults to None.
+        """
+        if not lines:
+            return
+        if self._closed:
+            raise ValueError("write to a closed AnomalySink")
+        with self._lock:
+            self._counts[key] += len(lines)
+        self._queue.put(list(lines))
+
+    def count(self, key: str = None) -> int:
+        """Lines written so far for key, or in total when key is None."""
+        with self._lock:
+            if key is None:
+                return sum(self._counts.values())
+            return self._counts[key]
+
+    def flush(self):
+        """Block until every queued line has been written to the file."""
+        if self._closed:
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """Write the remaining lines and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a')
+        self._opened_at = time.monotonic()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _write_batch(self, batch: list):
+        items = [item for lines in batch for item in lines]
+        records = [item for item in items if not isinstance(item, str)]
+        if records and self.store is not None:
+            try:
+                self.store.append(records)
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Error storing anomalies: {e}")
+        data = ''.join(item if isinstance(item, str) else item.to_csv_line() for item in items)
+        if not data:
+            return
+        try:
+            if self._file is None:
+                self._open()
+            size = self._file.tell()
+            if size > 0 and (
+                    (self.max_bytes and size + len(data) > self.max_bytes) or
+                    (self.rotate_interval and time.monotonic() - self._opened_at >= self.rotate_interval)):
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            print(f"Error writing anomalies to {self.path}: {e}")
+
+    def _run(self):
+        batch = []
+        pending_lines = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not _FLUSH and item is not _CLOSE:
+                batch.append(item)
+                pending_lines += len(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending_lines < self.batch_size:
+                    continue
+
+            # Batch full, interval elapsed, flush or close requested
+            self._write_batch(batch)
+            if self.store is not None and (item is _FLUSH or item is _CLOSE):
+                try:
+                    self.store.flush()
+                except OSError as e:
+                    print(f"Error storing anomalies: {e}")
+            for _ in range(len(batch) + (item is _FLUSH or item is _CLOSE)):
+                self._queue.task_done()
+            batch = []
+            pending_lines = 0
+            deadline = None
+
+            if item is _CLOSE:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 1
+INDEX_FILE = 'index.json'
+COLUMNS = ['timestamp', 'metric', 'pid', 'value', 'score', 'detector']
+NO_PID = -1
+
+
+class AnomalyRecord(namedtuple('AnomalyRecord', COLUMNS)):
+    """One detected anomaly, in the fixed schema of the anomaly store.
+
+    ``pid`` is None for metrics without a process id.
+    """
+
+    __slots__ = ()
+
+    def to_csv_line(self) -> str:
+        """Line of the anomaly CSV: timestamp,metric[,pid],value,score"""
+        if self.pid is None:
+            return f"{self.timestamp},{self.metric},{self.value},{self.score}\n"
+        return f"{self.timestamp},{self.metric},{self.pid},{self.value},{self.score}\n"
+
+
+def _to_int(value, default: int) -> int:
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        # Date strings and the like, as nanoseconds since the epoch
+        return pd.Timestamp(value).value
+
+
+class AnomalyStore:
+    """Append-only columnar store of anomalies with a time/metric index.
+
+    Records are buffered in memory and written as immutable segments
+    (``seg-<n>.npz``), one array per column, with metric and detector names
+    dictionary encoded. ``index.json`` lists every segment together with its
+    time range and the metrics it contains, so ``query`` only loads the
+    segments that can match.
+
+    Args:
+        root (str): Directory of the store, created if missing.
+        segment_rows (int, optional): Buffered records that trigger writing a
+            segment. Defaults to 65536.
+    """
+
+    def __init__(self, root: str, segment_rows: int = 65536):
+        self.root = root
+        self.segment_rows = segment_rows
+        self._lock = threading.Lock()
+        self._buffer = []
+        os.makedirs(root, exist_ok=True)
+        self._index = self._load_index()
+        self._metric_codes = {name: i for i, name in enumerate(self._index['metrics'])}
+        self._detector_codes = {name: i for i, name in enumerate(self._index['detectors'])}
+
+    def _load_index(self) -> dict:
+        try:
+            with open(os.path.join(self.root, INDEX_FILE), 'r') as f:
+                index = json.load(f)
+            if index.get('version') == STORE_VERSION:
+                return index
+        except (OSError, json.JSONDecodeError):
+            pass
+        return {'version': STORE_VERSION, 'metrics': [], 'detectors': [], 'segments': []}
+
+    def _save_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _code(codes: dict, names: list, name: str) -> int:
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def append(self, records):
+        """Buffer anomalies, writing a segment once enough are pending.
+
+        Args:
+            records (iterable): ``AnomalyRecord`` instances or tuples in the
+                same field order.
+        """
+        with self._lock:
+            self._buffer.extend(AnomalyRecord(*r) for r in records)
+            if len(self._buffer) >= self.segment_rows:
+                self._write_segment()
+
+    def flush(self):
+        """Write the buffered anomalies as a segment."""
+        with self._lock:
+            self._write_segment()
+
+    def _columns(self, records: list) -> dict:
+        return {
+            'timestamp': np.array([_to_int(r.timestamp, 0) for r in records], dtype=np.int64),
+            'metric': np.array([self._code(self._metric_codes, self._index['metrics'], str(r.metric))
+                                for r in records], dtype=np.int32),
+            'pid': np.array([_to_int(r.pid, NO_PID) for r in records], dtype=np.int64),
+            'value': np.array([r.value for r in records], dtype=np.float64),
+            'score': np.array([r.score for r in records], dtype=np.float64),
+            'detector': np.array([self._code(self._detector_codes, self._index['detectors'], str(r.detector))
+                                  for r in records], dtype=np.int32),
+        }
+
+    def _write_segment(self):
+        if not self._buffer:
+            return
+        columns = self._columns(self._buffer)
+        name = f"seg-{len(self._index['segments']):06d}.npz"
+        tmp_path = os.path.join(self.root, name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, os.path.join(self.root, name))
+        self._index['segments'].append({
+            'file': name,
+            'rows': len(self._buffer),
+            't0': int(columns['timestamp'].min()),
+            't1': int(columns['timestamp'].max()),
+            'metrics': sorted(set(columns['metric'].tolist())),
+        })
+        self._save_index()
+        self._buffer = []
+
+    def query(self, metric: str = None, t0: int = None, t1: int = None, pid: int = None,
+              detector: str = None) -> pd.DataFrame:
+        """Anomalies matching every given filter, in insertion order.
+
+        Args:
+            metric (str, optional): Metric name.
+            t0 (int, optional): Earliest timestamp (inclusive).
+            t1 (int, optional): Latest timestamp (inclusive).
+            pid (int, optional): Process id.
+            detector (str, optional): Detector name.
+
+        Returns:
+            pd.DataFrame: Columns timestamp, metric, pid, value, score,
+            detector. ``pid`` is -1 for metrics without a process id.
+        """
+        with self._lock:
+            metric_code = self._metric_codes.get(metric, -2) if metric is not None else None
+            detector_code = self._detector_codes.get(detector, -2) if detector is not None else None
+            segments = [s for s in self._index['segments']
+                        if (t0 is None or s['t1'] >= t0) and (t1 is None or s['t0'] <= t1)
+                        and (metric_code is None or metric_code in s['metrics'])]
+            parts = [self._columns(self._buffer)] if self._buffer else []
+            metrics = list(self._index['metrics'])
+            detectors = list(self._index['detectors'])
+
+        loaded = []
+        for segment in segments:
+            with np.load(os.path.join(self.root, segment['file'])) as data:
+                loaded.append({column: data[column] for column in COLUMNS})
+        parts = loaded + parts
+
+        frames = []
+        for columns in parts:
+            mask = np.ones(len(columns['timestamp']), dtype=bool)
+            if metric_code is not None:
+                mask &= columns['metric'] == metric_code
+            if detector_code is not None:
+                mask &= columns['detector'] == detector_code
+            if t0 is not None:
+                mask &= columns['timestamp'] >= t0
+            if t1 is not None:
+                mask &= columns['timestamp'] <= t1
+            if pid is not None:
+                mask &= columns['pid'] == pid
+            if mask.any():
+                frames.append({column: values[mask] for column, values in columns.items()})
+
+        if not frames:
+            return pd.DataFrame({column: [] for column in COLUMNS})
+        result = {column: np.concatenate([f[column] for f in frames]) for column in COLUMNS}
+        result['metric'] = np.array(metrics, dtype=object)[result['metric']]
+        result['detector'] = np.array(detectors, dtype=object)[result['detector']]
+        return pd.DataFrame(result, columns=COLUMNS)
+
+    def export_csv(self, path: str, **filters) -> int:
+        """Write the anomalies matching filters (see ``query``) to a CSV file.
+
+        Returns:
+            int: Number of anomalies exported.
+        """
+        df = self.query(**filters)
+        df.to_csv(path, index=False)
+        return len(df)
+
+    def close(self):
+        """Write the remaining buffered anomalies."""
+        self.flush()
@@ -0,0 +1,115 @@
+import os
+import pickle
+import time
+from contextlib import nullcontext
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    """Periodic, atomic snapshots of per-file detector state.
+
+    A snapshot holds, for every monitored file, the pickled detector (see
+    ``BaseDetector.__getstate__``), the number of rows consumed and the
+    ``CSVTailer`` offset, so a restarted poller continues warm from exactly
+    the row the detector last saw. Snapshots are written to a temporary file
+    that replaces the previous one with ``os.replace``; a crash never leaves
+    a half written checkpoint behind.
+
+    Args:
+        path (str): Checkpoint file, usually next to the processing state file.
+        interval (float, optional): Seconds between periodic snapshots, 0
+            disables them. Defaults to 60.0.
+    """
+
+    def __init__(self, path: str, interval: float = 60.0):
+        self.path = path
+        self.interval = interval
+        self._next_save = time.monotonic() + interval
+
+    @staticmethod
+    def path_for(state_file: str) -> str:
+        """Checkpoint path stored next to a JSON state file."""
+        return os.path.splitext(state_file)[0] + '.ckpt'
+
+    def due(self) -> bool:
+        """Whether the periodic snapshot interval has elapsed."""
+        return self.interval > 0 and time.monotonic() >= self._next_save
+
+    def save_detectors(self, models: dict, processed_rows: dict, tailer=None, locks: dict = None, sink=None):
+        """Snapshot every file's detector, row count and tailer offset.
+
+        Args:
+            models (dict): Data file -> detector instance (or None).
+            processed_rows (dict): Data file -> rows consumed.
+            tailer (CSVTailer, optional): Reader holding the byte offsets.
+            locks (dict, optional): Data file -> lock held while the file is
+                being processed, for pollers with one thread per file.
+            sink (AnomalySink, optional): Flushed before the snapshot is
+                written, so the anomalies of every checkpointed row are on disk.
+        """
+        files = {}
+        for data_file in list(set(models) | set(processed_rows)):
+            lock = locks.get(data_file) if locks else None
+            with lock or nullcontext():
+                # Pickle under the lock so model and offsets are consistent
+                files[data_file] = {
+                    'model': pickle.dumps(models.get(data_file), protocol=pickle.HIGHEST_PROTOCOL),
+                    'processed': processed_rows.get(data_file, 0),
+                    'tailer': tailer.get_state([data_file]).get(data_file) if tailer is not None else None,
+                }
+        if sink is not None:
+            sink.flush()
+        self.save({'files': files})
+
+    def save(self, state: dict):
+        """Atomically replace the checkpoint file with state."""
+        state = dict(state, version=CHECKPOINT_VERSION, saved_at=time.time())
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._next_save = time.monotonic() + self.interval
+
+    def load(self):
+        """Read the checkpoint.
+
+        Returns:
+            dict: The saved state, None if missing, unreadable or written by
+            an incompatible version.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != CHECKPOINT_VERSION:
+            return None
+        return state
+
+    def restore_detectors(self, models: dict, processed_rows: dict, tailer=None) -> int:
+        """Fill models, processed_rows and tailer offsets from the checkpoint.
+
+        Returns:
+            int: Number of files restored.
+        """
+        state = self.load()
+        if state is None:
+            return 0
+        for data_file, entry in state['files'].items():
+            model = pickle.loads(entry['model'])
+            if model is not None:
+                models[data_file] = model
+            processed_rows[data_file] = entry['processed']
+            if tailer is not None and entry['tailer'] is not None:
+                tailer.load_state({data_file: entry['tailer']})
+        return len(state['files'])
+
+    def remove(self):
+        """Delete the checkpoint file, for a fresh start."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,147 @@
+import io
+import os
+
+import pandas as pd
+
+
+class CSVTailer:
+    """Incrementally read rows appended to growing CSV files.
+
+    For every file the tailer remembers the byte offset up to which data has
+    been consumed, the header and any trailing partial line, so a poll only
+    parses the bytes written since the previous one instead of re-scanning the
+    whole file.
+
+    Args:
+        state (dict, optional): State previously returned by ``get_state``.
+    """
+
+    def __init__(self, state: dict = None):
+        self._files = {}
+        if state:
+            self.load_state(state)
+
+    def _stat(self, path: str):
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _entry(self, path: str, st: os.stat_result) -> dict:
+        entry = self._files.get(path)
+        # The file was truncated or replaced: start again from the top.
+        if entry is not None and (st.st_size < entry['offset'] or st.st_ino != entry['inode']):
+            entry = None
+        if entry is None:
+            entry = {'offset': 0, 'partial': b'', 'header': None, 'rows': 0, 'inode': st.st_ino}
+            self._files[path] = entry
+        return entry
+
+    def _skip_rows(self, path: str, entry: dict, skip_rows: int):
+        """Position a fresh entry after the header and ``skip_rows`` data rows."""
+        with open(path, 'rb') as f:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                return
+            entry['header'] = self._parse_header(line)
+            skipped = 0
+            while skipped < skip_rows:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    # Leave an incomplete row to be completed by later writes.
+                    f.seek(-len(line), os.SEEK_CUR)
+                    break
+                skipped += 1
+            entry['offset'] = f.tell()
+            entry['rows'] = skipped
+
+    @staticmethod
+    def _parse_header(line: bytes) -> list:
+        return list(pd.read_csv(io.BytesIO(line), nrows=0).columns)
+
+    def pending_bytes(self, path: str) -> int:
+        """Number of bytes appended to ``path`` that have not been read yet."""
+        st = self._stat(path)
+        if st is None:
+            return 0
+        entry = self._files.get(path)
+        if entry is None or st.st_ino != entry['inode'] or st.st_size < entry['offset']:
+            return st.st_size
+        return st.st_size - entry['offset']
+
+    def has_new_data(self, path: str) -> bool:
+        """Cheap check (a single ``stat``) for data appended since the last read."""
+        return self.pending_bytes(path) > 0
+
+    def rows(self, path: str) -> int:
+        """Number of data rows consumed from ``path`` so far."""
+        entry = self._files.get(path)
+        return entry['rows'] if entry else 0
+
+    def read(self, path: str, skip_rows: int = 0, max_bytes: int = None) -> pd.DataFrame:
+        """Parse the complete rows appended to ``path`` since the last call.
+
+        Args:
+            path (str): CSV file with a header line.
+            skip_rows (int, optional): Data rows to skip when the file has not
+                been seen before, e.g. a line count restored from an older
+                state file. Defaults to 0.
+            max_bytes (int, optional): Upper bound on the bytes read in this
+                call, remaining data is returned by later calls. Defaults to
+                None (read everything available).
+
+        Returns:
+            pd.DataFrame: New rows, empty if nothing complete was appended.
+        """
+        st = self._stat(path)
+        if st is None:
+            return pd.DataFrame()
+        is_new = path not in self._files
+        entry = self._entry(path, st)
+        if is_new and skip_rows > 0:
+            self._skip_rows(path, entry, skip_rows)
+
+        with open(path, 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read() if max_bytes is None else f.read(max_bytes)
+            entry['offset'] = f.tell()
+
+        data = entry['partial'] + data
+        end = data.rfind(b'\n') + 1
+        entry['partial'] = data[end:]
+        data = data[:end]
+
+        if entry['header'] is None:
+            header_end = data.find(b'\n') + 1
+            if header_end == 0:
+                return pd.DataFrame()
+            entry['header'] = self._parse_header(data[:header_end])
+            data = data[header_end:]
+
+        if not data:
+            return pd.DataFrame(columns=entry['header'])
+        df = pd.read_csv(io.BytesIO(data), header=None, names=entry['header'])
+        entry['rows'] += len(df)
+        return df
+
+    def forget(self, path: str):
+        """Drop the bookkeeping for ``path``."""
+        self._files.pop(path, None)
+
+    def get_state(self, paths=None) -> dict:
+        """JSON serializable snapshot of the per-file offsets.
+
+        Args:
+            paths (iterable, optional): Only include these files. Defaults to
+                None (every file).
+        """
+        state = {}
+        for path, entry in list(self._files.items()):
+            if paths is None or path in paths:
+                state[path] = dict(entry, partial=entry['partial'].decode('latin-1'))
+        return state
+
+    def load_state(self, state: dict):
+        """Restore offsets produced by ``get_state``."""
+        for path, entry in state.items():
+            self._files[path] = dict(entry, partial=entry['partial'].encode('latin-1'))
@@ -0,0 +1,236 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+# Filesystems on which inotify does not see writes made by other hosts
+NO_INOTIFY_FS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'afs', 'ceph', 'glusterfs', 'lustre'}
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def _filesystem_type(path: str) -> str:
+    """Type of the filesystem holding path, read from /proc/self/mounts."""
+    path = os.path.realpath(path)
+    best, fstype = '', ''
+    try:
+        with open('/proc/self/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                prefix = mount_point.rstrip('/') + '/'
+                if (path == mount_point or path.startswith(prefix)) and len(mount_point) > len(best):
+                    best, fstype = mount_point, fields[2]
+    except OSError:
+        pass
+    return fstype
+
+
+class FileWatcher:
+    """Wait until data is appended to a set of files or directories.
+
+    Paths are watched through inotify on their parent directory, so files
+    that do not exist yet are picked up once they are created. Paths whose
+    filesystem does not deliver inotify events (NFS, CIFS, ...) or a kernel
+    without inotify fall back to comparing ``stat`` results every
+    ``poll_interval`` seconds.
+
+    Args:
+        poll_interval (float, optional): Polling period of the fallback, in
+            seconds. Defaults to 1.0.
+        use_inotify (bool, optional): Set to False to always poll. Defaults to
+            True.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, use_inotify: bool = True):
+        self.poll_interval = poll_interval
+        self._libc = _load_libc() if use_inotify else None
+        self._fd = None
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+        # inotify watch descriptor -> directory
+        self._wd_dirs = {}
+        self._dir_wds = {}
+        # Exact files of interest and directories whose every child counts
+        self._files = set()
+        self._dirs = set()
+        # Polled path -> last seen signature
+        self._polled = {}
+        self._next_poll = 0.0
+
+    @property
+    def inotify(self) -> bool:
+        """Whether any path is served by inotify."""
+        return self._fd is not None and bool(self._wd_dirs)
+
+    def fileno(self):
+        """inotify file descriptor, usable with select or an event loop."""
+        return self._fd
+
+    def _add_inotify_watch(self, directory: str) -> bool:
+        if self._fd is None or _filesystem_type(directory) in NO_INOTIFY_FS:
+            return False
+        if directory in self._dir_wds:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            return False
+        self._wd_dirs[wd] = directory
+        self._dir_wds[directory] = wd
+        return True
+
+    def _signature(self, path: str):
+        try:
+            if path in self._dirs:
+                signature = {}
+                for entry in os.scandir(path):
+                    if entry.is_file():
+                        st = entry.stat()
+                        signature[entry.path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                return signature
+            st = os.stat(path)
+            return st.st_ino, st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def add(self, path: str):
+        """Watch a file for appends (it may not exist yet)."""
+        path = os.path.normpath(path)
+        directory = os.path.dirname(path) or '.'
+        self._files.add(path)
+        if not (os.path.isdir(directory) and self._add_inotify_watch(directory)):
+            self._polled[path] = self._signature(path)
+
+    def add_directory(self, directory: str):
+        """Watch every file inside a directory, e.g. traceOutput/op."""
+        directory = os.path.normpath(directory)
+        self._dirs.add(directory)
+        if not (os.path.isdir(directory) and self._add_inotify_watch(directory)):
+            self._polled[directory] = self._signature(directory)
+
+    def remove(self, path: str):
+        """Stop reporting changes of path."""
+        path = os.path.normpath(path)
+        self._files.discard(path)
+        self._dirs.discard(path)
+        self._polled.pop(path, None)
+
+    def read_events(self) -> set:
+        """Drain pending inotify events without blocking.
+
+        Returns:
+            set: Watched paths that changed. Changes inside a watched
+            directory are reported as the path of the changed file.
+        """
+        changed = set()
+        if self._fd is None:
+            return changed
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = buf[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: report everything as changed
+                    changed.update(self._files)
+                    changed.update(self._dirs)
+                    continue
+                directory = self._wd_dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if path in self._files or directory in self._dirs:
+                    changed.add(path)
+        return changed
+
+    def _poll(self) -> set:
+        changed = set()
+        for path, signature in list(self._polled.items()):
+            current = self._signature(path)
+            if current == signature:
+                continue
+            self._polled[path] = current
+            if path in self._dirs:
+                signature = signature or {}
+                changed.update(p for p, sig in (current or {}).items() if signature.get(p) != sig)
+            elif current is not None:
+                changed.add(path)
+        self._next_poll = time.monotonic() + self.poll_interval
+        return changed
+
+    def wait(self, timeout: float = None) -> set:
+        """Block until a watched path changes or timeout expires.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most, None waits
+                forever. Defaults to None.
+
+        Returns:
+            set: Changed paths, empty on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.read_events()
+            if self._polled and time.monotonic() >= self._next_poll:
+                changed |= self._poll()
+            if changed:
+                return changed
+
+            now = time.monotonic()
+            delays = []
+            if deadline is not None:
+                if now >= deadline:
+                    return changed
+                delays.append(deadline - now)
+            if self._polled:
+                delays.append(max(0.0, self._next_poll - now))
+            delay = min(delays) if delays else None
+
+            if self._fd is not None and self._wd_dirs:
+                select.select([self._fd], [], [], delay)
+            elif delay is not None:
+                time.sleep(delay)
+            else:
+                # Nothing can ever change: avoid spinning
+                time.sleep(self.poll_interval)
+
+    def close(self):
+        """Release the inotify descriptor."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._wd_dirs.clear()
+        self._dir_wds.clear()
@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+SHEDDING_MODES = ('reservoir', 'stratified', 'max_latency')
+
+
+class LoadShedder:
+    """Downsample op events when they arrive faster than the detectors can score them.
+
+    Detector throughput is measured from the detection cycles reported with
+    ``record_throughput`` (or fixed with ``capacity``) and refills a token
+    bucket of rows; ``shed`` lets a batch through untouched while the bucket
+    covers it and otherwise keeps only as many rows as there are tokens:
+
+    - ``reservoir``: a uniform random sample of the batch;
+    - ``stratified``: a random sample with the budget split over the ops in
+      proportion to their rows, every op keeping at least one row;
+    - ``max_latency``: the same per-op split, keeping the slowest rows so
+      latency spikes survive the downsampling.
+
+    Kept rows stay in their original order. Every offered, kept and dropped
+    row is counted per op, so reports can state how much data was shed.
+
+    Args:
+        mode (str, optional): 'reservoir', 'stratified' or 'max_latency'.
+            Defaults to 'stratified'.
+        capacity (float, optional): Fixed detector throughput in rows per
+            second; measured when None. Defaults to None.
+        utilization (float, optional): Fraction of the throughput rows are
+            admitted at. Defaults to 0.8.
+        burst (float, optional): Seconds of throughput the bucket can hold.
+            Defaults to 5.0.
+        min_rows (int, optional): Smallest detection batch used to measure
+            throughput, smaller ones are dominated by fixed costs. Defaults
+            to 256.
+        seed (int, optional): Seed of the sampling. Defaults to None.
+
+    Raises:
+        ValueError: Unknown mode.
+    """
+
+    def __init__(self, mode: str = 'stratified', capacity: float = None, utilization: float = 0.8,
+                 burst: float = 5.0, min_rows: int = 256, seed: int = None):
+        if mode not in SHEDDING_MODES:
+            raise ValueError(f"Unknown load shedding mode '{mode}', expected one of {SHEDDING_MODES}.")
+        self.mode = mode
+        self.utilization = utilization
+        self.burst = burst
+        self.min_rows = min_rows
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._throughput = capacity
+        self._fixed = capacity is not None
+        self._tokens = None if capacity is None else capacity * burst
+        self._refilled_at = time.monotonic()
+        self.offered = Counter()
+        self.kept = Counter()
+
+    @property
+    def throughput(self) -> float:
+        """Detector throughput in rows per second, None until measured."""
+        return self._throughput
+
+    def record_throughput(self, rows: int, seconds: float):
+        """Report a detection cycle that scored rows in seconds."""
+        if self._fixed or rows < self.min_rows or seconds <= 0:
+            return
+        with self._lock:
+            rate = rows / seconds
+            self._throughput = rate if self._throughput is None else 0.8 * self._throughput + 0.2 * rate
+            if self._tokens is None:
+                self._tokens = self._throughput * self.burst
+                self._refilled_at = time.monotonic()
+
+    def _budget(self, rows: int) -> int:
+        """Take up to rows tokens from the bucket, return how many were taken."""
+        if self._tokens is None:
+            return rows
+        now = time.monotonic()
+        rate = self._throughput * self.utilization
+        self._tokens = min(self._throughput * self.burst, self._tokens + rate * (now - self._refilled_at))
+        self._refilled_at = now
+        budget = min(rows, int(self._tokens))
+        self._tokens -= budget
+        return budget
+
+    def shed(self, df: pd.DataFrame, op_column: str = 'OP_TYPE', value_column: str = 'latency') -> pd.DataFrame:
+        """Rows of df to forward to the detectors.
+
+        Args:
+            df (pd.DataFrame): New rows, in time order.
+            op_column (str, optional): Column holding the op name. Defaults to
+                'OP_TYPE'.
+            value_column (str, optional): Column ranked by 'max_latency'.
+                Defaults to 'latency'.
+
+        Returns:
+            pd.DataFrame: df itself or the kept subset of its rows.
+        """
+        if df.empty:
+            return df
+        ops = df[op_column].to_numpy()
+        with self._lock:
+            budget = self._budget(len(df))
+            if budget >= len(df):
+                keep = None
+            elif self.mode == 'reservoir':
+                keep = self._rng.choice(len(df), size=budget, replace=False)
+            else:
+                keep = self._stratified(ops, df[value_column].to_numpy(), budget)
+            self.offered.update(ops.tolist())
+            kept_ops = ops if keep is None else ops[keep]
+            self.kept.update(kept_ops.tolist())
+        if keep is None:
+            return df
+        return df.iloc[np.sort(keep)]
+
+    def _stratified(self, ops: np.ndarray, values: np.ndarray, budget: int) -> np.ndarray:
+        names, inverse, counts = np.unique(ops, return_inverse=True, return_counts=True)
+        # Proportional split of the budget, at least one row per op while the budget lasts
+        quotas = np.floor(counts * budget / len(ops)).astype(int)
+        quotas = np.maximum(quotas, np.minimum(1, counts))
+        while quotas.sum() > budget:
+            quotas[np.argmax(quotas)] -= 1
+        keep = []
+        for i in range(len(names)):
+            rows = np.flatnonzero(inverse == i)
+            if quotas[i] >= len(rows):
+                keep.append(rows)
+            elif self.mode == 'max_latency':
+                keep.append(rows[np.argsort(values[rows], kind='stable')[len(rows) - quotas[i]:]])
+            else:
+                keep.append(self._rng.choice(rows, size=quotas[i], replace=False))
+        return np.concatenate(keep) if keep else np.empty(0, dtype=int)
+
+    def stats(self) -> dict:
+        """Rows offered, kept and dropped so far, in total and per op."""
+        with self._lock:
+            offered = dict(self.offered)
+            kept = dict(self.kept)
+        return {
+            'mode': self.mode,
+            'offered': sum(offered.values()),
+            'kept': sum(kept.values()),
+            'dropped': sum(offered.values()) - sum(kept.values()),
+            'per_op': {op: {'offered': count, 'kept': kept.get(op, 0), 'dropped': count - kept.get(op, 0)}
+                       for op, count in offered.items()},
+        }
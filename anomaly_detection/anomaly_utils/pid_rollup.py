@@ -0,0 +1,82 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+ROLLUP_COLUMNS = ['metric', 'pid', 'count', 'max_value', 'first_seen', 'last_seen']
+
+
+class PidRollup:
+    """Running per-process summary of the anomalies of every op stream.
+
+    For each (metric, pid) pair it keeps the number of anomalies, the largest
+    anomalous value (latency for the op streams) and the timestamps of the
+    first and last anomaly, so the noisiest clients are available without
+    scanning the anomaly file. Updates take whole arrays of anomalies and are
+    safe to call from several detector threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (metric, pid) -> [count, max_value, first_seen, last_seen]
+        self._stats = {}
+
+    def update(self, metric: str, pids, values, timestamps):
+        """Add a batch of anomalies of one stream, in time order.
+
+        Args:
+            metric (str): Stream the anomalies belong to, e.g. READ.
+            pids (array-like): Process id of every anomaly.
+            values (array-like): Anomalous values.
+            timestamps (array-like): Timestamps of the anomalies.
+        """
+        pids = np.asarray(pids)
+        if not len(pids):
+            return
+        values = np.asarray(values, dtype=float)
+        timestamps = np.asarray(timestamps)
+        unique_pids, first_index, inverse, counts = np.unique(
+            pids, return_index=True, return_inverse=True, return_counts=True)
+        last_index = len(pids) - 1 - np.unique(pids[::-1], return_index=True)[1]
+        max_values = np.full(len(unique_pids), -np.inf)
+        np.maximum.at(max_values, inverse, values)
+        first_seen = timestamps[first_index].tolist()
+        last_seen = timestamps[last_index].tolist()
+
+        with self._lock:
+            for i, (pid, count, max_value) in enumerate(zip(unique_pids.tolist(), counts.tolist(),
+                                                             max_values.tolist())):
+                stats = self._stats.get((metric, pid))
+                if stats is None:
+                    self._stats[(metric, pid)] = [count, max_value, first_seen[i], last_seen[i]]
+                else:
+                    stats[0] += count
+                    stats[1] = max(stats[1], max_value)
+                    stats[3] = last_seen[i]
+
+    def top(self, n: int = 10, metric: str = None, by: str = 'count') -> pd.DataFrame:
+        """Noisiest processes.
+
+        Args:
+            n (int, optional): Rows to return. Defaults to 10.
+            metric (str, optional): Only this stream. Defaults to None (all).
+            by (str, optional): 'count' or 'max_value'. Defaults to 'count'.
+
+        Returns:
+            pd.DataFrame: Columns metric, pid, count, max_value, first_seen,
+            last_seen, sorted by ``by`` in descending order.
+        """
+        if by not in ('count', 'max_value'):
+            raise ValueError(f"Cannot rank by '{by}', expected 'count' or 'max_value'.")
+        with self._lock:
+            rows = [(m, pid, *stats) for (m, pid), stats in self._stats.items() if metric is None or m == metric]
+        df = pd.DataFrame(rows, columns=ROLLUP_COLUMNS)
+        return df.sort_values(by, ascending=False, kind='stable').head(n).reset_index(drop=True)
+
+    def save(self, path: str):
+        """Write the rollup as a JSON list of rows."""
+        with self._lock:
+            rows = [dict(zip(ROLLUP_COLUMNS, (m, pid, *stats))) for (m, pid), stats in self._stats.items()]
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=4)
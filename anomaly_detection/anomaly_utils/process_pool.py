@@ -0,0 +1,79 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+class StickyProcessPool:
+    """Process pool that runs every job of a key on the same worker process.
+
+    Each worker is a single-process ``ProcessPoolExecutor``. The first job of
+    a key assigns it to the worker with the fewest keys, later jobs of that
+    key always go to the same worker, so per-file caches (page cache, parsed
+    configuration, imported solvers) stay warm in one process.
+
+    ``submit`` blocks once ``max_pending`` jobs are queued or running, which
+    throttles the callers instead of growing the executors' queues when the
+    workers are saturated.
+
+    Args:
+        workers (int): Number of worker processes.
+        max_pending (int, optional): Jobs accepted before ``submit`` blocks.
+            Defaults to twice the number of workers.
+        mp_context (optional): multiprocessing context of the workers.
+            Defaults to ``spawn``, which is safe next to the threads of the
+            parent process.
+    """
+
+    def __init__(self, workers: int, max_pending: int = None, mp_context=None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        mp_context = mp_context or multiprocessing.get_context('spawn')
+        self._executors = [ProcessPoolExecutor(max_workers=1, mp_context=mp_context) for _ in range(workers)]
+        self._pending = threading.BoundedSemaphore(max_pending or 2 * workers)
+        self._lock = threading.Lock()
+        # key -> worker index, and number of keys per worker
+        self._slots = {}
+        self._load = [0] * workers
+
+    @property
+    def workers(self) -> int:
+        return len(self._executors)
+
+    def slot(self, key) -> int:
+        """Worker index of key, assigning the least loaded worker on first use."""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = min(range(len(self._load)), key=self._load.__getitem__)
+                self._slots[key] = slot
+                self._load[slot] += 1
+            return slot
+
+    def release(self, key):
+        """Forget the worker assignment of key, e.g. when its file is removed."""
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is not None:
+                self._load[slot] -= 1
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the worker of key.
+
+        Blocks while ``max_pending`` jobs are outstanding.
+
+        Returns:
+            concurrent.futures.Future: Result of the call.
+        """
+        self._pending.acquire()
+        try:
+            future = self._executors[self.slot(key)].submit(fn, *args, **kwargs)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        """Stop every worker process."""
+        for executor in self._executors:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
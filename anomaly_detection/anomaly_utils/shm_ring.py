@@ -0,0 +1,190 @@
+import mmap
+
+import numpy as np
+
+RING_MAGIC = b'NFSOPRNG'
+RING_VERSION = 1
+
+# File layout (little endian):
+#   header, 64 bytes
+#     0  magic        8 bytes, RING_MAGIC
+#     8  version      uint32
+#     12 record_size  uint32
+#     16 capacity     uint64, number of record slots
+#     24 head         uint64, records written so far (producer only)
+#     32 tail         uint64, records consumed so far (consumer only)
+#     40 dropped      uint64, records the producer dropped on a full ring
+#   capacity records of RECORD_DTYPE, record i is stored in slot i % capacity
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('record_size', '<u4'),
+    ('capacity', '<u8'),
+    ('head', '<u8'),
+    ('tail', '<u8'),
+    ('dropped', '<u8'),
+    ('reserved', '<u8', (2,)),
+])
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('latency', '<f8'),
+    ('pid', '<i8'),
+    ('xid', '<i8'),
+    ('op', 'S16'),
+])
+
+
+class ShmRing:
+    """Single-producer, single-consumer ring of op events in a memory-mapped file.
+
+    Replaces the CSV trace logs between the nfsdig op printer and the Python
+    detectors: the producer copies fixed-size records (timestamp, op, pid,
+    latency, xid) into the ring and then advances ``head``, the consumer reads
+    them as numpy structured views of the mapping and advances ``tail`` once
+    it is done with them. Each counter is written by one side only, so no
+    lock is needed. When the ring is full the producer drops the new records
+    and counts them in ``dropped`` instead of blocking the tracer.
+
+    Placing the file on a tmpfs such as ``/dev/shm`` keeps it in memory.
+
+    Args:
+        path (str): Ring file.
+        capacity (int, optional): Record slots of a new ring. When given, the
+            file is created (or reset); otherwise an existing ring is opened.
+            Defaults to None.
+    """
+
+    def __init__(self, path: str, capacity: int = None):
+        self.path = path
+        header_size = HEADER_DTYPE.itemsize
+        if capacity is not None:
+            if capacity < 1:
+                raise ValueError("capacity must be at least 1")
+            size = header_size + capacity * RECORD_DTYPE.itemsize
+            with open(path, 'wb') as f:
+                f.truncate(size)
+        self._file = open(path, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self._mmap)
+        if capacity is not None:
+            self._header['magic'] = RING_MAGIC
+            self._header['version'] = RING_VERSION
+            self._header['record_size'] = RECORD_DTYPE.itemsize
+            self._header['capacity'] = capacity
+        elif (self._header['magic'] != RING_MAGIC or self._header['version'] != RING_VERSION
+              or self._header['record_size'] != RECORD_DTYPE.itemsize):
+            self.close()
+            raise ValueError(f"{path} is not a version {RING_VERSION} op ring")
+        self.capacity = int(self._header['capacity'])
+        self._records = np.ndarray((self.capacity,), dtype=RECORD_DTYPE, buffer=self._mmap, offset=header_size)
+
+    @property
+    def head(self) -> int:
+        return int(self._header['head'])
+
+    @property
+    def tail(self) -> int:
+        return int(self._header['tail'])
+
+    @property
+    def dropped(self) -> int:
+        return int(self._header['dropped'])
+
+    def __len__(self) -> int:
+        """Records written but not consumed yet."""
+        return self.head - self.tail
+
+    @property
+    def free(self) -> int:
+        """Record slots the producer can fill without dropping."""
+        return self.capacity - len(self)
+
+    def write(self, records) -> int:
+        """Producer side: append records, dropping those that do not fit.
+
+        Args:
+            records: Structured array of RECORD_DTYPE, or anything
+                ``np.asarray(records, dtype=RECORD_DTYPE)`` accepts, e.g. a
+                list of (timestamp, latency, pid, xid, op) tuples.
+
+        Returns:
+            int: Number of records written.
+        """
+        records = np.asarray(records, dtype=RECORD_DTYPE).reshape(-1)
+        head = self.head
+        count = min(len(records), self.capacity - (head - self.tail))
+        if count < len(records):
+            self._header['dropped'] += len(records) - count
+        start = head % self.capacity
+        first = min(count, self.capacity - start)
+        self._records[start:start + first] = records[:first]
+        self._records[:count - first] = records[first:count]
+        # Publish the records only after they are in place
+        self._header['head'] = head + count
+        return count
+
+    def peek(self, max_records: int = None) -> np.ndarray:
+        """Consumer side: view of the oldest unconsumed records, without copying.
+
+        The view is contiguous, so it stops at the end of the mapping; the
+        records after the wrap-around are returned by the next call. It stays
+        valid until those records are released with ``advance``.
+
+        Args:
+            max_records (int, optional): Return at most this many records.
+                Defaults to None.
+
+        Returns:
+            np.ndarray: Structured view of RECORD_DTYPE, empty when the ring
+            is empty.
+        """
+        tail = self.tail
+        available = self.head - tail
+        start = tail % self.capacity
+        count = min(available, self.capacity - start)
+        if max_records is not None:
+            count = min(count, max_records)
+        return self._records[start:start + count]
+
+    def advance(self, count: int):
+        """Consumer side: release the count oldest records to the producer."""
+        if count < 0 or count > len(self):
+            raise ValueError(f"cannot advance the ring by {count} records")
+        self._header['tail'] = self.tail + count
+
+    def read(self, max_records: int = None) -> np.ndarray:
+        """Consumer side: copy out and release every pending record (in order).
+
+        Args:
+            max_records (int, optional): Read at most this many records.
+                Defaults to None.
+
+        Returns:
+            np.ndarray: Structured array of RECORD_DTYPE.
+        """
+        parts = []
+        remaining = len(self) if max_records is None else min(max_records, len(self))
+        while remaining > 0:
+            view = self.peek(remaining)
+            parts.append(view.copy())
+            self.advance(len(view))
+            remaining -= len(view)
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def close(self):
+        """Unmap the ring file."""
+        self._header = None
+        self._records = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views returned by peek/read are still alive, unmapped once they are freed
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,26 +1,120 @@
+import os
 from typing import Generator
 
 import numpy as np
 
+# Bytes parsed per CSVTailer.read when streaming a CSV file
+TAILER_READ_BYTES = 16 * 1024 * 1024
+
 
 class StreamGenerator:
     """Load static dataset and generate observation once a time.
 
+    Besides an in-memory array the dataset can be a memory-mapped binary file
+    (``from_memmap``) or the rows appended to a CSV file (``from_tailer``).
+    ``iter_batch`` yields contiguous blocks of at most ``chunk_size`` rows for
+    detectors with a vectorized path; only one block (or one CSV read) is
+    materialized at a time, so replaying multi-GB traces keeps memory bounded.
+
     Args:
-        X (np.ndarray): Origin static dataset.
+        X (np.ndarray): Origin static dataset, possibly a ``np.memmap``.
+        chunk_size (int, optional): Rows per block of ``iter_batch``.
+            Defaults to 4096.
 
     Raises:
         TypeError: Unexpected input data type.
     """
 
     def __init__(
-        self, X: np.ndarray,
+        self, X: np.ndarray, chunk_size: int = 4096,
     ):
 
         if isinstance(X, np.ndarray):
             self.X = X
         else:
             raise TypeError("Unexpected input data type, except np.ndarray.")
+        self.chunk_size = chunk_size
+        self._tailer = None
+
+    @classmethod
+    def from_memmap(cls, path: str, dtype=np.float64, n_features: int = 1, offset: int = 0,
+                    chunk_size: int = 4096) -> "StreamGenerator":
+        """Stream a raw binary file of row-major observations without loading it.
+
+        Args:
+            path (str): Binary file, e.g. written with ``ndarray.tofile``.
+            dtype (optional): Element type of the file. Defaults to float64.
+            n_features (int, optional): Values per observation. Defaults to 1.
+            offset (int, optional): Bytes to skip at the start of the file.
+                Defaults to 0.
+            chunk_size (int, optional): Rows per block. Defaults to 4096.
+
+        Returns:
+            StreamGenerator: Generator over an (n, n_features) memmap.
+        """
+        dtype = np.dtype(dtype)
+        n = (os.path.getsize(path) - offset) // (dtype.itemsize * n_features)
+        if n <= 0:
+            return cls(np.empty((0, n_features), dtype=dtype), chunk_size)
+        X = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n, n_features))
+        return cls(X, chunk_size)
+
+    @classmethod
+    def from_tailer(cls, tailer, path: str, columns: list = None, skip_rows: int = 0,
+                    chunk_size: int = 4096, read_bytes: int = TAILER_READ_BYTES,
+                    records: bool = False) -> "StreamGenerator":
+        """Stream the rows of a CSV file that the tailer has not returned yet.
+
+        Iteration parses at most ``read_bytes`` at a time and stops at the
+        current end of the file; iterating again later continues with the rows
+        appended in the meantime.
+
+        Args:
+            tailer (CSVTailer): Reader keeping the byte offset of path.
+            path (str): CSV file with a header line.
+            columns (list, optional): Columns to stream. Defaults to None
+                (every column).
+            skip_rows (int, optional): Data rows to skip when the tailer has
+                not seen the file before. Defaults to 0.
+            chunk_size (int, optional): Rows per block. Defaults to 4096.
+            read_bytes (int, optional): Bytes parsed per read. Defaults to
+                16 MiB.
+            records (bool, optional): Yield structured arrays with one field
+                per column, keeping every column's dtype, instead of a 2-D
+                array of a common dtype. Defaults to False.
+
+        Returns:
+            StreamGenerator: Generator over the appended rows.
+        """
+        stream = cls(np.empty((0, len(columns) if columns else 0)), chunk_size)
+        stream._tailer = (tailer, path, columns, skip_rows, read_bytes, records)
+        return stream
+
+    def _tailer_frames(self) -> Generator:
+        tailer, path, columns, skip_rows, read_bytes, records = self._tailer
+        while True:
+            df = tailer.read(path, skip_rows=skip_rows, max_bytes=read_bytes)
+            if not df.empty:
+                df = df[columns] if columns else df
+                yield df.to_records(index=False) if records else df.to_numpy()
+            elif tailer.pending_bytes(path) == 0:
+                return
+
+    def iter_batch(self, chunk_size: int = None) -> Generator:
+        """Iterate contiguous blocks of observations from the dataset.
+
+        Args:
+            chunk_size (int, optional): Rows per block. Defaults to
+                ``self.chunk_size``.
+
+        Yields:
+            Generator: Blocks of at most chunk_size observations, in order.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        sources = self._tailer_frames() if self._tailer is not None else [self.X]
+        for data in sources:
+            for start in range(0, len(data), chunk_size):
+                yield np.ascontiguousarray(data[start:start + chunk_size])
 
     def iter_item(self) -> Generator:
         """Iterate item once a time from the dataset.
@@ -29,5 +123,5 @@ class StreamGenerator:
             Generator: One observation from the dataset.
         """
 
-        for i in range(len(self.X)):
-            yield self.X[i]
\ No newline at end of file
+        for block in self.iter_batch():
+            yield from block
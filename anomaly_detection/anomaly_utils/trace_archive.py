@@ -0,0 +1,349 @@
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+ARCHIVE_VERSION = 1
+META_FILE = 'meta.json'
+ARCHIVE_SUFFIX = '.trace'
+
+
+def is_archive(path: str) -> bool:
+    """Whether path is a trace archive directory."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def _parse_times(values: pd.Series) -> np.ndarray:
+    """Text timestamps like 'YYYY-MM-DD HH:MM:SS' as naive datetime64[ns].
+
+    Raises:
+        ValueError: A value is empty or not a timestamp.
+    """
+    times = pd.to_datetime(values)
+    if getattr(times.dt, 'tz', None) is not None:
+        times = times.dt.tz_convert(None)
+    times = times.to_numpy().astype('datetime64[ns]')
+    if np.isnat(times).any():
+        raise ValueError(f"Time column '{values.name}' has empty timestamps.")
+    return times
+
+
+def _time_bound(value) -> int:
+    # Bounds on a datetime time column may be strings, datetimes or ns integers
+    return pd.Timestamp(value).value
+
+
+def _column_file(name: str) -> str:
+    # Column names like 'Latency(us)' are kept readable but made path safe
+    safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+    return f"col-{safe}.bin"
+
+
+class TraceArchiveWriter:
+    """Write a table into a columnar binary trace archive.
+
+    An archive is a directory with one binary file per column and a
+    ``meta.json`` describing it. Every column keeps its numpy dtype; text
+    columns (op names, paths, ...) are dictionary encoded as int32 codes.
+    A text time column is parsed into datetime64[ns] instead, so it stays
+    ordered and can be compared with the query bounds.
+    Rows are written in chunks of ``chunk_rows``; the index in ``meta.json``
+    records the row range and, when ``time_column`` is set, the time range of
+    every chunk, so a reader only touches the chunks overlapping a query.
+    Without compression the column files are plain arrays that
+    ``TraceArchive`` maps with ``np.memmap``; with ``compression='zlib'``
+    every chunk of every column is compressed separately.
+
+    Args:
+        path (str): Archive directory, created (existing archive files are
+            replaced).
+        time_column (str, optional): Column indexed for time range queries.
+            Defaults to None.
+        chunk_rows (int, optional): Rows per chunk. Defaults to 65536.
+        compression (str, optional): None or 'zlib'. Defaults to None.
+
+    Raises:
+        ValueError: Unknown compression, or a time column that is neither
+            numeric nor timestamps.
+    """
+
+    def __init__(self, path: str, time_column: str = None, chunk_rows: int = 65536, compression: str = None):
+        if compression not in (None, 'zlib'):
+            raise ValueError(f"Unknown compression '{compression}', expected None or 'zlib'.")
+        self.path = path
+        self.time_column = time_column
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        os.makedirs(path, exist_ok=True)
+        self._meta = None
+        self._files = {}
+        self._categories = {}
+        self._pending = []
+        self._pending_rows = 0
+
+    def _init_columns(self, df: pd.DataFrame):
+        columns = []
+        for name in df.columns:
+            name = str(name)
+            dtype = df[name].dtype
+            if name == self.time_column and dtype.kind not in 'biufM':
+                dtype = np.dtype('datetime64[ns]')
+            if dtype.kind in 'biuf':
+                column = {'name': name, 'dtype': dtype.str}
+            elif dtype.kind == 'M':
+                column = {'name': name, 'dtype': np.dtype('datetime64[ns]').str}
+            else:
+                column = {'name': name, 'dtype': np.dtype(np.int32).str, 'categories': []}
+                self._categories[name] = {}
+            columns.append(column)
+            self._files[name] = open(os.path.join(self.path, _column_file(name)), 'wb')
+        if self.time_column is not None and self.time_column not in self._files:
+            raise ValueError(f"Time column '{self.time_column}' is not a column of the data.")
+        self._meta = {
+            'version': ARCHIVE_VERSION,
+            'columns': columns,
+            'time_column': self.time_column,
+            'compression': self.compression,
+            'rows': 0,
+            'chunks': [],
+        }
+
+    def _encode(self, column: dict, values: pd.Series) -> np.ndarray:
+        if 'categories' not in column:
+            if np.dtype(column['dtype']).kind == 'M':
+                return _parse_times(values)
+            if not np.can_cast(values.dtype, column['dtype'], casting='same_kind'):
+                raise ValueError(f"Column '{column['name']}' changed from {np.dtype(column['dtype'])} to "
+                                 f"{values.dtype}; give it an explicit dtype.")
+            return values.to_numpy().astype(column['dtype'], copy=False)
+        codes = self._categories[column['name']]
+        encoded = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values.astype(str).tolist()):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(column['categories'])
+                column['categories'].append(value)
+            encoded[i] = code
+        return encoded
+
+    def append(self, df: pd.DataFrame):
+        """Add rows; full chunks are written immediately, the rest on close()."""
+        if self._meta is None:
+            self._init_columns(df)
+        if df.empty:
+            return
+        self._pending.append(df)
+        self._pending_rows += len(df)
+        if self._pending_rows >= self.chunk_rows:
+            data = pd.concat(self._pending, ignore_index=True)
+            full = len(data) - len(data) % self.chunk_rows
+            for start in range(0, full, self.chunk_rows):
+                self._write_chunk(data.iloc[start:start + self.chunk_rows])
+            self._pending = [data.iloc[full:]] if full < len(data) else []
+            self._pending_rows = len(data) - full
+
+    def _write_chunk(self, df: pd.DataFrame):
+        chunk = {'start': self._meta['rows'], 'rows': len(df)}
+        encoded = {column['name']: self._encode(column, df[column['name']]) for column in self._meta['columns']}
+        if self.time_column is not None:
+            times = encoded[self.time_column]
+            if times.dtype.kind == 'M':
+                # Datetime chunk bounds are kept as ns since the epoch
+                times = times.view(np.int64)
+            chunk['t0'] = times.min().item()
+            chunk['t1'] = times.max().item()
+        if self.compression:
+            chunk['offsets'] = {}
+        for column in self._meta['columns']:
+            data = encoded[column['name']].tobytes()
+            f = self._files[column['name']]
+            if self.compression:
+                data = zlib.compress(data)
+                chunk['offsets'][column['name']] = [f.tell(), len(data)]
+            f.write(data)
+        self._meta['chunks'].append(chunk)
+        self._meta['rows'] += len(df)
+
+    def close(self):
+        """Write the remaining rows and the metadata."""
+        if self._meta is None:
+            return
+        if self._pending_rows:
+            self._write_chunk(pd.concat(self._pending, ignore_index=True))
+        self._pending = []
+        self._pending_rows = 0
+        for f in self._files.values():
+            f.close()
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceArchive:
+    """Read a trace archive written by ``TraceArchiveWriter``.
+
+    Only the requested columns are opened and only the chunks overlapping the
+    requested time range are read. Uncompressed columns are memory mapped, so
+    reading a slice copies just that slice and no text is parsed.
+
+    Args:
+        path (str): Archive directory.
+
+    Raises:
+        ValueError: path is not a trace archive of a supported version.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(os.path.join(path, META_FILE), 'r') as f:
+                self.meta = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"{path} is not a trace archive: {e}")
+        if self.meta.get('version') != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported trace archive version {self.meta.get('version')} in {path}.")
+        self._columns = {column['name']: column for column in self.meta['columns']}
+        self._maps = {}
+
+    @property
+    def columns(self) -> list:
+        return [column['name'] for column in self.meta['columns']]
+
+    def __len__(self) -> int:
+        return self.meta['rows']
+
+    def _memmap(self, name: str) -> np.ndarray:
+        data = self._maps.get(name)
+        if data is None:
+            column = self._columns[name]
+            if self.meta['rows'] == 0:
+                data = np.empty(0, dtype=column['dtype'])
+            else:
+                data = np.memmap(os.path.join(self.path, _column_file(name)), dtype=column['dtype'], mode='r',
+                                 shape=(self.meta['rows'],))
+            self._maps[name] = data
+        return data
+
+    def _chunk_values(self, name: str, chunk: dict) -> np.ndarray:
+        column = self._columns[name]
+        if self.meta['compression'] is None:
+            return self._memmap(name)[chunk['start']:chunk['start'] + chunk['rows']]
+        offset, size = chunk['offsets'][name]
+        with open(os.path.join(self.path, _column_file(name)), 'rb') as f:
+            f.seek(offset)
+            data = zlib.decompress(f.read(size))
+        return np.frombuffer(data, dtype=column['dtype'])
+
+    def read_arrays(self, columns: list = None, t0=None, t1=None) -> dict:
+        """Raw column arrays of the rows with t0 <= time <= t1.
+
+        Args:
+            columns (list, optional): Columns to read. Defaults to None (all).
+            t0 (optional): Earliest time (inclusive), needs a time column.
+                For a datetime time column anything ``pd.Timestamp``
+                accepts, e.g. '2024-01-01 12:00:00'.
+            t1 (optional): Latest time (inclusive), needs a time column.
+
+        Returns:
+            dict: Column name -> np.ndarray. Text columns hold int32 codes
+            into ``categories(name)``.
+        """
+        columns = self.columns if columns is None else list(columns)
+        for name in columns:
+            if name not in self._columns:
+                raise KeyError(f"Unknown column '{name}'.")
+        time_column = self.meta['time_column']
+        filtered = t0 is not None or t1 is not None
+        if filtered and time_column is None:
+            raise ValueError("The archive has no time column to filter on.")
+        datetimes = filtered and np.dtype(self._columns[time_column]['dtype']).kind == 'M'
+        if datetimes:
+            t0 = None if t0 is None else _time_bound(t0)
+            t1 = None if t1 is None else _time_bound(t1)
+
+        chunks = [chunk for chunk in self.meta['chunks']
+                  if (t0 is None or chunk['t1'] >= t0) and (t1 is None or chunk['t0'] <= t1)]
+        parts = {name: [] for name in columns}
+        for chunk in chunks:
+            mask = None
+            if filtered:
+                times = self._chunk_values(time_column, chunk)
+                if datetimes:
+                    times = times.view(np.int64)
+                mask = np.ones(len(times), dtype=bool)
+                if t0 is not None:
+                    mask &= times >= t0
+                if t1 is not None:
+                    mask &= times <= t1
+            for name in columns:
+                values = self._chunk_values(name, chunk)
+                parts[name].append(values[mask] if mask is not None else values)
+
+        result = {}
+        for name in columns:
+            if len(parts[name]) == 1:
+                result[name] = np.asarray(parts[name][0])
+            elif parts[name]:
+                result[name] = np.concatenate(parts[name])
+            else:
+                result[name] = np.empty(0, dtype=self._columns[name]['dtype'])
+        return result
+
+    def categories(self, name: str) -> list:
+        """Values of a dictionary encoded text column, indexed by code."""
+        return self._columns[name].get('categories')
+
+    def read(self, columns: list = None, t0=None, t1=None) -> pd.DataFrame:
+        """Rows with t0 <= time <= t1 as a DataFrame, see ``read_arrays``."""
+        arrays = self.read_arrays(columns, t0, t1)
+        for name, values in arrays.items():
+            categories = self.categories(name)
+            if categories is not None:
+                arrays[name] = np.array(categories, dtype=object)[values] if len(values) else values.astype(object)
+        return pd.DataFrame(arrays, columns=list(arrays))
+
+    def close(self):
+        """Drop the column mappings."""
+        self._maps.clear()
+
+
+def convert_csv(csv_path: str, archive_path: str = None, time_column: str = None, chunk_rows: int = 65536,
+                compression: str = None, **read_csv_kwargs) -> str:
+    """Convert a CSV trace file into a trace archive, reading it chunk by chunk.
+
+    Args:
+        csv_path (str): CSV file with a header line.
+        archive_path (str, optional): Archive directory. Defaults to the CSV
+            path with the suffix ``.trace``.
+        time_column (str, optional): Column indexed for time range queries.
+            Defaults to None.
+        chunk_rows (int, optional): Rows per chunk. Defaults to 65536.
+        compression (str, optional): None or 'zlib'. Defaults to None.
+        **read_csv_kwargs: Passed to ``pd.read_csv``, e.g. ``dtype`` for
+            columns whose inferred type differs between chunks.
+
+    Returns:
+        str: Path of the archive.
+    """
+    if archive_path is None:
+        archive_path = os.path.splitext(csv_path)[0] + ARCHIVE_SUFFIX
+    with TraceArchiveWriter(archive_path, time_column, chunk_rows, compression) as writer:
+        for df in pd.read_csv(csv_path, chunksize=chunk_rows, **read_csv_kwargs):
+            writer.append(df)
+    return archive_path
+
+
+def read_table(path: str, **read_csv_kwargs) -> pd.DataFrame:
+    """Load a trace table from a trace archive or, otherwise, a CSV file."""
+    if is_archive(path):
+        return TraceArchive(path).read()
+    return pd.read_csv(path, **read_csv_kwargs)
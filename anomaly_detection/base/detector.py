@@ -4,6 +4,14 @@ import numpy as np
 from collections import deque
 
 
+def _pack_deque(values: deque) -> dict:
+    """Store a deque of numbers (or of equally sized rows) as one array."""
+    packed = np.asarray(values) if len(values) else np.empty(0)
+    if packed.dtype == object:
+        packed = list(values)
+    return {"__deque__": True, "maxlen": values.maxlen, "values": packed}
+
+
 class BaseDetector(ABC):
     """Abstract class for Detector, supporting for customize detector."""
 
@@ -62,6 +70,33 @@ class BaseDetector(ABC):
 
         return X - np.mean(self.detrend_window, axis=0)
 
+    def __getstate__(self) -> dict:
+        """Compact picklable state of the detector.
+
+        Deques of observations are stored as a single array plus their
+        ``maxlen`` instead of one pickled object per element.
+
+        Returns:
+            dict: State restored by ``__setstate__``.
+        """
+        state = self.__dict__.copy()
+        for key, value in state.items():
+            if isinstance(value, deque):
+                state[key] = _pack_deque(value)
+        return state
+
+    def __setstate__(self, state: dict):
+        """Restore a state produced by ``__getstate__``.
+
+        Args:
+            state (dict): Detector state.
+        """
+        state = dict(state)
+        for key, value in state.items():
+            if isinstance(value, dict) and value.get("__deque__"):
+                state[key] = deque(value["values"], maxlen=value["maxlen"])
+        self.__dict__.update(state)
+
     @abstractmethod
     def fit(self, X: np.ndarray, timestamp: int = None):
         return NotImplementedError
@@ -0,0 +1,197 @@
+import math
+
+import numpy as np
+
+
+class RollingMoments:
+    """Mean and standard deviation of a sliding window in constant time.
+
+    Values are kept in a ring buffer while a running sum and sum of squares
+    are updated with the value entering and the value leaving the window.
+    The sums are taken around a shift close to the data, and every
+    ``reanchor_every`` pushes they are recomputed exactly (``math.fsum``)
+    around the current mean, so rounding errors cannot accumulate.
+
+    ``push_many`` performs the same floating point operations as repeated
+    ``push`` calls, so batch and streaming callers get identical results.
+    """
+
+    def __init__(self, window_len: int, ddof: int = 0, reanchor_every: int = None):
+        """Initialize an empty window.
+
+        Args:
+            window_len (int): Maximum number of values in the window.
+            ddof (int, optional): Delta degrees of freedom of the variance.
+                Defaults to 0.
+            reanchor_every (int, optional): Pushes between exact
+                recomputations of the sums. Defaults to max(1024, 4 * window_len).
+        """
+        if window_len < 1:
+            raise ValueError("window_len must be positive")
+        self.window_len = int(window_len)
+        self.ddof = ddof
+        self._reanchor_option = reanchor_every
+        self.reanchor_every = reanchor_every or max(1024, 4 * self.window_len)
+        self.clear()
+
+    def clear(self):
+        """Drop every value from the window."""
+        self._buffer = np.zeros(self.window_len)
+        self._head = 0  # Slot of the oldest value
+        self._count = 0
+        self._shift = 0.0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._since_anchor = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def values(self) -> np.ndarray:
+        """Values of the window, oldest first."""
+        index = (self._head + np.arange(self._count)) % self.window_len
+        return self._buffer[index]
+
+    def _reanchor(self):
+        values = self.values()
+        self._shift = float(values[-1]) if self._count == 1 else self._shift + self._sum / self._count
+        shifted = (values - self._shift).tolist()
+        self._sum = math.fsum(shifted)
+        self._sum_sq = math.fsum(y * y for y in shifted)
+        self._since_anchor = 0
+
+    def __getstate__(self) -> dict:
+        """Only the occupied part of the ring buffer is stored, oldest first."""
+        state = self.__dict__.copy()
+        state['_buffer'] = self.values()
+        state['_head'] = 0
+        return state
+
+    def __setstate__(self, state: dict):
+        values = state['_buffer']
+        self.__dict__.update(state)
+        self._buffer = np.zeros(self.window_len)
+        self._buffer[:len(values)] = values
+
+    def push(self, value: float):
+        """Add a value, evicting the oldest one once the window is full.
+
+        Args:
+            value (float): New observation.
+        """
+        value = float(value)
+        if self._count == 0:
+            self._shift = value
+        y_new = value - self._shift
+        if self._count == self.window_len:
+            y_old = self._buffer[self._head] - self._shift
+            self._buffer[self._head] = value
+            self._head = (self._head + 1) % self.window_len
+        else:
+            y_old = 0.0
+            self._buffer[(self._head + self._count) % self.window_len] = value
+            self._count += 1
+        self._sum = self._sum + (y_new - y_old)
+        self._sum_sq = self._sum_sq + (y_new * y_new - y_old * y_old)
+        self._since_anchor += 1
+        if self._since_anchor >= self.reanchor_every:
+            self._reanchor()
+
+    def _moments(self, total, total_sq, count):
+        mean = self._shift + total / count
+        dof = count - self.ddof
+        if np.ndim(count) == 0:
+            if dof <= 0:
+                return mean, 0.0
+            var = (total_sq - total * total / count) / dof
+            return mean, math.sqrt(var) if var > 0 else 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = (total_sq - total * total / count) / dof
+        var[(dof <= 0) | ~(var > 0)] = 0.0
+        return mean, np.sqrt(var)
+
+    def mean(self) -> float:
+        """Mean of the window (0.0 when empty)."""
+        if self._count == 0:
+            return 0.0
+        return self._moments(self._sum, self._sum_sq, self._count)[0]
+
+    def std(self) -> float:
+        """Standard deviation of the window (0.0 when undefined)."""
+        if self._count == 0:
+            return 0.0
+        return self._moments(self._sum, self._sum_sq, self._count)[1]
+
+    def push_many(self, values: np.ndarray):
+        """Push a sequence of values.
+
+        Args:
+            values (np.ndarray): New observations, oldest first.
+
+        Returns:
+            tuple: (means, stds), the window mean and standard deviation after
+            each push, bit-identical to calling ``push``, ``mean`` and ``std``
+            for every value.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        means = np.empty(len(values))
+        stds = np.empty(len(values))
+        start = 0
+        while start < len(values):
+            if self._count == 0:
+                self.push(values[start])
+                means[start], stds[start] = self.mean(), self.std()
+                start += 1
+                continue
+            # Up to the next re-anchoring the shift stays fixed
+            stop = min(len(values), start + self.reanchor_every - self._since_anchor)
+            means[start:stop], stds[start:stop] = self._push_segment(values[start:stop])
+            if self._since_anchor == 0:
+                # The last push re-anchored the sums
+                means[stop - 1], stds[stop - 1] = self.mean(), self.std()
+            start = stop
+        return means, stds
+
+    def _push_segment(self, chunk: np.ndarray):
+        m = len(chunk)
+        window = self.values()
+        extended = np.concatenate([window, chunk])
+        steps = np.arange(m)
+        # Position in extended of the value evicted by each push, -1 for none
+        evicted = len(window) + steps - self.window_len
+        y_new = chunk - self._shift
+        y_old = np.zeros(m)
+        full = evicted >= 0
+        y_old[full] = extended[evicted[full]] - self._shift
+        # Sequential accumulation, same rounding as the scalar updates
+        sums = np.add.accumulate(np.concatenate([[self._sum], y_new - y_old]))[1:]
+        sums_sq = np.add.accumulate(np.concatenate([[self._sum_sq], y_new * y_new - y_old * y_old]))[1:]
+        counts = np.minimum(len(window) + steps + 1, self.window_len)
+        means, stds = self._moments(sums, sums_sq, counts)
+
+        tail = extended[-self.window_len:]
+        self._buffer[:len(tail)] = tail
+        self._head = 0
+        self._count = len(tail)
+        self._sum = float(sums[-1])
+        self._sum_sq = float(sums_sq[-1])
+        self._since_anchor += m
+        if self._since_anchor >= self.reanchor_every:
+            self._reanchor()
+        return means, stds
+
+    def resize(self, window_len: int):
+        """Change the window length, keeping the newest values.
+
+        Args:
+            window_len (int): New maximum number of values.
+        """
+        values = self.values()[-window_len:]
+        self.window_len = int(window_len)
+        self.reanchor_every = self._reanchor_option or max(1024, 4 * self.window_len)
+        self.clear()
+        if len(values):
+            self._buffer[:len(values)] = values
+            self._count = len(values)
+            self._shift = float(values[-1])
+            self._reanchor()
@@ -0,0 +1,7 @@
+"""
+检测器吞吐、延迟与准确率基准测试
+"""
+
+from .streams import Stream, make_stream, SCENARIOS
+
+__all__ = ['Stream', 'make_stream', 'SCENARIOS']
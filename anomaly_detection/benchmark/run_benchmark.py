@@ -0,0 +1,71 @@
+import argparse
+import sys
+
+import pandas as pd
+
+from benchmark.streams import SCENARIOS
+from benchmark.runner import DETECTORS, RESULT_COLUMNS, run_suite, save_baseline, load_baseline, compare
+
+DEFAULT_BASELINE = "anomaly_detection/benchmark/baselines/baseline.json"
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the anomaly detectors on synthetic NFS op latency streams: points/s, p50/p99 "
+                    "per-point latency, peak RSS and F1, compared against a JSON baseline.")
+    parser.add_argument("--detectors", nargs="+", choices=list(DETECTORS), default=list(DETECTORS),
+                        help="Detectors to run (default: all).")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="Synthetic streams to run them on (default: all).")
+    parser.add_argument("--points", type=int, default=10000, help="Points per stream.")
+    parser.add_argument("--jumpstarter_points", type=int, default=2880,
+                        help="Points per stream for jumpstarter, which is much slower than the others.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic streams.")
+    parser.add_argument("--chunk_size", type=int, default=4096,
+                        help="Points per call for the batch, bank and jumpstarter detectors.")
+    parser.add_argument("--no_isolate", action="store_true",
+                        help="Run every case in this process (peak RSS then accumulates over the cases).")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="Baseline JSON to compare against, when it exists.")
+    parser.add_argument("--save_baseline", action="store_true",
+                        help="Write the results to --baseline after the comparison.")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative throughput / p99 change reported as a regression.")
+    args = parser.parse_args()
+
+    point_limits = {'jumpstarter': args.jumpstarter_points, 'jumpstarter/incremental': args.jumpstarter_points}
+    results = run_suite(args.detectors, args.scenarios, args.points, args.seed, args.chunk_size,
+                        point_limits=point_limits, isolate=not args.no_isolate)
+
+    table = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.float_format', '{:.3f}'.format):
+        print(table.drop(columns=['error']).to_string(index=False))
+    for result in results:
+        if result['error']:
+            print(f"{result['detector']} on {result['scenario']} failed: {result['error']}")
+
+    meta = dict(points=args.points, jumpstarter_points=args.jumpstarter_points, seed=args.seed,
+                chunk_size=args.chunk_size, isolate=not args.no_isolate)
+    if args.output:
+        save_baseline(results, args.output, **meta)
+
+    regressions = []
+    try:
+        baseline = load_baseline(args.baseline)
+    except FileNotFoundError:
+        print(f"No baseline at '{args.baseline}', run with --save_baseline to create it.")
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"Compared with baseline '{args.baseline}' ({baseline['meta'].get('created')}): "
+              f"{len(regressions)} regressions.")
+        for regression in regressions:
+            print(f"  {regression}")
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline, **meta)
+        print(f"Baseline saved to '{args.baseline}'.")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from benchmark.streams import make_stream
+from detector.utils.metrics import evaluate_result
+from model import SpotDetector, ThreeSigmaDetector, EWMAControlThreeSigmaDetector, KNNDetector, EWMADetectorBank
+from scripts.nfs_op_polling_detector import EWMA_PARAMS
+
+# Detector name -> (how it is driven, factory)
+DETECTORS = {
+    'SpotDetector': ('item', SpotDetector),
+    'ThreeSigmaDetector': ('item', ThreeSigmaDetector),
+    'KNNDetector': ('item', KNNDetector),
+    'EWMAControlThreeSigmaDetector': ('item', lambda: EWMAControlThreeSigmaDetector(**EWMA_PARAMS)),
+    'EWMAControlThreeSigmaDetector/batch': ('batch', lambda: EWMAControlThreeSigmaDetector(**EWMA_PARAMS)),
+    'EWMADetectorBank': ('bank', EWMADetectorBank),
+    'jumpstarter': ('jumpstarter', False),
+    'jumpstarter/incremental': ('jumpstarter', True),
+}
+
+RESULT_COLUMNS = ['detector', 'scenario', 'points', 'seconds', 'points_per_sec', 'p50_us', 'p99_us',
+                  'peak_rss_mb', 'rss_growth_mb', 'precision', 'recall', 'f1', 'false_positive_rate', 'error']
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+def _run_item(detector, values: np.ndarray):
+    labels = np.zeros(len(values), dtype=int)
+    latencies = np.zeros(len(values), dtype=np.int64)
+    for i, x in enumerate(values.reshape(-1, 1)):
+        start = time.perf_counter_ns()
+        score = detector.fit_score(x)
+        # Scores are None while a detector warms up
+        labels[i] = detector.predict(score) if score is not None else 0
+        latencies[i] = time.perf_counter_ns() - start
+    return labels, latencies
+
+
+def _run_blocks(step, values: np.ndarray, chunk_size: int):
+    # Batch paths only have a per-block latency, spread evenly over its points
+    labels, latencies = [], []
+    for start in range(0, len(values), chunk_size):
+        block = values[start:start + chunk_size]
+        began = time.perf_counter_ns()
+        labels.append(np.asarray(step(block), dtype=int))
+        latencies.append(np.full(len(block), (time.perf_counter_ns() - began) // len(block)))
+    return np.concatenate(labels), np.concatenate(latencies)
+
+
+def _run_jumpstarter(stream, chunk_size: int, incremental: bool = False):
+    from detector.detect import detect_records
+
+    labels, latencies = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, f"{stream.name}.csv")
+        rows = 0
+        for start in range(0, len(stream), chunk_size):
+            block = pd.DataFrame({'Timestamp': stream.timestamps[start:start + chunk_size],
+                                  'latency': stream.values[start:start + chunk_size]})
+            block.to_csv(data_path, mode='a', header=start == 0, index=False)
+            began = time.perf_counter_ns()
+            rows, records = detect_records(data_path, stream.name, last_line=rows, incremental=incremental)
+            elapsed = time.perf_counter_ns() - began
+            anomalous = {int(record.timestamp) for record in records}
+            labels.append(np.isin(block['Timestamp'].to_numpy(), list(anomalous)).astype(int))
+            latencies.append(np.full(len(block), elapsed // len(block)))
+    return np.concatenate(labels), np.concatenate(latencies)
+
+
+def evaluate(pred: np.ndarray, labels: np.ndarray) -> dict:
+    """Detection quality of pred against the injected labels.
+
+    Precision, recall and F1 are point adjusted like
+    ``detector.utils.metrics.evaluate_result`` (detecting any point of an
+    anomalous segment counts as detecting the whole segment) and None for a
+    stream without anomalies; the false positive rate is always reported.
+    """
+    normal = labels == 0
+    result = {
+        'precision': None, 'recall': None, 'f1': None,
+        'false_positive_rate': float(pred[normal].mean()) if normal.any() else None,
+    }
+    if labels.any():
+        precision, recall, f1 = evaluate_result(pred, labels)
+        result.update(precision=float(precision), recall=float(recall), f1=float(f1))
+    return result
+
+
+def run_case(detector_name: str, scenario: str, points: int, seed: int = 42, chunk_size: int = 4096) -> dict:
+    """Run one detector over one synthetic stream and measure it.
+
+    Args:
+        detector_name (str): Key of DETECTORS.
+        scenario (str): Scenario of the stream, see ``make_stream``.
+        points (int): Length of the stream.
+        seed (int, optional): Seed of the stream. Defaults to 42.
+        chunk_size (int, optional): Points per call for the batch, bank and
+            jumpstarter detectors. Defaults to 4096.
+
+    Returns:
+        dict: One row with the RESULT_COLUMNS; ``error`` holds the exception
+        message when the detector failed, the measurements are then None.
+    """
+    mode, factory = DETECTORS[detector_name]
+    stream = make_stream(scenario, points, seed)
+    values = np.asarray(stream.values, dtype=float)
+    result = dict.fromkeys(RESULT_COLUMNS)
+    result.update(detector=detector_name, scenario=scenario, points=len(stream))
+    rss_before = _peak_rss_mb()
+
+    began = time.perf_counter()
+    try:
+        # Detectors print progress and anomalies, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            if mode == 'item':
+                pred, latencies = _run_item(factory(), values)
+            elif mode == 'batch':
+                detector = factory()
+                pred, latencies = _run_blocks(lambda block: detector.fit_score_batch(block)[1], values, chunk_size)
+            elif mode == 'bank':
+                bank = factory()
+                bank.register(stream.name, **EWMA_PARAMS)
+                pred, latencies = _run_blocks(lambda block: bank.step({stream.name: block})[stream.name][1],
+                                              values, chunk_size)
+            else:
+                pred, latencies = _run_jumpstarter(stream, chunk_size, incremental=factory)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+    seconds = time.perf_counter() - began
+    rss_after = _peak_rss_mb()
+
+    result.update(
+        seconds=seconds,
+        points_per_sec=len(stream) / seconds,
+        p50_us=float(np.percentile(latencies, 50)) / 1000,
+        p99_us=float(np.percentile(latencies, 99)) / 1000,
+        peak_rss_mb=rss_after,
+        rss_growth_mb=rss_after - rss_before,
+    )
+    result.update(evaluate(pred, stream.labels))
+    return result
+
+
+def run_suite(detectors: list, scenarios: list, points: int, seed: int = 42, chunk_size: int = 4096,
+              point_limits: dict = None, isolate: bool = True) -> list:
+    """Run every detector over every scenario.
+
+    Args:
+        detectors (list): Keys of DETECTORS.
+        scenarios (list): Scenarios, see ``make_stream``.
+        points (int): Length of every stream.
+        seed (int, optional): Seed of the streams. Defaults to 42.
+        chunk_size (int, optional): See ``run_case``. Defaults to 4096.
+        point_limits (dict, optional): Detector -> shorter stream length, for
+            the slow detectors. Defaults to None.
+        isolate (bool, optional): Run every case in a fresh process so the
+            peak RSS belongs to that case alone. Defaults to True.
+
+    Returns:
+        list: One result dict per (detector, scenario).
+    """
+    point_limits = point_limits or {}
+    results = []
+    for detector_name in detectors:
+        for scenario in scenarios:
+            args = (detector_name, scenario, min(points, point_limits.get(detector_name, points)), seed, chunk_size)
+            if isolate:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                    result = executor.submit(run_case, *args).result()
+            else:
+                result = run_case(*args)
+            results.append(result)
+    return results
+
+
+def save_baseline(results: list, path: str, **meta):
+    """Write results and the run parameters to a JSON baseline."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    meta.update(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+                cpus=os.cpu_count(), created=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=4)
+
+
+def load_baseline(path: str) -> dict:
+    """Load a baseline written by ``save_baseline``."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(results: list, baseline: dict, tolerance: float = 0.2) -> list:
+    """Regressions of results against a baseline.
+
+    A case regresses when its throughput drops or its p99 latency grows by
+    more than ``tolerance`` (relative), when its F1 drops, or when it fails
+    while it passed in the baseline. Cases missing from the baseline are
+    skipped.
+
+    Returns:
+        list: One message per regression.
+    """
+    previous = {(r['detector'], r['scenario']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        key = (result['detector'], result['scenario'])
+        before = previous.get(key)
+        if before is None or before.get('error'):
+            continue
+        name = f"{key[0]} on {key[1]}"
+        if result.get('error'):
+            regressions.append(f"{name}: failed ({result['error']})")
+            continue
+        if result['points'] != before['points']:
+            continue
+        if result['points_per_sec'] < before['points_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['points_per_sec']:.0f} -> "
+                               f"{result['points_per_sec']:.0f} points/s")
+        if result['p99_us'] > before['p99_us'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 latency {before['p99_us']:.1f} -> {result['p99_us']:.1f} us")
+        if before.get('f1') is not None and result['f1'] is not None and result['f1'] < before['f1'] - 1e-9:
+            regressions.append(f"{name}: F1 {before['f1']:.3f} -> {result['f1']:.3f}")
+    return regressions
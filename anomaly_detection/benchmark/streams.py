@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+import numpy as np
+
+SCENARIOS = ('steady', 'bursts', 'level_shift', 'spikes')
+
+# Op latencies in microseconds, one op every INTERVAL_NS
+BASE_LATENCY_US = 500.0
+INTERVAL_NS = 1_000_000
+
+
+class Stream(namedtuple('Stream', ['name', 'timestamps', 'values', 'labels'])):
+    """Synthetic op latency stream with its ground-truth anomaly labels.
+
+    ``timestamps`` are nanoseconds like the trace logs, ``values`` latencies
+    in microseconds and ``labels`` 1 for every injected anomalous point.
+    """
+
+    __slots__ = ()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def _steady(rng: np.random.Generator, n: int) -> np.ndarray:
+    # Gamma noise: positive and right skewed like real op latencies
+    return rng.gamma(shape=16.0, scale=BASE_LATENCY_US / 16.0, size=n)
+
+
+def make_stream(scenario: str, n: int = 10000, seed: int = 42) -> Stream:
+    """Generate a synthetic NFS op latency stream.
+
+    - ``steady``: stationary load, no anomalies;
+    - ``bursts``: load bursts of 50-200 ops with 3-5x latency and wider
+      spread, every burst point is labeled;
+    - ``level_shift``: the latency level steps up or down by 2-3x a few
+      times, the first 50 points after each step are labeled;
+    - ``spikes``: isolated 6-12x latency spikes on 0.5% of the points.
+
+    The first 20% of the stream is kept free of anomalies so detectors can
+    warm up.
+
+    Args:
+        scenario (str): One of SCENARIOS.
+        n (int, optional): Number of points. Defaults to 10000.
+        seed (int, optional): Seed of the generator. Defaults to 42.
+
+    Raises:
+        ValueError: Unknown scenario.
+
+    Returns:
+        Stream: The generated stream.
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario '{scenario}', expected one of {SCENARIOS}.")
+    rng = np.random.default_rng(seed)
+    values = _steady(rng, n)
+    labels = np.zeros(n, dtype=int)
+    warmup = n // 5
+
+    if scenario == 'bursts':
+        for start in np.sort(rng.choice(np.arange(warmup, n - 200), size=max(1, n // 2000), replace=False)):
+            length = int(rng.integers(50, 201))
+            factor = rng.uniform(3.0, 5.0)
+            values[start:start + length] = _steady(rng, length) * factor * rng.uniform(0.7, 1.3, size=length)
+            labels[start:start + length] = 1
+    elif scenario == 'level_shift':
+        level = np.ones(n)
+        steps = np.sort(rng.choice(np.arange(warmup, n - 100), size=max(1, n // 2500), replace=False))
+        factor = 1.0
+        for step in steps:
+            # Alternate up and down so the level stays within a realistic range
+            factor = factor * rng.uniform(2.0, 3.0) if factor <= 1.0 else factor / rng.uniform(2.0, 3.0)
+            level[step:] = factor
+            labels[step:step + 50] = 1
+        values *= level
+    elif scenario == 'spikes':
+        spikes = rng.choice(np.arange(warmup, n), size=max(1, n // 200), replace=False)
+        values[spikes] *= rng.uniform(6.0, 12.0, size=len(spikes))
+        labels[spikes] = 1
+
+    timestamps = np.arange(n, dtype=np.int64) * INTERVAL_NS
+    return Stream(scenario, timestamps, values, labels)
@@ -0,0 +1,69 @@
+import numpy as np
+import scipy.fft as spfft
+
+
+class ReconstructError(Exception):
+    """
+    采样点无法同时满足 (同一时间点采到不同的值), 与 cvxpy 的 SolverError 一样触发提高采样率重试
+    """
+
+
+def _synthesis(coef):
+    # 系数 -> 信号: 沿时间与 KPI 两个维度的正交 IDCT, 等价于 kron(idct(I_d), idct(I_n))
+    return spfft.idctn(coef, norm='ortho')
+
+
+def _analysis(signal):
+    return spfft.dctn(signal, norm='ortho')
+
+
+def reconstruct(n, d, index, value, x0=None, max_iter=1000, tol=1e-3):
+    """
+    压缩感知采样重建算法, 不构造 (n*d)x(n*d) 的 DCT 矩阵
+
+    求解与 cvxpy.reconstruct 相同的基追踪问题 min ||c||_1 s.t. 采样点上 idct2(c) = value,
+    用 ADMM (Douglas-Rachford 分裂) 迭代: DCT 正交且采样只选取行, 投影到约束集
+    就是把信号在采样点上的值替换为 value, 每次迭代只需一次 dctn 和一次 idctn,
+    时间与内存为 O(n*d*log(n*d))
+    :param n: 需重建数据的数据量
+    :param d: 需重建数据的维度
+    :param index: 采样点的时间维度坐标 属于[0, n-1]
+    :param value: 采样点的KPI值，shape=(m, d), m为采样数据量
+    :param x0: 初始猜测 shape=(n, d), 例如上一个重叠窗口的重建结果, 默认从 0 开始
+    :param max_iter: 最大迭代次数
+    :param tol: 原始/对偶残差的相对收敛阈值
+    :return:x_re: 重建的KPI数据，shape=(n, d), 在采样点上与 value 一致
+    """
+    index = np.asarray(index, dtype=int)
+    value = np.asarray(value, dtype=float).reshape(len(index), d)
+    # 重复的采样时间点只保留一个, 值不一致时问题无解
+    unique, first, inverse = np.unique(index, return_index=True, return_inverse=True)
+    if len(unique) < len(index) and not np.allclose(value, value[first][inverse]):
+        raise ReconstructError('conflicting values sampled at the same time point')
+    index, value = unique, value[first]
+
+    def project(coef):
+        signal = _synthesis(coef)
+        signal[index, :] = value
+        return _analysis(signal)
+
+    size = np.sqrt(n * d)
+    # 软阈值步长 1/rho 取采样值幅度的 1/10, 使收敛速度与数据的量纲无关
+    rho = 10 / max(np.abs(value).max(), 1e-12)
+    z = _analysis(np.asarray(x0, dtype=float)) if x0 is not None else np.zeros((n, d))
+    u = np.zeros((n, d))
+    x = project(z)
+    for _ in range(max_iter):
+        x = project(z - u)
+        z_prev = z
+        v = x + u
+        # 软阈值: ||.||_1 的近端算子
+        z = np.sign(v) * np.maximum(np.abs(v) - 1 / rho, 0)
+        u = v - z
+        primal = np.linalg.norm(x - z)
+        dual = rho * np.linalg.norm(z - z_prev)
+        if primal <= tol * max(size, np.linalg.norm(x), np.linalg.norm(z)) and \
+                dual <= tol * max(size, rho * np.linalg.norm(u)):
+            break
+    # x 是投影的结果, 严格满足采样约束
+    return _synthesis(x)
@@ -1,6 +1,5 @@
 import numpy as np
 #import cupy as cp
-import random
 from time import perf_counter
 
 # lesinn_cuda_kernel_raw = ""
@@ -21,77 +20,95 @@ def similarity(x: np.ndarray, y: np.ndarray):
     return a
 
 
+# 每批参与距离计算的元素个数上限 (批内点数 * t * phi * d), 限制临时数组的内存
+_BLOCK_ELEMENTS = 1 << 22
+
+
+def _sample_subsets(rng: np.random.Generator, rows: int, n: int, k: int):
+    """
+    每行从 range(n) 中不放回地随机取 k 个下标, 与 random.sample 同分布
+    按 Floyd 算法逐列生成, 每列对所有行一次性抽取
+    :param rng: 随机数生成器
+    :param rows: 行数
+    :param n: 下标范围
+    :param k: 每行取的个数, k <= n
+    :return: shape=(rows, k) 的下标数组, 每行互不重复
+    """
+    chosen = np.empty((rows, k), dtype=np.intp)
+    for col, j in enumerate(range(n - k, n)):
+        index = rng.integers(0, j + 1, size=rows)
+        if col:
+            # 已经取过的下标换成 j, j 在这一列之前不可能被取到
+            taken = (chosen[:, :col] == index[:, None]).any(axis=1)
+            index[taken] = j
+        chosen[:, col] = index
+    return chosen
+
+
+def _lesinn_score(incoming_data: np.array, all_data: np.array, t: int, phi: int, rng: np.random.Generator):
+    """
+    incoming_data 中每个点在 all_data 上的 lesinn 离群值
+    每个点取 t 个大小为 phi 的随机子集, 取子集中最近邻的相似度 1 / (1 + 欧氏距离), 离群值为 t / 相似度之和
+    下标一次抽取为整数数组, 距离由一次广播运算得到, 按批计算以限制内存
+    """
+    m, d = incoming_data.shape
+    n = all_data.shape[0]
+    k = min(phi, n)
+    score = np.zeros((m,))
+    block = max(1, _BLOCK_ELEMENTS // max(1, t * k * d))
+    for begin in range(0, m, block):
+        end = min(m, begin + block)
+        index = _sample_subsets(rng, (end - begin) * t, n, k).reshape(end - begin, t, k)
+        # shape=(批内点数, t, k)
+        distance = np.sqrt(np.sum(np.square(all_data[index] - incoming_data[begin:end, None, None, :]), axis=-1))
+        score[begin:end] = np.sum(1 / (1 + distance.min(axis=-1)), axis=-1)
+    data_score = np.zeros((m,))
+    nonzero = score != 0
+    data_score[nonzero] = t / score[nonzero]
+    return data_score
+
+
 def online_lesinn(
         incoming_data: np.array,
         historical_data: np.array,
         t: int = 20,
         phi: int = 3,
-        random_state: int = None
+        random_state: int = None,
+        rng: np.random.Generator = None
 ):
     """
     在线离群值算法 lesinn
     :param incoming_data: shape=(m, d,) 需要计算离群值的向量
     :param historical_data: shape=(n,d) 历史数据
     :param t: 每个数据点取t个data中子集作为离群值参考
-    :param phi: 每个数据t个子集的大小
-    :param random_state: 随机数种子
+    :param phi: 每个数据t个子集的大小, 数据不足phi个时取全部数据
+    :param random_state: 随机数种子, 相同的种子得到相同的结果
+    :param rng: 随机数生成器, 指定时忽略 random_state, 多次调用共用一个随机数流
     :return:
     """
-    if random_state:
-        random.seed(random_state)
-        np.random.seed(random_state)
-    m = incoming_data.shape[0]
+    if rng is None:
+        rng = np.random.default_rng(random_state)
     # 将历史所有数据和需要计算离群值的数据拼接到一起
     if historical_data.shape:
         all_data = np.concatenate([historical_data, incoming_data], axis=0)
     else:
         all_data = incoming_data
-    n, d = all_data.shape
-    data_score = np.zeros((m,))
+    return _lesinn_score(np.asarray(incoming_data, dtype=float), np.asarray(all_data, dtype=float), t, phi, rng)
 
 
-    for i in range(m):
-        score = 0
-        for j in range(t):
-            sample = random.sample(range(0, n), k=phi)
-            nn_sim = 0
-            for each in sample:
-                nn_sim = max(
-                    nn_sim, similarity(incoming_data[i, :], all_data[each, :])
-                )
-            score += nn_sim
-        if score:
-            data_score[i] = t / score
-    return data_score
-
-
-def lesinn(data, t=50, phi=20, random_state=None):
+def lesinn(data, t=50, phi=20, random_state=None, rng=None):
     """
     :param data: 数据矩阵, 行主序 shape=(n, d) 数据量n 数据维度d
     :param t: 每个数据点取t个data中子集作为离群值参考
     :param phi: 每个数据t个子集的大小
     :param random_state: 指定随机种子, 如果为None则是不指定
+    :param rng: 随机数生成器, 指定时忽略 random_state
     :return: 每个data元素的离群值数组
     """
-    if random_state:
-        random.seed(random_state)
-        np.random.seed(random_state)
-    n = data.shape[0]
-    data_score = np.zeros((n, ))
-    sample = set()
-    for i in range(n):
-        score = 0
-        for j in range(t):
-            sample.clear()
-            while len(sample) < phi and len(sample) < n:
-                sample.add(random.randint(0, n - 1))
-            nn_sim = 0
-            for each in sample:
-                nn_sim = max(nn_sim, similarity(data[i, :], data[each, :]))
-            score += nn_sim
-        if score:
-            data_score[i] = (t / score)
-    return data_score
+    if rng is None:
+        rng = np.random.default_rng(random_state)
+    data = np.asarray(data, dtype=float)
+    return _lesinn_score(data, data, t, phi, rng)
 
 
 def toy():
@@ -1,2 +1,2 @@
-from .localized_sample import localized_sample
+from .localized_sample import localized_sample, window_seed
 
@@ -2,6 +2,20 @@ import numpy as np
 import random
 from typing import Optional, List, Tuple
 
+
+def window_seed(random_state, win_l: int, win_r: int) -> int:
+    """
+    窗口 [win_l, win_r) 的采样随机种子, 只由 random_state 和窗口在整个序列中的位置决定
+    localized_sample 在种子为 0 时不设置种子而沿用全局随机状态, 这里得到的种子总不为 0
+    :param random_state: 全局随机数种子, None 按 0 处理
+    :param win_l: 窗口左端点
+    :param win_r: 窗口右端点
+    :return: [1, 2^32 - 1] 中的种子
+    """
+    state = np.random.SeedSequence([random_state or 0, win_l, win_r]).generate_state(1)[0]
+    return int(state) % (2 ** 32 - 1) + 1
+
+
 def localized_sample(x: np.array, m, score, scale=2, rho=None, sigma=1 / 12, random_state=None):
 # def localized_sample(x: np.ndarray,
 #                      m: int,
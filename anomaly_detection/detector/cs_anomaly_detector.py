@@ -1,60 +1,51 @@
 import numpy as np
 import os
+import random
+from time import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from cvxpy.error import SolverError
-from multiprocessing import Process, Event, Queue
-from threading import Thread
 from .algorithm.cluster import cluster
 from .algorithm.cvxpy import reconstruct
-from .algorithm.sampling import localized_sample
+from .algorithm.admm import reconstruct as admm_reconstruct, ReconstructError
+from .algorithm.sampling import localized_sample, window_seed
+from .utils.shared_array import SharedArray
 
-max_seed = 10 ** 9 + 7
+# 工作进程中的窗口重建器, 由 _init_worker 在进程启动时设置一次
+_worker = None
 
 
-class CycleFeatureProcess(Process):
+def _init_worker(worker):
+    global _worker
+    _worker = worker
+    if worker.random_state:
+        random.seed(worker.random_state)
+        np.random.seed(worker.random_state)
+
+
+def _cycle_feature_task(data_spec: tuple, cb: int, ce: int, cluster_threshold: float):
     """
-    计算单个周期内特征的线程
+    计算单个周期 data[cb, ce) 的分组
     """
+    shared = SharedArray.attach(data_spec)
+    try:
+        cycle_data = shared.array[cb:ce].copy()
+    finally:
+        shared.close()
+    return cluster(cycle_data, cluster_threshold)
 
-    def __init__(
-            self,
-            task_queue: Queue,
-            result_queue: Queue,
-            cluster_threshold: float
-    ):
-        """
-        :param task_queue: 作业队列
-        :param result_queue: 结果队列
-        :param cluster_threshold: 聚类阈值
-        """
-        super().__init__()
-        self.task_queue = task_queue
-        self.result_queue = result_queue
-        self.cluster_threshold = cluster_threshold
 
-    def run(self):
-        print('CycleFeatureProcess-%d: start' % os.getpid())
-        while not self.task_queue.empty():
-            group_index, cycle_data = self.task_queue.get()
-            self.result_queue.put(
-                (group_index, cluster(cycle_data, self.cluster_threshold))
-            )
-            print(
-                'CycleFeatureProcess-%d: finish task-%d' %
-                (os.getpid(), group_index)
-            )
-        print('CycleFeatureProcess-%d: exit' % os.getpid())
+def _window_task(data_spec: tuple, output_spec: tuple, layer: int, wb: int, we: int, group: list):
+    return _worker.reconstruct_window(data_spec, output_spec, layer, wb, we, group)
 
 
-class WindowReconstructProcess(Process):
+class WindowReconstructProcess():
     """
-    窗口重建工作进程
+    窗口重建工作进程中的重建器
+    输入数据与重建结果都在共享内存中, 每个作业只传窗口位置和分组
     """
 
     def __init__(
             self,
-            data: np.array,
-            task_queue: Queue,
-            result_queue: Queue,
             cycle: int,
             latest_windows: int,
             sample_score_method,
@@ -65,12 +56,11 @@ class WindowReconstructProcess(Process):
             random_state: int,
             without_localize_sampling: bool,
             retry_limit: int,
-            task_return_event: Event()
+            solver: str = 'cvxpy',
+            solver_max_iter: int = 1000,
+            solver_tol: float = 1e-3
     ):
         """
-        :param data: 原始数据的拷贝
-        :param task_queue: 作业队列
-        :param result_queue: 结果队列
         :param cycle: 周期
         :param latest_windows: 计算采样价值指标时参考的最近历史周期数
         :param sample_score_method: 计算采样价值指标方法
@@ -81,12 +71,10 @@ class WindowReconstructProcess(Process):
         :param random_state: 随机数种子
         :param without_localize_sampling: 是否不按局部化采样算法进行采样
         :param retry_limit: 每个窗口重试的上限
-        :param task_return_event: 当一个作业被完成时触发的事件, 通知主进程收集
+        :param solver: 重建求解器, 'cvxpy' 或 'admm'
+        :param solver_max_iter: admm 最大迭代次数
+        :param solver_tol: admm 收敛阈值
         """
-        super().__init__()
-        self.data = data
-        self.task_queue = task_queue
-        self.result_queue = result_queue
         self.cycle = cycle
         self.latest_windows = latest_windows
         self.sample_score_method = sample_score_method
@@ -97,54 +85,55 @@ class WindowReconstructProcess(Process):
         self.sigma = sigma
         self.random_state = random_state
         self.retry_limit = retry_limit
-        self.task_return_event = task_return_event
+        self.solver = solver
+        self.solver_max_iter = solver_max_iter
+        self.solver_tol = solver_tol
 
-    def run(self):
-        from time import time
-        if self.random_state:
-            np.random.seed(self.random_state)
-        tot = time()
-        data_process = 0
-        wait_syn = 0
-        rec = 0
-        sample_scoring = 0
-        print('WindowReconstructProcess-%d: start' % os.getpid())
-        while not self.task_queue.empty():
-            t = time()
-            wb, we, group = self.task_queue.get()
-            wait_syn += time() - t
-            t = time()
+    def reconstruct_window(self, data_spec: tuple, output_spec: tuple, layer: int, wb: int, we: int, group: list):
+        """
+        重建窗口 data[wb, we), 结果写入共享输出 output[layer, wb:we]
+        :param data_spec: 输入数据 SharedArray 的 spec
+        :param output_spec: 重建结果 SharedArray 的 spec, shape=(layers, n, d)
+        :param layer: 写入的层, 同一层的窗口互不重叠
+        :param wb: 窗口左端点
+        :param we: 窗口右端点
+        :param group: 本窗口所在周期的分组
+        :return: 重建尝试次数, 各阶段耗时 (秒)
+        """
+        started = time()
+        shared = SharedArray.attach(data_spec)
+        try:
             hb = max(0, wb - self.latest_windows)
-            latest = self.data[hb:wb]
-            window_data = self.data[wb:we]
-            data_process += time() - t
-            t = time()
-            sample_score = self.sample_score_method(window_data, latest)
-            sample_scoring += time() - t
-            t = time()
-            rec_window, retries = \
-                self.window_sample_reconstruct(
-                    data=window_data,
-                    groups=group,
-                    score=sample_score,
-                    random_state=self.random_state * wb * we % max_seed
-                )
-            rec += time() - t
-            t = time()
-            self.result_queue.put((wb, we, rec_window, retries, sample_score))
-            self.task_return_event.set()
-            wait_syn += time() - t
-            print(
-                'WindowReconstructProcess-%d: window[%d, %d) done' %
-                (os.getpid(), wb, we)
+            latest = shared.array[hb:wb].copy()
+            window_data = shared.array[wb:we].copy()
+        finally:
+            shared.close()
+        t = time()
+        data_process = t - started
+        sample_score = self.sample_score_method(window_data, latest)
+        sample_scoring = time() - t
+        t = time()
+        rec_window, retries = \
+            self.window_sample_reconstruct(
+                data=window_data,
+                groups=group,
+                score=sample_score,
+                random_state=window_seed(self.random_state, wb, we)
             )
-        tot = time() - tot
-        print('WindowReconstructProcess-%d: exit' % os.getpid())
-        print(
-            'tot: %f\ndata_process: %f\nwait_syn: %f\nrec: %f\n'
-            'sample_scoring:%f\n'
-            % (tot, data_process, wait_syn, rec, sample_scoring)
-        )
+        rec = time() - t
+        t = time()
+        output = SharedArray.attach(output_spec)
+        try:
+            output.array[layer, wb:we] = rec_window
+        finally:
+            output.close()
+        return retries, {
+            'pid': os.getpid(),
+            'data_process': data_process,
+            'sample_scoring': sample_scoring,
+            'rec': rec,
+            'write': time() - t,
+        }
 
     def sample(self, x: np.array, m: int, score: np.array, random_state: int):
         """
@@ -171,7 +160,7 @@ class WindowReconstructProcess(Process):
         for i in range(m):
             res.append((timestamp[i], s[i]))
         res.sort(key=lambda each: each[0])
-        res = np.array(res)
+        res = np.array(res, dtype=object)
         timestamp = np.array(res[:, 0]).astype(int)
         values = np.zeros((m, d))
         for i in range(m):
@@ -217,14 +206,22 @@ class WindowReconstructProcess(Process):
                         )
                 rec = np.zeros(shape=(n, d))
                 for i in range(len(groups)):
-                    x_re = reconstruct(
-                        n, len(groups[i]), timestamp,
-                        values[:, groups[i]]
-                    )
+                    if self.solver == 'admm':
+                        x_re = admm_reconstruct(
+                            n, len(groups[i]), timestamp,
+                            values[:, groups[i]],
+                            max_iter=self.solver_max_iter,
+                            tol=self.solver_tol
+                        )
+                    else:
+                        x_re = reconstruct(
+                            n, len(groups[i]), timestamp,
+                            values[:, groups[i]]
+                        )
                     for j in range(len(groups[i])):
                         rec[:, groups[i][j]] = x_re[:, j]
                 break
-            except SolverError:
+            except (SolverError, ReconstructError):
                 if retry_count > self.retry_limit:
                     raise Exception(
                         'retry failed, please try higher sample rate or '
@@ -262,6 +259,9 @@ class CSAnomalyDetector:
             retry_limit=10,
             without_grouping: str = None,
             without_localize_sampling: bool = False,
+            solver: str = 'cvxpy',
+            solver_max_iter: int = 1000,
+            solver_tol: float = 1e-3,
     ):
         """
         :param cluster_threshold: 聚类参数: 阈值
@@ -279,12 +279,17 @@ class CSAnomalyDetector:
         :param retry_limit: 求解重试次数, 超过次数求解仍未成功, 则抛出异常
         :param without_grouping: 降级实验: 不进行分组
         :param without_localize_sampling: 降级实验: 完全随机采样
+        :param solver: 重建求解器, 'cvxpy' (稠密 kron 矩阵 + OSQP) 或 'admm' (快速 DCT 算子 + ADMM)
+        :param solver_max_iter: admm 最大迭代次数
+        :param solver_tol: admm 收敛阈值
         """
         if sample_rate > 1 or sample_rate <= 0:
             raise Exception('invalid sample rate: %s' % sample_rate)
         if without_grouping and without_grouping not in \
                 {'one_by_one', 'all_by_one'}:
             raise Exception('unknown without grouping option')
+        if solver not in ('cvxpy', 'admm'):
+            raise Exception('unknown reconstruct solver: %s' % solver)
         self._scale = scale
         self._rho = rho
         self._sigma = sigma
@@ -303,6 +308,12 @@ class CSAnomalyDetector:
         # 降级实验
         self._without_grouping = without_grouping
         self._without_localize_sampling = without_localize_sampling
+        # 重建求解器
+        self._solver = solver
+        self._solver_max_iter = solver_max_iter
+        self._solver_tol = solver_tol
+        # 最近一次 reconstruct 的统计: 窗口数、重试次数、各阶段耗时 (秒) 以及每个工作进程的负载
+        self.metrics = {}
 
     def reconstruct(
             self, data: np.array,
@@ -311,7 +322,9 @@ class CSAnomalyDetector:
             stride: int = 1,
     ):
         """
-        离线预测输入数据的以时间窗为单位的异常概率预测, 多线程
+        离线预测输入数据的以时间窗为单位的异常概率预测, 多进程
+        数据只写入一次共享内存, 分组和窗口重建都在同一个进程池中完成,
+        各阶段耗时保存在 self.metrics
         :param data: 输入数据
         :param window: 时间窗口长度(点)
         :param windows_per_cycle: 周期长度: 以时间窗口为单位
@@ -319,17 +332,41 @@ class CSAnomalyDetector:
         """
         if windows_per_cycle < 1:
             raise Exception('a cycle contains 1 window at least')
+        started = time()
         # 周期长度
         cycle = windows_per_cycle * window
-        # 周期特征: 按周期分组
-        groups = self._get_cycle_feature(data, cycle)
-        print('group per cycle:')
-        for i in range(len(groups)):
-            print('cycle: %d ----' % i)
-            for each in groups[i]:
-                print('  ', each)
-        reconstructed, retry_count = self._get_reconstructed_data(
-            data, window, windows_per_cycle, groups, stride)
+        worker = WindowReconstructProcess(
+            cycle=cycle, latest_windows=self._latest_windows,
+            sample_score_method=self._sample_score_method,
+            sample_rate=self._sample_rate,
+            scale=self._scale, rho=self._rho, sigma=self._sigma,
+            random_state=self._random_state,
+            without_localize_sampling=self._without_localize_sampling,
+            retry_limit=self._retry_limit,
+            solver=self._solver,
+            solver_max_iter=self._solver_max_iter,
+            solver_tol=self._solver_tol
+        )
+        with SharedArray.copy_of(data) as shared, ProcessPoolExecutor(
+                max_workers=self._workers, initializer=_init_worker, initargs=(worker,)
+        ) as executor:
+            try:
+                # 周期特征: 按周期分组
+                t = time()
+                groups = self._get_cycle_feature(data, cycle, executor, shared.spec())
+                cycle_feature = time() - t
+                print('group per cycle:')
+                for i in range(len(groups)):
+                    print('cycle: %d ----' % i)
+                    for each in groups[i]:
+                        print('  ', each)
+                reconstructed, retry_count = self._get_reconstructed_data(
+                    data, window, windows_per_cycle, groups, stride, executor, shared.spec())
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+        self.metrics['cycle_feature'] = cycle_feature
+        self.metrics['tot'] = time() - started
         return reconstructed, retry_count
 
     def predict(
@@ -378,14 +415,21 @@ class CSAnomalyDetector:
             windows_per_cycle: int,
             groups: list,
             stride: int,
+            executor: ProcessPoolExecutor,
+            data_spec: tuple,
     ):
         """
-        离线预测输入数据的以时间窗为单位的异常概率预测, 多线程
+        离线预测输入数据的以时间窗为单位的异常概率预测, 多进程
+        每个窗口的重建结果写入共享内存, 按完成顺序收集, 再按窗口顺序合并,
+        每个窗口的采样种子由 window_seed 从 random_state 和窗口位置得到,
+        合并结果与完成顺序和进程数无关, 相同 random_state 的多次运行结果相同
         :param data: 输入数据
         :param window: 时间窗口长度(点)
         :param windows_per_cycle: 周期长度: 以时间窗口为单位
         :param groups: 每个周期的分组
         :param stride: 时间窗口步长
+        :param executor: 进程池, 工作进程已由 _init_worker 初始化
+        :param data_spec: 共享内存中输入数据的 spec
         :return:
         """
         n, d = data.shape
@@ -393,150 +437,108 @@ class CSAnomalyDetector:
         reconstructed = np.zeros((n, d))
         # 表示当时某个位置上被已重建窗口的数量
         reconstructing_weight = np.zeros((n,))
-        needed_weight = np.zeros((n,))
-        # 作业列表
-        task_queue = Queue()
-        # 结果列表
-        result_queue = Queue()
         # 周期长度
         cycle = window * windows_per_cycle
 
-        # 窗口左端点索引
+        # 窗口 [win_l, win_r)
+        windows = []
         win_l = 0
         while True:
             win_r = min(n, win_l + window)
-            # 窗口右端点索引 窗口数据[win_l, win_r)
-            task_queue.put((win_l, win_r, groups[win_l // cycle]))
-            needed_weight[win_l:win_r] += 1
+            windows.append((win_l, win_r, groups[win_l // cycle]))
             if win_r >= n:
                 break
             win_l += stride
+        # 相隔 layers 个步长的窗口互不重叠, 第 i 个窗口写入第 i % layers 层
+        layers = min(len(windows), -(-window // stride))
 
-        task_return_event = Event()
-        finished = False
-
-        def receive_result_thread():
-            """
-            接受result_queue结果的线程
-            :return:
-            """
-            total_retries = 0
-            while True:
-                while result_queue.empty():
-                    task_return_event.clear()
-                    task_return_event.wait()
-                    if finished:
-                        result_queue.put(total_retries)
-                        return
-                wb, we, rec_window, retries, sample_score = result_queue.get()
+        started = time()
+        metrics = {
+            'workers': self._workers,
+            'windows': len(windows),
+            'data_process': 0.0,
+            'sample_scoring': 0.0,
+            'rec': 0.0,
+            'per_worker': {},
+        }
+        total_retries = 0
+        with SharedArray((layers, n, d)) as output:
+            futures = {}
+            for i, (wb, we, group) in enumerate(windows):
+                future = executor.submit(_window_task, data_spec, output.spec(), i % layers, wb, we, group)
+                futures[future] = i
+            done = [False] * len(windows)
+            merged = 0
+            for future in as_completed(futures):
+                i = futures[future]
+                retries, timing = future.result()
                 total_retries += retries
-                for index in range(rec_window.shape[0]):
-                    w = index + wb
-                    weight = reconstructing_weight[w]
-                    reconstructed[w, :] = \
-                        (reconstructed[w, :] * weight + rec_window[index]) \
-                        / (weight + 1)
-                reconstructing_weight[wb:we] += 1
-
-        processes = []
-        for i in range(self._workers):
-            process = WindowReconstructProcess(
-                data=data, task_queue=task_queue, result_queue=result_queue,
-                cycle=cycle, latest_windows=self._latest_windows,
-                sample_score_method=self._sample_score_method,
-                sample_rate=self._sample_rate,
-                scale=self._scale, rho=self._rho, sigma=self._sigma,
-                random_state=self._random_state,
-                without_localize_sampling=self._without_localize_sampling,
-                retry_limit=self._retry_limit,
-                task_return_event=task_return_event
-            )
-            process.start()
-            processes.append(process)
-        receiving_thread = Thread(target=receive_result_thread)
-        receiving_thread.start()
-        for each in processes:
-            each.join()
-        finished = True
-        task_return_event.set()
-        receiving_thread.join()
-
-        mismatch_weights = []
-        for i in range(n):
-            if reconstructing_weight[i] != needed_weight[i]:
-                mismatch_weights.append('%d' % i)
-        if len(mismatch_weights):
-            from sys import stderr
-            stderr.write('BUG empty weight: index: %s\n' %
-                         ','.join(mismatch_weights))
-        return reconstructed, result_queue.get()
+                busy = timing['data_process'] + timing['sample_scoring'] + timing['rec'] + timing['write']
+                metrics['data_process'] += timing['data_process']
+                metrics['sample_scoring'] += timing['sample_scoring']
+                metrics['rec'] += timing['rec']
+                per_worker = metrics['per_worker'].setdefault(timing['pid'], {'windows': 0, 'busy': 0.0})
+                per_worker['windows'] += 1
+                per_worker['busy'] += busy
+                done[i] = True
+                # 按窗口顺序合并已完成的前缀
+                while merged < len(windows) and done[merged]:
+                    wb, we, _ = windows[merged]
+                    weight = reconstructing_weight[wb:we, None]
+                    reconstructed[wb:we] = \
+                        (reconstructed[wb:we] * weight + output.array[merged % layers, wb:we]) / (weight + 1)
+                    reconstructing_weight[wb:we] += 1
+                    merged += 1
+        metrics['reconstruct'] = time() - started
+        # 工作进程没有在处理窗口的时间: 等待作业、进程间同步
+        metrics['wait_syn'] = sum(
+            max(0.0, metrics['reconstruct'] - each['busy']) for each in metrics['per_worker'].values()
+        )
+        metrics['retries'] = total_retries
+        self.metrics = metrics
+        return reconstructed, total_retries
 
     def _get_cycle_feature(
             self,
             data: np.array,
             cycle: int,
+            executor: ProcessPoolExecutor,
+            data_spec: tuple,
     ):
         """
         将数据按周期进行划分后计算得到每个周期的分组
         :param data: 数据
         :param cycle: 周期长度
+        :param executor: 进程池
+        :param data_spec: 共享内存中输入数据的 spec
         :return: 分组结果
         """
         # 数据量, 维度
         n, d = data.shape
         # 每周期分组结果
         cycle_groups = []
-        # 工作数量
-        group_index = 0
-        # 作业队列, 用于向子进程输入数据
-        task_queue = Queue()
-        # 输出队列
-        result_queue = Queue()
+        futures = {}
         # 周期开始的index
         cb = 0
         while cb < n:
             # 周期结束的index
             ce = min(n, cb + cycle)  # 一周期数据为data[cb, ce)
-            # 初始化追加列表引用
-            if group_index == 0:
+            group_index = len(cycle_groups)
+            if self._without_grouping == 'one_by_one':
+                # 每条kpi一组
+                cycle_groups.append([[i] for i in range(d)])
+            elif self._without_grouping == 'all_by_one':
+                # 所有kpi一组
+                cycle_groups.append([list(range(d))])
+            elif group_index == 0:
                 # 没有历史数据
                 # 分组默认每个kpi一组
-                init_group = []
-                if not self._without_grouping:
-                    for i in range(d):
-                        init_group.append([i])
-                cycle_groups.append(init_group)
+                cycle_groups.append([[i] for i in range(d)])
             else:
                 cycle_groups.append([])
-                # 向工作队列中填充输入数据
-                if not self._without_grouping:
-                    task_queue.put((group_index, data[cb:ce]))
-            group_index += 1
+                futures[executor.submit(_cycle_feature_task, data_spec, cb, ce, self._cluster_threshold)] = \
+                    group_index
             cb += cycle
-        if self._without_grouping:
-            if self._without_grouping == 'one_by_one':
-                # 每条kpi一组
-                for each in cycle_groups:
-                    for i in range(d):
-                        each.append([i])
-            elif self._without_grouping == 'all_by_one':
-                # 所有kpi一组
-                all_in_group = []
-                for i in range(d):
-                    all_in_group.append(i)
-                for each in cycle_groups:
-                    each.append(all_in_group)
-        else:
-            processes = []
-            for i in range(min(len(cycle_groups), self._workers)):
-                process = CycleFeatureProcess(
-                    task_queue, result_queue, self._cluster_threshold
-                )
-                process.start()
-                processes.append(process)
-            for process in processes:
-                process.join()
-            while not result_queue.empty():
-                group_index, group = result_queue.get()
-                cycle_groups[group_index] = group
+        for future in as_completed(futures):
+            cycle_groups[futures[future]] = future.result()
         return cycle_groups
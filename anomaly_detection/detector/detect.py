@@ -1,19 +1,26 @@
+import os
 import pandas as pd
 import numpy as np
 import yaml
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
 from tqdm import tqdm
 
 
 from .utils import data_process
-from .utils.metrics import sliding_anomaly_predict
+from .utils.metrics import sliding_anomaly_predict, dynamic_threshold
+from .utils.shared_array import SharedArray
 from .algorithm.cluster import cluster
 from .algorithm.lesinn import online_lesinn
-from .algorithm.sampling.localized_sample import localized_sample
+from .algorithm.moving_average import online_moving_average
+from .algorithm.sampling.localized_sample import localized_sample, window_seed
 from .algorithm.cvxpy import reconstruct
+from .algorithm.admm import reconstruct as admm_reconstruct, ReconstructError
 from cvxpy.error import SolverError
-
-# some upper limit
-max_seed = 10 ** 9 + 7
+from .run_detector import p_normalize
+from anomaly_utils.anomaly_store import AnomalyRecord
+from anomaly_utils.csv_tailer import CSVTailer
 
 
 def anomaly_score_example(source: np.array, reconstructed: np.array):
@@ -55,7 +62,10 @@ class WindowReconstructProcess():
             rho: float,
             sigma: float,
             random_state: int,
-            retry_limit: int
+            retry_limit: int,
+            solver: str = 'cvxpy',
+            solver_max_iter: int = 1000,
+            solver_tol: float = 1e-3
     ):
         """
         :param data: 原始数据的拷贝
@@ -68,6 +78,9 @@ class WindowReconstructProcess():
         :param sigma: 采样参数: 采样集中程度
         :param random_state: 随机数种子
         :param retry_limit: 每个窗口重试的上限
+        :param solver: 重建求解器, 'cvxpy' (稠密 kron 矩阵 + OSQP) 或 'admm' (快速 DCT 算子 + ADMM)
+        :param solver_max_iter: admm 最大迭代次数
+        :param solver_tol: admm 收敛阈值
         """
         super().__init__()
         self.data = data
@@ -79,6 +92,11 @@ class WindowReconstructProcess():
         self.sigma = sigma
         self.random_state = random_state
         self.retry_limit = retry_limit
+        if solver not in ('cvxpy', 'admm'):
+            raise Exception('unknown reconstruct solver: %s' % solver)
+        self.solver = solver
+        self.solver_max_iter = solver_max_iter
+        self.solver_tol = solver_tol
 
     def sample(self, x: np.array, m: int, score: np.array, random_state: int):
         """
@@ -118,13 +136,15 @@ class WindowReconstructProcess():
             data: np.array,
             groups: list,
             score: np.array,
-            random_state: int
+            random_state: int,
+            x0: np.array = None
     ):
         """
         :param data: 原始数据
         :param groups: 分组
         :param score: 这个窗口的每一个点的采样可信度
         :param random_state: 随机种子
+        :param x0: admm 的初始值 shape=(n, d), 通常取上一个重叠窗口的重建结果
         :return: 重建数据, 重建尝试次数
         """
         # 数据量, 维度
@@ -141,14 +161,23 @@ class WindowReconstructProcess():
                 )
                 rec = np.zeros(shape=(n, d))
                 for i in range(len(groups)):
-                    x_re = reconstruct(
-                        n, len(groups[i]), timestamp,
-                        values[:, groups[i]]
-                    )
+                    if self.solver == 'admm':
+                        x_re = admm_reconstruct(
+                            n, len(groups[i]), timestamp,
+                            values[:, groups[i]],
+                            x0=None if x0 is None else x0[:, groups[i]],
+                            max_iter=self.solver_max_iter,
+                            tol=self.solver_tol
+                        )
+                    else:
+                        x_re = reconstruct(
+                            n, len(groups[i]), timestamp,
+                            values[:, groups[i]]
+                        )
                     for j in range(len(groups[i])):
                         rec[:, groups[i][j]] = x_re[:, j]
                 break
-            except SolverError:
+            except (SolverError, ReconstructError):
                 if retry_count > self.retry_limit:
                     raise Exception(
                         'retry failed, please try higher sample rate or '
@@ -166,21 +195,457 @@ class WindowReconstructProcess():
         return rec, retry_count
 
 
-def detect(data_path, output_path, metric_name, last_line=0):
+def _window_reconstruct(process, data, win_l, win_r, groups, score_method, x0=None, origin=0):
+    """
+    采样并重建窗口 data[win_l, win_r), 采样得分参考窗口前 latest_windows 行
+    随机种子由 window_seed 从 random_state 和窗口的绝对位置得到, 不为 0,
+    因此结果与在哪个进程、以什么顺序执行以及重复运行无关
+    :param origin: data 第 0 行在整个序列中的下标, 用于计算随机种子
+    :return: 重建数据, 重建尝试次数
+    """
+    hb = max(0, win_l - process.latest_windows)
+    window_data = data[win_l:win_r]
+    return process.window_sample_reconstruct(
+        data=window_data,
+        groups=groups,
+        score=score_method(window_data, data[hb:win_l]),
+        random_state=window_seed(process.random_state, win_l + origin, win_r + origin),
+        x0=x0
+    )
+
+
+def _window_task(process, spec, win_l, win_r, groups, score_method, origin):
+    """
+    工作进程中重建一个窗口, 数据从共享内存中读取
+    """
+    shared = SharedArray.attach(spec)
+    try:
+        hb = max(0, win_l - process.latest_windows)
+        # 拷贝出需要的行, 共享内存才能立即断开
+        data = shared.array[hb:win_r].copy()
+    finally:
+        shared.close()
+    return _window_reconstruct(process, data, win_l - hb, win_r - hb, groups, score_method, origin=origin + hb)
+
+
+# 在线重建的工作进程池, 第一次使用时创建, 之后的检测复用
+_executor = None
+_executor_workers = 0
+
+
+def _reconstruct_executor(workers):
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown()
+        # spawn 与轮询检测的线程共存是安全的
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+        _executor_workers = workers
+    return _executor
+
+
+def reconstruct_windows(process, data, windows, score_method, workers, origin=0):
+    """
+    在可复用的进程池中并行重建多个窗口
+    data 只写入一次共享内存, 每个任务只传窗口位置和分组
+    :param process: WindowReconstructProcess, 随任务 pickle, 不应持有数据
+    :param data: 归一化后的数据 shape=(n, d)
+    :param windows: [(win_l, win_r, groups), ...]
+    :param score_method: 采样得分函数 (window_data, latest) -> score, 需要可以 pickle
+    :param workers: 工作进程数
+    :param origin: data 第 0 行在整个序列中的下标
+    :return: 按 windows 顺序产生 (重建数据, 重建尝试次数), 调用方按此顺序合并, 结果与进程数无关
+    """
+    executor = _reconstruct_executor(workers)
+    with SharedArray.copy_of(data) as shared:
+        futures = [
+            executor.submit(_window_task, process, shared.spec(), win_l, win_r, groups, score_method, origin)
+            for win_l, win_r, groups in windows
+        ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            # 共享内存释放前等待已开始的任务结束
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+
+
+def lesinn_score(incoming_data, historical_data, random_state, t, phi):
+    """
+    与 run_detector.lesinn_score 相同的采样得分, 参数显式传入, 可以 pickle 给工作进程
+    """
+    return p_normalize(1 / online_lesinn(
+        incoming_data, historical_data, random_state=random_state, t=t, phi=phi
+    ))
+
+
+def moving_average_score(incoming_data, historical_data, window, stride):
+    """
+    与 run_detector.moving_average_score 相同的采样得分
+    """
+    return p_normalize(1 / (1 + online_moving_average(incoming_data, historical_data, window, stride)))
+
+
+class JumpStarterSession():
+    """
+    增量 JumpStarter 检测会话, 在多次轮询之间保存状态, 每次只处理新增的行
+    保存的状态:
+    1. 每个维度的归一化上下界 (随数据增长)
+    2. 每个周期的聚类分组
+    3. 重叠窗口加权平均的重建结果, 以原始量纲保存, 上下界变化后仍可重新归一化
+    4. 重叠检测窗口加权平均的异常得分
+    update 只重建右端点落在已有数据内且尚未重建的窗口, 只保留之后的窗口还需要的历史
+    (最近 latest_windows 行、聚类所需的周期、尚未确定的得分和预测块), 单次开销与新增行数成正比
+
+    窗口划分、采样得分、随机种子、检测窗口和动态阈值块都与离线 run_detector.run 相同,
+    固定 bounds 为全量数据的上下界且 cluster_ahead=True 时, 分多次 update 后 flush
+    得到的异常得分与离线结果一致. 在线使用时有两处不同:
+    1. 上下界由已到达的数据得到, 数据超出原有范围后, 此前窗口的采样与重建不会重做
+    2. 周期 c 的窗口使用上一个完整周期 c-1 的聚类分组, 不必等到周期 c 结束
+    """
+
+    def __init__(
+            self,
+            config_dict: dict,
+            bounds: tuple = None,
+            cluster_ahead: bool = False,
+            predict_window: int = 70
+    ):
+        """
+        :param config_dict: detector-config.yml 的内容
+        :param bounds: 固定的归一化上下界 (min, max), 每个都是 shape=(d,), 默认由数据得到
+        :param cluster_ahead: 周期 c 的窗口是否使用周期 c 本身的聚类分组 (与离线一致),
+                              需要等到周期结束才能重建, 延迟最多一个周期
+        :param predict_window: 动态阈值的块大小, 与 sliding_anomaly_predict 相同
+        """
+        arguments = config_dict['detector_arguments']
+        self.window = config_dict['data']['reconstruct']['window']
+        self.stride = config_dict['data']['reconstruct']['stride']
+        self.det_window = config_dict['data']['detect']['window']
+        self.det_stride = config_dict['data']['detect']['stride']
+        self.cycle = self.window * config_dict['data']['rec_windows_per_cycle']
+        self.latest_windows = arguments['latest_windows']
+        self.cluster_threshold = arguments['cluster_threshold']
+        self.random_state = config_dict['global']['random_state']
+        sample_score_method = arguments.get('sample_score_method', 'lesinn_score')
+        sample_score_config = config_dict['sample_score_method']
+        if sample_score_method == 'lesinn_score':
+            self.sample_score_method = partial(
+                lesinn_score, random_state=self.random_state,
+                t=int(sample_score_config['lesinn']['t']), phi=int(sample_score_config['lesinn']['phi'])
+            )
+        elif sample_score_method == 'moving_average_score':
+            self.sample_score_method = partial(
+                moving_average_score,
+                window=int(sample_score_config['moving_average']['window']),
+                stride=int(sample_score_config['moving_average']['stride'])
+            )
+        else:
+            raise Exception('unknown sample score method: %s' % sample_score_method)
+        # 并行重建的工作进程数, 0 表示在当前进程中重建
+        self.workers = arguments.get('online_workers', 0)
+        self.cluster_ahead = cluster_ahead
+        self.predict_window = predict_window
+        self.process = WindowReconstructProcess(
+            data=None,
+            cycle=self.cycle,
+            latest_windows=self.latest_windows,
+            sample_rate=arguments['sample_rate'],
+            scale=arguments['scale'], rho=arguments['rho'], sigma=arguments['sigma'],
+            random_state=self.random_state,
+            retry_limit=arguments['retry_limit'],
+            solver=arguments.get('solver', 'cvxpy'),
+            solver_max_iter=arguments.get('solver_max_iter', 1000),
+            solver_tol=arguments.get('solver_tol', 1e-3)
+        )
+        self._fixed_bounds = bounds is not None
+        self._min = None if bounds is None else np.asarray(bounds[0], dtype=float)
+        self._max = None if bounds is None else np.asarray(bounds[1], dtype=float)
+        # 已输入的行数, 所有下标都是从会话第一行开始的绝对下标
+        self.rows = 0
+        self.retries = 0
+        # 缓冲区第 0 行的绝对下标
+        self._offset = 0
+        self._timestamps = None
+        self._raw = None
+        self._reconstructed = None
+        self._reconstructing_weight = None
+        self._anomaly_score = None
+        self._anomaly_score_weight = None
+        # 周期 -> 分组
+        self._groups = {}
+        # 下一个重建窗口的左端点, 上一个重建窗口的右端点
+        self._win_l = 0
+        self._win_r = 0
+        # 下一个检测窗口的左端点, 上一个检测窗口的右端点
+        self._det_l = 0
+        self._det_r = 0
+        # 已给出预测的行数
+        self._predicted = 0
+
+    def update(self, timestamps: np.array, data: np.array):
+        """
+        输入新到达的数据, 返回得分和预测已经确定的行
+        :param timestamps: 新数据的时间戳 shape=(m,)
+        :param data: 新数据的原始值 shape=(m, d)
+        :return: (时间戳, 第一维的原始值, 异常得分, 预测) 本次新确定的行, 按时间顺序
+        """
+        timestamps = np.asarray(timestamps)
+        data = np.asarray(data, dtype=float).reshape(len(timestamps), -1)
+        if len(data):
+            self._append(timestamps, data)
+            self._reconstruct(final=False)
+            self._score(final=False)
+        return self._predict(final=False)
+
+    def flush(self):
+        """
+        数据结束时调用: 与离线一样用截断的窗口处理末尾的行, 返回剩余的所有行
+        :return: 同 update
+        """
+        if self.rows:
+            self._reconstruct(final=True)
+            self._score(final=True)
+        return self._predict(final=True)
+
+    def _append(self, timestamps, data):
+        if self._raw is None:
+            d = data.shape[1]
+            self._timestamps = timestamps[:0]
+            self._raw = np.zeros((0, d))
+            self._reconstructed = np.zeros((0, d))
+            self._reconstructing_weight = np.zeros((0,))
+            self._anomaly_score = np.zeros((0,))
+            self._anomaly_score_weight = np.zeros((0,))
+        elif data.shape[1] != self._raw.shape[1]:
+            raise Exception('dimension mismatches: %d, expected %d' % (data.shape[1], self._raw.shape[1]))
+        m, d = data.shape
+        self._timestamps = np.concatenate([self._timestamps, timestamps])
+        self._raw = np.concatenate([self._raw, data])
+        self._reconstructed = np.concatenate([self._reconstructed, np.zeros((m, d))])
+        self._reconstructing_weight = np.concatenate([self._reconstructing_weight, np.zeros((m,))])
+        self._anomaly_score = np.concatenate([self._anomaly_score, np.zeros((m,))])
+        self._anomaly_score_weight = np.concatenate([self._anomaly_score_weight, np.zeros((m,))])
+        self.rows += m
+        if not self._fixed_bounds:
+            low, high = data.min(axis=0), data.max(axis=0)
+            self._min = low if self._min is None else np.minimum(self._min, low)
+            self._max = high if self._max is None else np.maximum(self._max, high)
+
+    def _scaling(self):
+        # 与 data_process.normalization 相同, 常数维度归一化为 0.5
+        _range = self._max - self._min
+        constant = _range == 0
+        return np.where(constant, self._min - 0.5, self._min), np.where(constant, 1, _range)
+
+    def _normalized(self, begin, end):
+        shift, scale = self._scaling()
+        return (self._raw[begin - self._offset:end - self._offset] - shift) / scale
+
+    def _normalized_reconstructed(self, begin, end):
+        shift, scale = self._scaling()
+        return (self._reconstructed[begin - self._offset:end - self._offset] - shift) / scale
+
+    def _cycle_groups(self, index, final):
+        """
+        周期 index 中窗口使用的分组, cluster_ahead 时周期尚未结束返回 None
+        """
+        groups = self._groups.get(index)
+        if groups is not None:
+            return groups
+        if index == 0:
+            # 没有历史数据, 分组默认每个kpi一组
+            groups = [[i] for i in range(self._raw.shape[1])]
+        else:
+            cb = (index if self.cluster_ahead else index - 1) * self.cycle
+            ce = min(self.rows, cb + self.cycle)
+            if ce < cb + self.cycle and not final:
+                return None
+            groups = cluster(self._normalized(cb, ce), self.cluster_threshold)
+        # 之后的窗口不会再回到更早的周期
+        self._groups = {index: groups}
+        return groups
+
+    def _reconstruct(self, final):
+        n = self.rows
+        # 与离线一样, 最后一个窗口是第一个右端点到达数据末尾的窗口; 未结束时只处理完整窗口
+        windows = []
+        while (self._win_r < n) if final else (self._win_l + self.window <= n):
+            win_l = self._win_l
+            win_r = min(n, win_l + self.window)
+            groups = self._cycle_groups(win_l // self.cycle, final)
+            if groups is None:
+                break
+            windows.append((win_l - self._offset, win_r - self._offset, groups))
+            self._win_l += self.stride
+            self._win_r = win_r
+        if not windows:
+            return
+        # 窗口下标相对缓冲区, 缓冲区保留了采样参考的历史, 随机种子按绝对下标计算
+        # 每个窗口都从零开始重建 (不热启动), 结果与 online_workers 无关
+        data = self._normalized(self._offset, n)
+        if self.workers > 0:
+            results = reconstruct_windows(self.process, data, windows, self.sample_score_method, self.workers,
+                                          origin=self._offset)
+        else:
+            results = (_window_reconstruct(self.process, data, win_l, win_r, groups, self.sample_score_method,
+                                           origin=self._offset)
+                       for win_l, win_r, groups in windows)
+        # 以原始量纲加权平均, 归一化是仿射变换, 与归一化后再平均等价
+        shift, scale = self._scaling()
+        for (win_l, win_r, _), (rec_window, retries) in zip(windows, results):
+            self.retries += retries
+            rows = slice(win_l, win_r)
+            weight = self._reconstructing_weight[rows, None]
+            self._reconstructed[rows] = (self._reconstructed[rows] * weight + rec_window * scale + shift) / (weight + 1)
+            self._reconstructing_weight[rows] += 1
+        if self.workers > 0:
+            results.close()
+
+    def _score(self, final):
+        n = self.rows
+        # [0, self._win_l) 之前的行不会再被新的重建窗口覆盖, 重建结果已确定
+        ready = n if final else min(n, self._win_l)
+        while (self._det_r < n) if final else (self._det_l + self.det_window <= ready):
+            wb = self._det_l
+            we = min(n, wb + self.det_window)
+            score = anomaly_score_example(self._normalized(wb, we), self._normalized_reconstructed(wb, we))
+            rows = slice(wb - self._offset, we - self._offset)
+            weight = self._anomaly_score_weight[rows]
+            self._anomaly_score[rows] = (self._anomaly_score[rows] * weight + score) / (weight + 1)
+            self._anomaly_score_weight[rows] += 1
+            self._det_l += self.det_stride
+            self._det_r = we
+
+    def _predict(self, final):
+        # [0, self._det_l) 之前的行不会再被新的检测窗口覆盖, 得分已确定
+        if self._raw is None:
+            return np.zeros((0,)), np.zeros((0,)), np.zeros((0,)), np.zeros((0,), dtype=int)
+        scored = self.rows if final else min(self.rows, self._det_l)
+        begin = end = self._predicted
+        predict = []
+        while end < scored and (final or end + self.predict_window <= scored):
+            block = min(scored, end + self.predict_window)
+            predict.append(dynamic_threshold(self._anomaly_score[end - self._offset:block - self._offset]))
+            end = block
+        self._predicted = end
+        rows = slice(begin - self._offset, end - self._offset)
+        result = (
+            self._timestamps[rows],
+            self._raw[rows, 0],
+            self._anomaly_score[rows],
+            np.concatenate(predict) if predict else np.zeros((0,), dtype=int)
+        )
+        self._trim()
+        return result
+
+    def _trim(self):
+        # 之后仍会用到的最早一行: 下一个窗口的采样参考历史、聚类所需的周期、未确定的得分和预测
+        index = self._win_l // self.cycle
+        if not self.cluster_ahead and index not in self._groups:
+            index -= 1
+        keep = min(
+            max(0, self._win_l - self.latest_windows),
+            max(0, index) * self.cycle,
+            self._det_l,
+            self._predicted
+        )
+        drop = keep - self._offset
+        if drop <= 0:
+            return
+        self._timestamps = self._timestamps[drop:]
+        self._raw = self._raw[drop:]
+        self._reconstructed = self._reconstructed[drop:]
+        self._reconstructing_weight = self._reconstructing_weight[drop:]
+        self._anomaly_score = self._anomaly_score[drop:]
+        self._anomaly_score_weight = self._anomaly_score_weight[drop:]
+        self._offset = keep
+
+
+# 本进程中每个文件的增量检测会话: data_path -> (会话, 会话第一行在文件中的行号, 该文件的 CSVTailer)
+_sessions = {}
+
+
+def _write_anomalies(timestamps, values, anomaly_score, predict, metric_name, data_path, output_path, sink):
+    anomalies = []
+    for i in np.flatnonzero(predict):
+        anomaly_timestamp = timestamps[i]
+        anomaly_value = values[i]
+        score = anomaly_score[i]
+        print(f"Anomaly detected at {anomaly_timestamp} with value: {anomaly_value} and score: {score}")
+        anomalies.append(AnomalyRecord(anomaly_timestamp, metric_name, None, anomaly_value, score, 'jumpstarter'))
+
+    if sink is not None:
+        sink.write(anomalies, key=data_path)
+    elif anomalies:
+        with open(output_path, 'a') as f:
+            f.writelines(record.to_csv_line() for record in anomalies)
+
+
+def detect_incremental(data_path, output_path, metric_name, config_dict, last_line=0, sink=None):
+    """
+    用本进程中该文件的 JumpStarterSession 检测 last_line 之后的新数据
+    会话旁保存该文件的 CSVTailer, 每次只从上次的字节偏移解析新增的完整行, 未写完的最后一行留到下次
+    last_line 与会话已处理的行数不一致时 (例如从检查点恢复) 从 last_line 开始新的会话;
+    文件被截断或替换时 tailer 从头读起, 会话也从头开始
+    :return: 已处理的数据行数, 供调用方作为下一次的 last_line
+    """
+    session, first_line, tailer = _sessions.get(data_path, (None, last_line, None))
+    if session is None or first_line + session.rows != last_line:
+        session, first_line, tailer = JumpStarterSession(config_dict), last_line, CSVTailer()
+        _sessions[data_path] = (session, first_line, tailer)
+
+    if not os.path.exists(data_path):
+        print(f"Error reading data from {data_path}: file not found")
+        return last_line
+    try:
+        new_df = tailer.read(data_path, skip_rows=last_line)
+    except Exception as e:
+        print(f"Error reading data from {data_path}: {e}")
+        return last_line
+    rows = tailer.rows(data_path)
+    if rows != last_line + len(new_df):
+        # tailer 没有停在 last_line 之后 (文件被截断、替换或不足 last_line 行), 会话从 tailer 的位置重新开始
+        session, first_line = JumpStarterSession(config_dict), rows - len(new_df)
+        _sessions[data_path] = (session, first_line, tailer)
+    if new_df.empty:
+        return rows
+
+    timestamps = new_df.iloc[:, 0].values
+    data = new_df.iloc[:, 1:].select_dtypes(include=np.number).to_numpy(dtype=float)
+    _write_anomalies(*session.update(timestamps, data), metric_name, data_path, output_path, sink)
+    return rows
+
+
+def detect(data_path, output_path, metric_name, last_line=0, sink=None, incremental=None):
+    """
+    在线检测 data_path 中 last_line 之后的新数据
+    :param sink: 可选的 AnomalySink, 异常写入其队列(以 data_path 计数)而不是直接追加 output_path
+    :param incremental: 是否使用增量会话 detect_incremental, 默认取配置 detector_arguments.incremental
+    :return: 文件当前的数据行数, 供调用方作为下一次的 last_line
+    """
     config = 'anomaly_detection/detector/detector-config.yml'
     with open(config, 'r', encoding='utf8') as file:
         config_dict = yaml.load(file, Loader=yaml.Loader)
+    if incremental is None:
+        incremental = config_dict['detector_arguments'].get('incremental', False)
+    if incremental:
+        return detect_incremental(data_path, output_path, metric_name, config_dict, last_line=last_line, sink=sink)
 
     # Read the raw data to get timestamps and original values for the output
     try:
         raw_df = pd.read_csv(data_path)
     except Exception as e:
         print(f"Error reading data from {data_path}: {e}")
-        return
+        return last_line
 
     # Slice for new data since the last run
     if last_line >= len(raw_df):
-        return
+        return len(raw_df)
     processed_df = raw_df.iloc[last_line:]
 
     # Separate timestamps and values
@@ -195,7 +660,7 @@ def detect(data_path, output_path, metric_name, last_line=0):
     n, d = data.shape
     
     # Normalize each dimension
-    data = data.values
+    data = data.to_numpy(dtype=float, copy=True)
     for i in range(d):
         data[:, i] = data_process.normalization(data[:, i])
 
@@ -208,6 +673,12 @@ def detect(data_path, output_path, metric_name, last_line=0):
     scale = config_dict['detector_arguments']['scale']
     retry_limit = config_dict['detector_arguments']['retry_limit']
     random_state = config_dict['global']['random_state']
+    # 重建求解器
+    solver = config_dict['detector_arguments'].get('solver', 'cvxpy')
+    solver_max_iter = config_dict['detector_arguments'].get('solver_max_iter', 1000)
+    solver_tol = config_dict['detector_arguments'].get('solver_tol', 1e-3)
+    # 并行重建的工作进程数, 0 表示在当前进程中逐个重建
+    online_workers = config_dict['detector_arguments'].get('online_workers', 0)
 
     # Get clustered group
     cluster_threshold = config_dict['detector_arguments']['cluster_threshold']
@@ -236,41 +707,46 @@ def detect(data_path, output_path, metric_name, last_line=0):
         cb += cycle
 
     # 采样 & 重建
+    # 数据通过参数 (或共享内存) 传给重建方法, process 不持有数据, 随任务 pickle 的开销很小
     process = WindowReconstructProcess(
-        data=data,
+        data=None,
         cycle=cycle,
         latest_windows=latest_windows,
         sample_rate=sample_rate,
         scale=scale, rho=rho, sigma=sigma,
         random_state=random_state,
-        retry_limit=retry_limit
+        retry_limit=retry_limit,
+        solver=solver,
+        solver_max_iter=solver_max_iter,
+        solver_tol=solver_tol
     )
     # 重建的数据
     reconstructed = np.zeros((n, d))
     reconstructing_weight = np.zeros((n,))
     needed_weight = np.zeros((n,))
     total_retries = 0
+    windows = []
     win_l = 0
     win_r = 0
-    pbar = tqdm(total=n)
     while win_r < n:
         win_r = min(n, win_l + window)
-        group = cycle_groups[win_l // cycle]
+        windows.append((win_l, win_r, cycle_groups[win_l // cycle]))
         needed_weight[win_l:win_r] += 1
+        win_l += stride
 
-        # 采样概率
-        hb = max(0, win_l - latest_windows)
-        latest = data[hb:win_l]
-        window_data = data[win_l:win_r]
-        sample_score = online_lesinn(window_data, latest)
-        print(sample_score)
-        rec_window, retries = \
-            process.window_sample_reconstruct(
-                data=window_data,
-                groups=group,
-                score=sample_score,
-                random_state=random_state * win_l * win_r % max_seed
-            )
+    # 采样概率使用固定的随机种子, 每个窗口的结果与执行的进程和顺序无关
+    score_method = partial(online_lesinn, random_state=random_state)
+    results = None
+    if online_workers > 0:
+        # 按窗口顺序取结果合并, 加权平均与逐个重建完全相同
+        results = reconstruct_windows(process, data, windows, score_method, online_workers)
+    pbar = tqdm(total=n)
+    for win_l, win_r, group in windows:
+        if results is not None:
+            rec_window, retries = next(results)
+        else:
+            # 不用上一个窗口的结果热启动 admm, 与工作进程中的重建完全相同
+            rec_window, retries = _window_reconstruct(process, data, win_l, win_r, group, score_method)
         total_retries += retries
         for index in range(rec_window.shape[0]):
             w = index + win_l
@@ -279,10 +755,12 @@ def detect(data_path, output_path, metric_name, last_line=0):
                 (reconstructed[w, :] * weight +
                  rec_window[index]) / (weight + 1)
         reconstructing_weight[win_l:win_r] += 1
-        win_l += stride
         pbar.update(stride)
 
     pbar.close()
+    if results is not None:
+        # 释放共享内存
+        results.close()
 
     # 预测
     # 异常得分
@@ -309,17 +787,31 @@ def detect(data_path, output_path, metric_name, last_line=0):
     predict = sliding_anomaly_predict(anomaly_score)
 
     # Format and save anomalies in the desired format
-    anomalies = []
-    for i, is_anomaly in enumerate(predict):
-        if is_anomaly:
-            anomaly_timestamp = timestamps[i]
-            anomaly_value = original_values_for_output[i]
-            score = anomaly_score[i]
-            print(f"Anomaly detected at {anomaly_timestamp} with value: {anomaly_value} and score: {score}")
-            anomalies.append(f"{anomaly_timestamp},{metric_name},{anomaly_value},{score}\n")
-
-    if anomalies:
-        with open(output_path, 'a') as f:
-            f.writelines(anomalies)
+    _write_anomalies(timestamps, original_values_for_output, anomaly_score, predict, metric_name, data_path,
+                     output_path, sink)
 
     print("Done")
+    return len(raw_df)
+
+
+class _RecordCollector:
+    """
+    代替 AnomalySink 收集 detect 产生的异常记录, 用于工作进程
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def write(self, records, key=None):
+        self.records.extend(records)
+
+
+def detect_records(data_path, metric_name, last_line=0, incremental=None):
+    """
+    在工作进程中运行 detect, 异常记录返回给父进程写入, 而不是在子进程中写文件
+    增量会话保存在工作进程中, StickyProcessPool 保证同一文件总在同一个工作进程上检测
+    :return: (文件当前的数据行数, 异常记录 AnomalyRecord 列表)
+    """
+    collector = _RecordCollector()
+    rows = detect(data_path, None, metric_name, last_line=last_line, sink=collector, incremental=incremental)
+    return rows, collector.records
@@ -1,4 +1,5 @@
 import argparse
+import json
 import sys
 import os
 
@@ -11,6 +12,8 @@ import numpy as np
 import pandas as pd
 import yaml
 
+from anomaly_utils.trace_archive import read_table
+
 
 def anomaly_score_example(source: np.array, reconstructed: np.array):
     """
@@ -97,6 +100,7 @@ def read_config(config: dict):
         scale, rho, sigma, \
         retry_limit, \
         without_grouping, without_localize_sampling, \
+        solver, solver_max_iter, solver_tol, \
         data_path, rb, re, cb, ce, header, rec_windows_per_cycle, \
         label_path, save_path, \
         anomaly_score_example_percentage, anomaly_distance_topn
@@ -178,6 +182,9 @@ def read_config(config: dict):
     without_localize_sampling = bool(
         detector_config['without_localize_sampling']
     )
+    solver = detector_config.get('solver', 'cvxpy')
+    solver_max_iter = int(detector_config.get('solver_max_iter', 1000))
+    solver_tol = float(detector_config.get('solver_tol', 1e-3))
 
 
 def run(data: pd.DataFrame):
@@ -190,7 +197,7 @@ def run(data: pd.DataFrame):
     if n < rec_window * rec_windows_per_cycle:
         raise Exception('data point count less than 1 cycle')
     
-    data = data.values
+    data = data.to_numpy(dtype=float, copy=True)
     for i in range(d):
         data[:, i] = normalization(data[:, i].astype(float))
 
@@ -211,7 +218,10 @@ def run(data: pd.DataFrame):
         random_state=random_state,
         retry_limit=retry_limit,
         without_grouping=without_grouping,
-        without_localize_sampling=without_localize_sampling
+        without_localize_sampling=without_localize_sampling,
+        solver=solver,
+        solver_max_iter=solver_max_iter,
+        solver_tol=solver_tol
     )
     rec, retries = detector.reconstruct(
         data, rec_window, rec_windows_per_cycle, rec_stride
@@ -220,8 +230,17 @@ def run(data: pd.DataFrame):
         data, rec, det_window, det_stride
     )
     print('retries:', retries)
+    metrics = detector.metrics
+    print(
+        'tot: %f\ncycle_feature: %f\nreconstruct: %f\ndata_process: %f\nwait_syn: %f\nrec: %f\n'
+        'sample_scoring: %f'
+        % (metrics['tot'], metrics['cycle_feature'], metrics['reconstruct'], metrics['data_process'],
+           metrics['wait_syn'], metrics['rec'], metrics['sample_scoring'])
+    )
     np.savetxt(save_path + '_rec.txt', rec, '%.6f', ',')
     np.savetxt(save_path + '_score.txt', score, '%.6f', ',')
+    with open(save_path + '_metrics.json', 'w') as f:
+        json.dump(metrics, f, indent=4)
     label = np.loadtxt(label_path, dtype=int, delimiter=',', skiprows=1)
     
     # # Online choosing threshold 
@@ -248,4 +267,4 @@ if __name__ == '__main__':
         config_dict = yaml.load(file)
     read_config(config_dict)
     
-    run(pd.read_csv(data_path, header=header).iloc[rb:re, cb:ce])
+    run(read_table(data_path, header=header).iloc[rb:re, cb:ce])
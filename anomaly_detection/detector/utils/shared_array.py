@@ -0,0 +1,78 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+
+def _attach(name):
+    # python 3.13 起挂载方可以不登记到 resource_tracker, 避免工作进程退出时误删共享内存
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedArray():
+    """
+    放在共享内存中的 numpy 数组
+    创建者把数据写入一次, 工作进程用 spec() 按名字挂载, 不需要为每个任务 pickle 一份数据
+    创建者 close 时释放共享内存, 挂载者 close 只断开映射
+    close 之前需要释放 array 的所有视图, 工作进程应拷贝出需要的切片再 close
+    """
+
+    def __init__(self, shape: tuple, dtype=float, name: str = None):
+        """
+        :param shape: 数组形状
+        :param dtype: 数据类型
+        :param name: 已有共享内存的名字, 为 None 时新建
+        """
+        self.shape = tuple(int(each) for each in shape)
+        self.dtype = np.dtype(dtype)
+        self._owner = name is None
+        if self._owner:
+            size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = _attach(name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @classmethod
+    def copy_of(cls, array: np.array):
+        """
+        新建共享内存并拷贝 array
+        """
+        array = np.ascontiguousarray(array)
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec: tuple):
+        """
+        在工作进程中挂载 spec() 描述的共享数组
+        """
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def spec(self):
+        """
+        可以 pickle 的描述 (名字, 形状, 类型), 用于传给工作进程
+        """
+        return self.name, self.shape, self.dtype.str
+
+    def close(self):
+        if self._shm is None:
+            return
+        self.array = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
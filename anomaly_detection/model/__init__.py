@@ -1,9 +1,32 @@
 """
 异常检测算法模型模块
+
+检测器类在第一次访问时才导入 (PEP 562), 例如只用到 EWMA 时不会加载 scipy;
+按映射文件中的算法名创建检测器见 model.registry
 """
 
-from .spot import SpotDetector
-from .three_sigma import ThreeSigmaDetector
-from .ewmacontrol_three_sigma import EWMAControlThreeSigmaDetector
-from .knn import KNNDetector
-__all__ = ['SpotDetector', 'ThreeSigmaDetector', 'EWMAControlThreeSigmaDetector', 'KNNDetector']
\ No newline at end of file
+import importlib
+
+# 导出名 -> 定义它的子模块
+_EXPORTS = {
+    'SpotDetector': '.spot',
+    'ThreeSigmaDetector': '.three_sigma',
+    'EWMAControlThreeSigmaDetector': '.ewmacontrol_three_sigma',
+    'KNNDetector': '.knn',
+    'EWMADetectorBank': '.detector_bank',
+}
+
+__all__ = ['SpotDetector', 'ThreeSigmaDetector', 'EWMAControlThreeSigmaDetector', 'KNNDetector', 'EWMADetectorBank']
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,4 +1,6 @@
-from anomaly_utils.stream_generator import StreamGenerator
+from anomaly_utils.stream_generator import StreamGenerator, TAILER_READ_BYTES
+from anomaly_utils.csv_tailer import CSVTailer
+from anomaly_utils.anomaly_store import AnomalyRecord
 import pandas as pd
 import numpy as np
 import os
@@ -20,56 +22,159 @@ def parse_metric_name(file_path):
     metric_name = os.path.splitext(filename)[0]
     return metric_name
 
-def detect(model, data_path, output_path, metric_name, has_pid = 0, last_line=0):
+def detect(model, data_path, output_path, metric_name, has_pid = 0, last_line=0, tailer=None, sink=None,
+           rollup=None, read_bytes=TAILER_READ_BYTES):
     """
     Detect anomalies in a data file.
 
+    The new rows are streamed from the tailer block by block; scores, labels
+    and anomaly records are produced per block, so a large backlog never has
+    to be held in memory at once.
+
     Args:
         model: The anomaly detection model instance.
         data_path (str): Path to the data file (CSV).
         output_path (str): Path to write anomalies to.
         metric_name (str): Name of the metric being monitored.
         last_line (int): The last line number that was processed.
+        tailer (CSVTailer, optional): Incremental reader keeping the byte offset
+            of data_path. When given only the bytes appended since the previous
+            call are parsed and last_line is used solely to position a file the
+            tailer has not seen yet. Defaults to a fresh tailer positioned
+            after last_line.
+        sink (AnomalySink, optional): Shared writer the anomaly records are
+            queued to (counted under data_path) instead of appending to
+            output_path.
+        rollup (PidRollup, optional): Per-PID anomaly summary updated when
+            has_pid is 1.
+        read_bytes (int, optional): Bytes of the file parsed at a time.
+            Defaults to 16 MiB.
+
+    Returns:
+        int: Number of new data rows consumed.
     """
+    rows = 0
     try:
         # Parse the metric name to get clean name
         clean_metric_name = parse_metric_name(metric_name)
-        
-        # Read new data from the file
-        df = pd.read_csv(data_path, header=0, skiprows=range(1, last_line + 1))
-        if df.empty:
-            return
-
-        # Assuming the first column is timestamp, second is value, third is pid (ignored for detection)
-        timestamp_column = df.columns[0]
-        metric_column = df.columns[1]
-        if has_pid == 1:
-            metric_column = df.columns[2]
-        # Note: df.columns[2] would be 'Pid' but we don't use it for anomaly detection
-        ds = df[metric_column].values.tolist()
-        ds = np.array(ds)
-        ds_nested = np.expand_dims(ds, axis=1)
-        
-        
-        stream = StreamGenerator(ds_nested)
-
-        anomalies = []
-        for index, x in enumerate(stream.iter_item()):
-            score = model.fit_score(x)
-            anomaly = model.predict(score) # 0: normal, 1: anomaly
-            if anomaly: 
-                anomaly_timestamp = df[timestamp_column].iloc[index]
-                anomaly_value = x[0]
-                print(f"Anomaly detected at {anomaly_timestamp} metric: {clean_metric_name}")
-                if(has_pid == 0):
-                    anomalies.append(f"{anomaly_timestamp},{clean_metric_name},{anomaly_value},{score}\n")
+        if tailer is None:
+            tailer = CSVTailer()
+
+        # Blocks are records of every column: timestamp, [Pid,] metric
+        stream = StreamGenerator.from_tailer(tailer, data_path, skip_rows=last_line, read_bytes=read_bytes,
+                                             records=True)
+        for block in stream.iter_batch():
+            rows += len(block)
+            try:
+                names = block.dtype.names
+                ds = np.array(block[names[2] if has_pid == 1 else names[1]].tolist())
+                if hasattr(model, 'fit_score_batch'):
+                    # Same results as the per-point loop below
+                    scores, labels = model.fit_score_batch(np.expand_dims(ds, axis=1))
                 else:
-                    anomalies.append(f"{anomaly_timestamp},{clean_metric_name},{df.iloc[index]['Pid']}, {anomaly_value},{score}\n")
-        if anomalies:
-            with open(output_path, 'a') as f:
-                f.writelines(anomalies)
+                    scores, labels = [], []
+                    for x in np.expand_dims(ds, axis=1):
+                        score = model.fit_score(x)
+                        scores.append(score)
+                        labels.append(model.predict(score)) # 0: normal, 1: anomaly
+
+                pids = block[names[1]] if has_pid == 1 else None
+                emit_anomalies(block[names[0]], pids, ds, scores, labels, clean_metric_name, type(model).__name__,
+                               data_path, output_path, has_pid, sink, rollup)
+            except Exception as e:
+                print(f"Error during detection: {e}")
     except Exception as e:
         print(f"Error during detection: {e}")
+    return rows
+
+def detect_bank(bank, data_paths, output_path, processed_rows, has_pid=0, tailer=None, sink=None, rollup=None):
+    """
+    Detect anomalies in several data files with a single detector bank step.
+
+    Args:
+        bank (EWMADetectorBank): Bank holding one registered stream per data file.
+        data_paths (list): Data files (CSV) to read new rows from.
+        output_path (str): Path to write anomalies to.
+        processed_rows (dict): Data file -> rows already processed, see
+            the last_line argument of detect().
+        has_pid (int): Whether the files have a Pid column before the metric.
+        tailer (CSVTailer, optional): Incremental reader, see detect().
+        sink (AnomalySink, optional): Shared anomaly writer, see detect().
+        rollup (PidRollup, optional): Per-PID anomaly summary, see detect().
+
+    Returns:
+        dict: Data file -> number of new data rows consumed.
+    """
+    rows = {}
+    frames = {}
+    for data_path in data_paths:
+        rows[data_path] = 0
+        try:
+            df = read_new_rows(data_path, processed_rows.get(data_path, 0), tailer)
+        except Exception as e:
+            print(f"Error during detection: {e}")
+            continue
+        rows[data_path] = len(df)
+        if not df.empty:
+            frames[data_path] = (df, metric_values(df, has_pid))
+
+    try:
+        results = bank.step({data_path: ds for data_path, (_, ds) in frames.items()})
+        for data_path, (df, ds) in frames.items():
+            scores, labels = results[data_path]
+            pids = df['Pid'].to_numpy() if has_pid == 1 else None
+            emit_anomalies(df[df.columns[0]].to_numpy(), pids, ds, scores, labels, parse_metric_name(data_path),
+                           bank.detector_name, data_path, output_path, has_pid, sink, rollup)
+    except Exception as e:
+        print(f"Error during detection: {e}")
+    return rows
+
+def read_new_rows(data_path, last_line=0, tailer=None):
+    """Rows of data_path after the first last_line data rows (or new to the tailer)."""
+    if tailer is not None:
+        return tailer.read(data_path, skip_rows=last_line)
+    return pd.read_csv(data_path, header=0, skiprows=range(1, last_line + 1))
+
+def metric_values(df, has_pid=0):
+    """
+    Values of the monitored metric column.
+
+    The first column is the timestamp, then the value, or Pid then value when
+    has_pid is 1 (Pid is not used for detection).
+    """
+    metric_column = df.columns[2] if has_pid == 1 else df.columns[1]
+    return np.array(df[metric_column].values.tolist())
+
+def emit_anomalies(timestamps, pids, ds, scores, labels, clean_metric_name, detector_name, data_path, output_path,
+                   has_pid=0, sink=None, rollup=None):
+    """
+    Write the rows labelled as anomalies to the sink or output_path.
+
+    timestamps, pids (None unless has_pid is 1), ds, scores and labels are
+    aligned per row.
+
+    The anomaly rows are selected with a mask and their timestamps, values,
+    scores and PIDs gathered with array indexing, instead of per-row pandas
+    lookups, so anomaly storms stay cheap.
+    """
+    index = np.flatnonzero(np.asarray(labels))
+    if not len(index):
+        return
+    timestamps = np.asarray(timestamps)[index].tolist()
+    values = np.asarray(ds)[index].tolist()
+    anomaly_scores = np.asarray(scores)[index].tolist()
+    pids = np.asarray(pids)[index].tolist() if has_pid == 1 else [None] * len(index)
+
+    print('\n'.join(f"Anomaly detected at {timestamp} metric: {clean_metric_name}" for timestamp in timestamps))
+    anomalies = [AnomalyRecord(timestamp, clean_metric_name, pid, value, score, detector_name)
+                 for timestamp, pid, value, score in zip(timestamps, pids, values, anomaly_scores)]
+    if rollup is not None and has_pid == 1:
+        rollup.update(clean_metric_name, pids, values, timestamps)
+    if sink is not None:
+        sink.write(anomalies, key=data_path)
+    elif anomalies:
+        with open(output_path, 'a') as f:
+            f.writelines(record.to_csv_line() for record in anomalies)
 
 if __name__ == '__main__':
     # Example usage for testing
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+多流 EWMA 控制图检测器组
+以结构数组 (struct-of-arrays) 保存 N 条单变量流的状态，一次向量化更新所有有新数据的流
+"""
+
+import math
+
+import numpy as np
+
+from base.rolling import RollingMoments
+from .ewmacontrol_three_sigma import EWMAControlThreeSigmaDetector
+
+
+class EWMADetectorBank:
+    """
+    EWMAControlThreeSigmaDetector 的批量版本
+
+    每条流的参数（sigma 倍数、窗口、alpha、data_pre_required）和状态（滑动
+    窗口环形缓冲、平移后的累积和、EWMA 均值/标准差、计数）存放在按槽位
+    索引的 numpy 数组中。参数优化完成前，流由一个普通的
+    EWMAControlThreeSigmaDetector 逐点处理；优化完成后其状态迁入数组，
+    之后按时间步对所有活跃流同时更新。每条流的分数与单独使用
+    EWMAControlThreeSigmaDetector 的结果逐位一致。
+
+    适合流很多、每个周期每条流只有少量新数据的场景（例如按 op 类型和客户端
+    拆分的延迟文件）。
+    """
+
+    # 写入异常记录时使用的检测器名称，与逐个对象检测时一致
+    detector_name = EWMAControlThreeSigmaDetector.__name__
+
+    def __init__(self, capacity: int = 16, max_window: int = 80):
+        """
+        初始化检测器组
+
+        Args:
+            capacity (int): 初始槽位数，不足时自动扩容，默认16
+            max_window (int): 初始环形缓冲宽度，遇到更大窗口时自动扩容，默认80
+        """
+        self._slots = {}
+        self._free = []
+        # 仍在预热 / 参数优化阶段的流
+        self._warming = {}
+        self._allocate(capacity, max_window)
+
+    def _allocate(self, capacity, width):
+        """按新的容量和缓冲宽度重新分配数组，保留已有内容"""
+        old = getattr(self, '_buffer', None)
+        fields = {
+            'sigma': np.float64, 'window': np.int64, 'alpha': np.float64, 'dpr': np.int64,
+            'auto_optimize': bool, 'mean': np.float64, 'std': np.float64, 'count': np.int64,
+            'head': np.int64, 'filled': np.int64, 'shift': np.float64, 'sum': np.float64,
+            'sum_sq': np.float64, 'since_anchor': np.int64, 'reanchor_every': np.int64,
+        }
+        arrays = {}
+        for name, dtype in fields.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                array[:len(self._state[name])] = self._state[name]
+            arrays[name] = array
+        buffer = np.zeros((capacity, width))
+        if old is not None:
+            buffer[:old.shape[0], :old.shape[1]] = old
+        self._state = arrays
+        self._buffer = buffer
+        start = 0 if old is None else old.shape[0]
+        self._free.extend(range(capacity - 1, start - 1, -1))
+
+    def __len__(self) -> int:
+        return len(self._slots) + len(self._warming)
+
+    def __contains__(self, key) -> bool:
+        return key in self._slots or key in self._warming
+
+    def keys(self) -> list:
+        """所有已注册流的键"""
+        return list(self._slots) + list(self._warming)
+
+    def register(self, key, sigma_multiplier=3.0, window_size=50, alpha=0.1,
+                 data_pre_required=100, auto_optimize=True):
+        """
+        注册一条新流，参数含义同 EWMAControlThreeSigmaDetector
+
+        Args:
+            key: 流的标识，通常为数据文件路径
+        """
+        self.add_detector(key, EWMAControlThreeSigmaDetector(
+            sigma_multiplier=sigma_multiplier, window_size=window_size, alpha=alpha,
+            data_pre_required=data_pre_required, auto_optimize=auto_optimize))
+
+    def add_detector(self, key, detector: EWMAControlThreeSigmaDetector):
+        """
+        以已有检测器（例如从检查点恢复的）的状态注册一条流
+
+        Args:
+            key: 流的标识
+            detector (EWMAControlThreeSigmaDetector): 提供参数与状态的检测器
+        """
+        self.remove(key)
+        if detector.auto_optimize and not detector.optimized:
+            self._warming[key] = detector
+        else:
+            self._migrate(key, detector)
+
+    def remove(self, key):
+        """注销一条流"""
+        self._warming.pop(key, None)
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._free.append(slot)
+
+    def _migrate(self, key, detector):
+        """把检测器状态写入数组槽位"""
+        if not self._free:
+            self._allocate(2 * len(self._state['mean']), self._buffer.shape[1])
+        if detector.window_size > self._buffer.shape[1]:
+            self._allocate(len(self._state['mean']), detector.window_size)
+        slot = self._free.pop()
+        self._slots[key] = slot
+
+        rolling = detector.rolling.__getstate__()
+        values = rolling['_buffer']
+        state = self._state
+        state['sigma'][slot] = detector.sigma_multiplier
+        state['window'][slot] = detector.window_size
+        state['alpha'][slot] = detector.alpha
+        state['dpr'][slot] = detector.data_pre_required
+        state['auto_optimize'][slot] = detector.auto_optimize
+        state['mean'][slot] = detector.mean
+        state['std'][slot] = detector.std
+        state['count'][slot] = detector.count
+        state['head'][slot] = 0
+        state['filled'][slot] = len(values)
+        state['shift'][slot] = rolling['_shift']
+        state['sum'][slot] = rolling['_sum']
+        state['sum_sq'][slot] = rolling['_sum_sq']
+        state['since_anchor'][slot] = rolling['_since_anchor']
+        state['reanchor_every'][slot] = rolling['reanchor_every']
+        self._buffer[slot, :len(values)] = values
+
+    def to_detector(self, key) -> EWMAControlThreeSigmaDetector:
+        """
+        导出一条流的等价检测器（用于检查点或单独使用）
+
+        Returns:
+            EWMAControlThreeSigmaDetector: 状态与该流一致的检测器
+        """
+        if key in self._warming:
+            return self._warming[key]
+        slot = self._slots[key]
+        state = {name: values[slot].item() for name, values in self._state.items()}
+        detector = EWMAControlThreeSigmaDetector(
+            sigma_multiplier=state['sigma'], window_size=state['window'], alpha=state['alpha'],
+            data_pre_required=state['dpr'], auto_optimize=state['auto_optimize'])
+        detector.optimized = state['auto_optimize']
+        detector.mean = state['mean']
+        detector.std = state['std']
+        detector.count = state['count']
+        rolling = RollingMoments(state['window'])
+        rolling.__setstate__(dict(
+            rolling.__dict__,
+            _buffer=self._ordered_values(slot),
+            _head=0,
+            _count=state['filled'],
+            _shift=state['shift'],
+            _sum=state['sum'],
+            _sum_sq=state['sum_sq'],
+            _since_anchor=state['since_anchor'],
+            reanchor_every=state['reanchor_every'],
+        ))
+        detector.rolling = rolling
+        return detector
+
+    def _ordered_values(self, slot) -> np.ndarray:
+        """槽位窗口内的数据，按时间先后排列"""
+        window = self._state['window'][slot]
+        index = (self._state['head'][slot] + np.arange(self._state['filled'][slot])) % window
+        return self._buffer[slot, index]
+
+    def step(self, values_by_key: dict) -> dict:
+        """
+        处理各条流新到达的数据
+
+        Args:
+            values_by_key (dict): 流的标识 -> 按时间排列的新观测值
+
+        Returns:
+            dict: 流的标识 -> (scores, labels)，与逐点调用 fit_score/predict 的结果一致
+        """
+        results = {}
+        pending = {}
+        for key, values in values_by_key.items():
+            values = np.asarray(values)
+            values = values.reshape(len(values), -1)[:, 0]
+            n = len(values)
+            scores = np.zeros(n)
+            labels = np.zeros(n, dtype=int)
+            results[key] = (scores, labels)
+
+            start = 0
+            detector = self._warming.get(key)
+            if detector is not None:
+                # 参数优化完成前逐点处理，完成后迁入数组
+                while start < n and not detector.optimized:
+                    score = detector.fit_score(values[start:start + 1])
+                    scores[start] = score
+                    labels[start] = detector.predict(score)
+                    start += 1
+                if detector.optimized:
+                    del self._warming[key]
+                    self._migrate(key, detector)
+            if start < n and key in self._slots:
+                pending[key] = (values[start:].astype(float), start)
+
+        if pending:
+            self._step_vectorized(pending, results)
+        return results
+
+    def _step_vectorized(self, pending, results):
+        # 按新数据量降序排列，第 t 步的活跃流恰好是前缀
+        keys = sorted(pending, key=lambda k: -len(pending[k][0]))
+        slots = np.array([self._slots[k] for k in keys])
+        lengths = np.array([len(pending[k][0]) for k in keys])
+        k, steps = len(keys), lengths[0]
+        data = np.zeros((k, steps))
+        for row, key in enumerate(keys):
+            data[row, :lengths[row]] = pending[key][0]
+
+        local = {name: values[slots].copy() for name, values in self._state.items()}
+        buffer = self._buffer[slots].copy()
+        scores = np.zeros((k, steps))
+        rows = np.arange(k)
+
+        shift, total, total_sq = local['shift'], local['sum'], local['sum_sq']
+        filled, head, window = local['filled'], local['head'], local['window']
+        mean, std, count = local['mean'], local['std'], local['count']
+        alpha, dpr, since = local['alpha'], local['dpr'], local['since_anchor']
+
+        active = k
+        for t in range(steps):
+            while lengths[active - 1] <= t:
+                active -= 1
+            a = slice(0, active)
+            x = data[a, t]
+
+            # RollingMoments.push
+            shift[a] = np.where(filled[a] == 0, x, shift[a])
+            y_new = x - shift[a]
+            full = filled[a] == window[a]
+            y_old = np.where(full, buffer[rows[a], head[a]] - shift[a], 0.0)
+            position = np.where(full, head[a], (head[a] + filled[a]) % window[a])
+            buffer[rows[a], position] = x
+            head[a] = np.where(full, (head[a] + 1) % window[a], head[a])
+            filled[a] += ~full
+            total[a] = total[a] + (y_new - y_old)
+            total_sq[a] = total_sq[a] + (y_new * y_new - y_old * y_old)
+            since[a] += 1
+            for row in np.nonzero(since[a] >= local['reanchor_every'][a])[0]:
+                self._reanchor(local, buffer, row)
+
+            # RollingMoments.mean / std
+            current_mean = shift[a] + total[a] / filled[a]
+            var = (total_sq[a] - total[a] * total[a] / filled[a]) / filled[a]
+            current_std = np.sqrt(np.where(var > 0, var, 0.0))
+
+            # 指数移动平均更新
+            update = count[a] >= dpr[a]
+            first = update & (count[a] == 0)
+            new_mean = (1 - alpha[a]) * mean[a] + alpha[a] * current_mean
+            new_std = (1 - alpha[a]) * std[a] + alpha[a] * current_std
+            mean[a] = np.where(first, current_mean, np.where(update, new_mean, mean[a]))
+            std[a] = np.where(first, current_std, np.where(update, new_std, std[a]))
+            count[a] += 1
+
+            valid = (count[a] >= dpr[a]) & (std[a] != 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z_score = np.abs(x - mean[a]) / std[a]
+            scores[a, t] = np.where(valid, z_score, 0.0)
+
+        for name, values in local.items():
+            self._state[name][slots] = values
+        self._buffer[slots] = buffer
+        labels = scores > local['sigma'][:, None]
+        for row, key in enumerate(keys):
+            start = pending[key][1]
+            out_scores, out_labels = results[key]
+            out_scores[start:] = scores[row, :lengths[row]]
+            out_labels[start:] = labels[row, :lengths[row]]
+
+    @staticmethod
+    def _reanchor(local, buffer, row):
+        """RollingMoments._reanchor 的单流版本"""
+        filled = local['filled'][row]
+        index = (local['head'][row] + np.arange(filled)) % local['window'][row]
+        values = buffer[row, index]
+        shift = float(values[-1]) if filled == 1 else local['shift'][row] + local['sum'][row] / filled
+        shifted = (values - shift).tolist()
+        local['shift'][row] = shift
+        local['sum'][row] = math.fsum(shifted)
+        local['sum_sq'][row] = math.fsum(y * y for y in shifted)
+        local['since_anchor'][row] = 0
@@ -4,8 +4,11 @@
 基于test-time参数优化的轻量级实现
 """
 
+import threading
+
 import numpy as np
 from base.detector import BaseDetector
+from base.rolling import RollingMoments
 
 
 class EWMAControlThreeSigmaDetector(BaseDetector):
@@ -15,7 +18,8 @@ class EWMAControlThreeSigmaDetector(BaseDetector):
                  window_size=50,
                  alpha=0.1,
                  data_pre_required=100,
-                 auto_optimize=True):
+                 auto_optimize=True,
+                 async_optimize=False):
         """
         初始化检测器
         
@@ -25,6 +29,8 @@ class EWMAControlThreeSigmaDetector(BaseDetector):
             alpha (float): 指数移动平均权重，默认0.1
             data_pre_required (int): 最少样本数，默认100
             auto_optimize (bool): 是否自动优化参数，默认True
+            async_optimize (bool): 是否在后台线程中优化参数，默认False。
+                搜索期间沿用当前参数，结果在之后的一次 fit 中整体生效
         """
         super().__init__(data_type="univariate")
         
@@ -39,99 +45,140 @@ class EWMAControlThreeSigmaDetector(BaseDetector):
         self.mean = 0.0
         self.std = 1.0
         self.count = 0
-        self.data_buffer = []
+        self.rolling = RollingMoments(window_size)
         
         # 用于参数优化的数据
         self.optimization_data = []
         self.optimized = False
+        self.async_optimize = async_optimize
+        self._optimizer = None
+        self._pending_params = None
         
     def _update_statistics(self, value):
         """更新统计量"""
-        self.data_buffer.append(value)
-        if len(self.data_buffer) > self.window_size:
-            self.data_buffer.pop(0)
+        self.rolling.push(value)
         
         if self.count >= self.data_pre_required:
             if self.count == 0:
                 # 初始化
-                self.mean = np.mean(self.data_buffer)
-                self.std = np.std(self.data_buffer)
+                self.mean = self.rolling.mean()
+                self.std = self.rolling.std()
             else:
                 # 指数移动平均更新
-                current_mean = np.mean(self.data_buffer)
-                current_std = np.std(self.data_buffer)
+                current_mean = self.rolling.mean()
+                current_std = self.rolling.std()
                 self.mean = (1 - self.alpha) * self.mean + self.alpha * current_mean
                 self.std = (1 - self.alpha) * self.std + self.alpha * current_std
         self.count += 1
     
-    def _evaluate_params(self, data, sigma_mult, window_sz, alpha_val):
-        """评估参数组合的性能"""
-        # 创建临时检测器
-        temp_mean = 0.0
-        temp_std = 1.0
-        temp_buffer = []
-        false_positives = 0
-        
-        for value in data:
-            temp_buffer.append(value)
-            if len(temp_buffer) > window_sz:
-                temp_buffer.pop(0)
-            
-            if len(temp_buffer) >= self.data_pre_required:
-                if temp_mean == 0.0:
-                    temp_mean = np.mean(temp_buffer)
-                    temp_std = np.std(temp_buffer)
-                else:
-                    current_mean = np.mean(temp_buffer)
-                    current_std = np.std(temp_buffer)
-                    temp_mean = (1 - alpha_val) * temp_mean + alpha_val * current_mean
-                    temp_std = (1 - alpha_val) * temp_std + alpha_val * current_std
-                
-                # 检测异常
-                if temp_std > 0:
-                    z_score = abs(value - temp_mean) / temp_std
-                    if z_score > sigma_mult:
-                        false_positives += 1
-        
-        # 返回误报率（越低越好）
-        return false_positives / len(data) if len(data) > 0 else 1.0
-    
-    def _optimize_parameters(self, data):
-        if len(data) < self.data_pre_required:
-            return
+    def _evaluate_grid(self, data, sigma_values, window_values, alpha_values) -> np.ndarray:
+        """
+        一次评估所有参数组合的误报率
+        
+        每个窗口大小的滑动均值和标准差由累积和一次求出，所有 alpha 的指数
+        移动平均在同一个时间循环中以数组方式推进，最后对所有 sigma 一起比较。
+        
+        Returns:
+            np.ndarray: shape=(len(sigma_values), len(window_values), len(alpha_values)) 的误报率（越低越好）
+        """
+        data = np.asarray(data, dtype=float)
+        n = len(data)
+        sigmas = np.asarray(sigma_values, dtype=float)
+        windows = np.asarray(window_values)
+        alphas = np.asarray(alpha_values, dtype=float)
+        scores = np.zeros((len(sigmas), len(windows), len(alphas)))
+        if n == 0:
+            return scores + 1.0
+        
+        # 窗口内数据量达到 data_pre_required 之后才开始统计和检测
+        valid = windows >= self.data_pre_required
+        first = max(self.data_pre_required, 1) - 1
+        if not valid.any() or first >= n:
+            return scores
         
-        best_score = float('inf')
-        best_params = (self.sigma_multiplier, self.window_size, self.alpha)
+        # 以均值平移后做累积和，减小方差计算的抵消误差
+        shift = data.mean()
+        shifted = data - shift
+        cum = np.concatenate([[0.0], np.cumsum(shifted)])
+        cum_sq = np.concatenate([[0.0], np.cumsum(shifted * shifted)])
+        ends = np.arange(first, n) + 1
+        starts = np.maximum(ends[None, :] - windows[valid, None], 0)
+        counts = ends - starts
+        window_sum = cum[ends] - cum[starts]
+        window_sum_sq = cum_sq[ends] - cum_sq[starts]
+        current_mean = window_sum / counts
+        current_std = np.sqrt(np.maximum(window_sum_sq / counts - current_mean ** 2, 0.0))
+        current_mean += shift
         
+        # 所有 (window, alpha) 组合的指数移动平均
+        steps = n - first
+        ewma_mean = np.empty((valid.sum(), len(alphas), steps))
+        ewma_std = np.empty_like(ewma_mean)
+        mean = np.repeat(current_mean[:, :1], len(alphas), axis=1)
+        std = np.repeat(current_std[:, :1], len(alphas), axis=1)
+        for k in range(steps):
+            if k > 0:
+                mean = (1 - alphas) * mean + alphas * current_mean[:, k:k + 1]
+                std = (1 - alphas) * std + alphas * current_std[:, k:k + 1]
+            ewma_mean[:, :, k] = mean
+            ewma_std[:, :, k] = std
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_score = np.abs(data[first:] - ewma_mean) / ewma_std
+        z_score[~(ewma_std > 0)] = 0.0
+        false_positives = (z_score[None] > sigmas[:, None, None, None]).sum(axis=-1)
+        scores[:, valid, :] = false_positives / n
+        return scores
+    
+    def _search_parameters(self, data):
+        """在参数网格中选出误报率最低的组合（并列时取遍历顺序中的第一个）"""
         sigma_values = [2.5, 3.0, 3.5]
         window_values = [30, 50, 80]
         alpha_values = [0.05, 0.1, 0.2]
         
-        for sigma_mult in sigma_values:
-            for window_sz in window_values:
-                for alpha_val in alpha_values:
-                    score = self._evaluate_params(data, sigma_mult, window_sz, alpha_val)
-                    if score < best_score:
-                        best_score = score
-                        best_params = (sigma_mult, window_sz, alpha_val)
-        
-        # 更新参数
+        scores = self._evaluate_grid(data, sigma_values, window_values, alpha_values)
+        i, j, k = np.unravel_index(np.argmin(scores), scores.shape)
+        return sigma_values[i], window_values[j], alpha_values[k]
+    
+    def _apply_parameters(self, params):
+        """更新参数"""
         old_window_size = self.window_size
-        self.sigma_multiplier, self.window_size, self.alpha = best_params
+        self.sigma_multiplier, self.window_size, self.alpha = params
         self.optimized = True
         
         if self.window_size != old_window_size:
-            if len(self.data_buffer) > self.window_size:
-                # 保留最新的数据点
-                self.data_buffer = self.data_buffer[-self.window_size:]
+            # 保留最新的数据点
+            self.rolling.resize(self.window_size)
+    
+    def _optimize_parameters(self, data):
+        if len(data) < self.data_pre_required:
+            return
+        
+        if not self.async_optimize:
+            self._apply_parameters(self._search_parameters(data))
+            return
+        
+        # 在后台线程中搜索，结果在下一次 fit 时整体生效
+        def search(data):
+            self._pending_params = self._search_parameters(data)
         
+        self._optimizer = threading.Thread(target=search, args=(list(data),), daemon=True)
+        self._optimizer.start()
+    
+    def _apply_pending_parameters(self):
+        """应用后台搜索完成的参数"""
+        if self._pending_params is not None:
+            params, self._pending_params = self._pending_params, None
+            self._optimizer = None
+            self._apply_parameters(params)
     
     def fit(self, X: np.ndarray, timestamp: int = None, label: int = None):
         """拟合数据"""
         value = X[0]
+        self._apply_pending_parameters()
         
         # 收集用于优化的数据（假设前面的数据都是正常的）
-        if not self.optimized and self.auto_optimize:
+        if not self.optimized and self.auto_optimize and self._optimizer is None:
             self.optimization_data.append(value)
             
             # 达到足够数据量时进行参数优化
@@ -166,6 +213,95 @@ class EWMAControlThreeSigmaDetector(BaseDetector):
         self.fit(X, timestamp, label)
         return self.score(X, timestamp)
     
+    def fit_score_batch(self, X: np.ndarray):
+        """
+        批量拟合并计算分数
+        
+        结果与逐点调用 fit_score 和 predict 逐位一致（包括 data_pre_required
+        预热和一次性的 _optimize_parameters 参数切换）。参数确定之后，窗口
+        均值和标准差由 RollingMoments.push_many 批量计算，只有指数移动平均
+        的递推逐点进行。
+        
+        Args:
+            X (np.ndarray): 观测值，shape=(n,) 或 (n, 1)
+            
+        Returns:
+            tuple: (scores, labels)，shape 均为 (n,)
+        """
+        values = np.asarray(X)
+        values = values.reshape(len(values), -1)[:, 0]
+        n = len(values)
+        scores = np.zeros(n)
+        labels = np.zeros(n, dtype=int)
+        
+        # 参数优化完成之前逐点处理，保证参数切换的时机与流式路径一致
+        self._apply_pending_parameters()
+        start = 0
+        while start < n and self.auto_optimize and not self.optimized and self._optimizer is None:
+            score = self.fit_score(values[start:start + 1])
+            scores[start] = score
+            labels[start] = self.predict(score)
+            start += 1
+        
+        if start < n:
+            batch_scores = self._fit_score_fixed_params(values[start:])
+            scores[start:] = batch_scores
+            labels[start:] = batch_scores > self.sigma_multiplier
+        return scores, labels
+    
+    def _fit_score_fixed_params(self, values: np.ndarray) -> np.ndarray:
+        """参数不再变化时的向量化 fit_score"""
+        m = len(values)
+        counts_before = self.count + np.arange(m)
+        update = counts_before >= self.data_pre_required
+        
+        # 每个点入窗后的窗口均值和标准差
+        current_mean, current_std = self.rolling.push_many(values)
+        
+        # 指数移动平均递推
+        means = np.full(m, self.mean, dtype=float)
+        stds = np.full(m, self.std, dtype=float)
+        mean, std, alpha = self.mean, self.std, self.alpha
+        first = int(np.argmax(update)) if update.any() else m
+        cur_means = current_mean[first:].tolist()
+        cur_stds = current_std[first:].tolist()
+        counts = counts_before[first:].tolist()
+        ewma_means = []
+        ewma_stds = []
+        for count, cur_mean, cur_std in zip(counts, cur_means, cur_stds):
+            if count == 0:
+                mean, std = cur_mean, cur_std
+            else:
+                mean = (1 - alpha) * mean + alpha * cur_mean
+                std = (1 - alpha) * std + alpha * cur_std
+            ewma_means.append(mean)
+            ewma_stds.append(std)
+        means[first:] = ewma_means
+        stds[first:] = ewma_stds
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.abs(values - means) / stds
+        scores[(counts_before + 1 < self.data_pre_required) | (stds == 0)] = 0.0
+        
+        # 同步流式状态
+        self.mean = mean
+        self.std = std
+        self.count += m
+        return scores
+    
+    def __getstate__(self) -> dict:
+        """
+        可序列化的检测器状态
+        
+        后台优化线程不参与序列化: 若搜索尚未完成，恢复后会用保存的
+        optimization_data 重新触发搜索。参数优化完成后不再保存 optimization_data。
+        """
+        state = super().__getstate__()
+        state['_optimizer'] = None
+        if self.optimized:
+            state['optimization_data'] = []
+        return state
+    
     def get_params(self) -> dict:
         """获取当前参数"""
         return {
@@ -187,6 +323,8 @@ class EWMAControlThreeSigmaDetector(BaseDetector):
         self.mean = 0.0
         self.std = 1.0
         self.count = 0
-        self.data_buffer = []
+        self.rolling.clear()
         self.optimization_data = []
-        self.optimized = False 
\ No newline at end of file
+        self.optimized = False
+        self._optimizer = None
+        self._pending_params = None 
\ No newline at end of file
@@ -35,6 +35,17 @@ class KNNDetector(BaseDetector):
         self.score_mean = None
         self.score_std = None
 
+    def __getstate__(self) -> dict:
+        """历史窗口保存为一个二维数组"""
+        state = super().__getstate__()
+        state['buffer'] = {"__deque__": True, "maxlen": self.buffer.maxlen,
+                           "values": np.array([list(w) for w in self.buffer])}
+        return state
+
+    def __setstate__(self, state: dict):
+        super().__setstate__(state)
+        self.buffer = deque((deque(w, maxlen=self.window.maxlen) for w in self.buffer), maxlen=self.buffer.maxlen)
+
     def fit(self, X: np.ndarray, timestamp: int = None):
 
         self.window.append(X[0])
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+检测算法注册表
+以映射文件 (algorithm_mapping.json) 中的算法名为键, 实现在第一次使用时才导入,
+只用到 EWMA 的进程不会加载 cvxpy、scipy、sklearn 等重量级依赖
+"""
+
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# 算法名 -> (类型, "模块:属性", 默认参数)
+# model: 属性为检测器类, 每个文件一个实例, 由 model.detect.detect 逐行检测
+# function: 属性为按文件检测的函数 (detect(data_path, output_path, metric_name, last_line, sink))
+_ENTRIES = {}
+# 已导入的实现
+_loaded = {}
+# 算法名 -> 首次导入耗时 (秒)
+_import_seconds = {}
+_lock = threading.Lock()
+
+
+def register(name, target, kind="model", **defaults):
+    """
+    注册一个算法, 不导入其实现
+
+    Args:
+        name (str): 映射文件中使用的算法名
+        target (str): "模块:属性", 例如 "model.knn:KNNDetector"
+        kind (str): "model" 或 "function"
+        **defaults: 创建检测器时的默认参数 (仅 model)
+    """
+    if kind not in ("model", "function"):
+        raise ValueError(f"Unknown kind '{kind}', expected 'model' or 'function'.")
+    with _lock:
+        _ENTRIES[name] = (kind, target, defaults)
+        _loaded.pop(name, None)
+
+
+def names():
+    """所有已注册的算法名"""
+    return list(_ENTRIES)
+
+
+def is_registered(name):
+    return name in _ENTRIES
+
+
+def is_model(name):
+    """算法是否为需要逐文件实例化的检测器类"""
+    return name in _ENTRIES and _ENTRIES[name][0] == "model"
+
+
+def load(name):
+    """
+    返回算法的实现 (类或函数), 第一次调用时导入并记录耗时
+
+    Raises:
+        KeyError: 未注册的算法名
+    """
+    implementation = _loaded.get(name)
+    if implementation is not None:
+        return implementation
+    if name not in _ENTRIES:
+        raise KeyError(f"Unknown algorithm '{name}', registered: {', '.join(_ENTRIES)}")
+    _, target, _ = _ENTRIES[name]
+    module_name, attr = target.split(":")
+    with _lock:
+        if name not in _loaded:
+            started = time.perf_counter()
+            module = importlib.import_module(module_name)
+            _loaded[name] = getattr(module, attr)
+            _import_seconds[name] = time.perf_counter() - started
+        return _loaded[name]
+
+
+def create(name, **kwargs):
+    """
+    创建算法的检测器实例
+
+    Args:
+        name (str): 算法名, 必须为 model 类型
+        **kwargs: 覆盖注册时的默认参数
+
+    Returns:
+        检测器实例
+    """
+    kind, _, defaults = _ENTRIES.get(name, (None, None, None))
+    if kind != "model":
+        raise ValueError(f"Algorithm '{name}' is not a detector model.")
+    return load(name)(**dict(defaults, **kwargs))
+
+
+def import_report():
+    """
+    本进程中已加载算法的导入耗时
+
+    耗时只包含第一次导入时尚未加载的模块, 与其他算法共享的依赖只计入先加载的那个
+
+    Returns:
+        list: (算法名, 模块, 秒) 按加载顺序排列
+    """
+    return [(name, _ENTRIES[name][1].split(":")[0], seconds) for name, seconds in _import_seconds.items()]
+
+
+def format_import_report(report=None):
+    """import_report 的可读文本"""
+    report = import_report() if report is None else report
+    if not report:
+        return "No detector implementations loaded."
+    return "\n".join(f"  {name:<32} {module:<32} " + (f"{seconds * 1000:8.1f} ms" if seconds is not None else "failed")
+                     for name, module, seconds in report)
+
+
+def cold_import_report(algorithms=None):
+    """
+    在全新的解释器中逐个导入算法实现, 测量冷启动导入耗时
+
+    Args:
+        algorithms (list): 算法名, 默认全部
+
+    Returns:
+        list: (算法名, 模块, 秒), 导入失败时秒为 None
+    """
+    # 子进程沿用本进程的导入路径
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    report = []
+    for name in algorithms or names():
+        module_name = _ENTRIES[name][1].split(":")[0]
+        code = ("import time; started = time.perf_counter(); import " + module_name +
+                "; print(time.perf_counter() - started)")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        seconds = float(result.stdout.split()[-1]) if result.returncode == 0 and result.stdout.split() else None
+        report.append((name, module_name, seconds))
+    return report
+
+
+register("EWMAControlThreeSigmaDetector", "model.ewmacontrol_three_sigma:EWMAControlThreeSigmaDetector")
+register("adaptive-3-sigma", "model.ewmacontrol_three_sigma:EWMAControlThreeSigmaDetector",
+         sigma_multiplier=3.0, window_size=50, alpha=0.1, auto_optimize=True)
+register("ThreeSigmaDetector", "model.three_sigma:ThreeSigmaDetector")
+register("SpotDetector", "model.spot:SpotDetector")
+register("KNNDetector", "model.knn:KNNDetector")
+register("jumpstarter", "detector.detect:detect", kind="function")
+
+
+if __name__ == "__main__":
+    # 冷启动导入耗时, 需在 anomaly_detection 位于 PYTHONPATH 时运行
+    print("Cold import time per algorithm:")
+    print(format_import_report(cold_import_report()))
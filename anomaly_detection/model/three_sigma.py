@@ -5,7 +5,7 @@
 
 import numpy as np
 from base.detector import BaseDetector
-from collections import deque
+from base.rolling import RollingMoments
 
 
 class ThreeSigmaDetector(BaseDetector):
@@ -27,8 +27,9 @@ class ThreeSigmaDetector(BaseDetector):
         # 首先调用父类的__init__来初始化通用属性，如 self.index
         super().__init__(data_type="univariate")
         
-        # 然后用我们自己的、具有固定长度的deque覆盖父类的window
-        self.window = deque(maxlen=window_len)
+        # 然后用固定长度的滚动统计窗口覆盖父类的window，每个点 O(1) 更新
+        self.window_len = window_len
+        self.window = RollingMoments(window_len, ddof=1)
         
         self.multiplier = multiplier
         self.mean = 0.0
@@ -45,14 +46,13 @@ class ThreeSigmaDetector(BaseDetector):
         Returns:
             self: 返回检测器实例
         """
-        # 添加新数据点到滑动窗口，deque(maxlen=...) 会自动处理移除旧数据
-        self.window.append(X[0])
+        # 添加新数据点到滑动窗口，窗口满时自动移除最旧的数据
+        self.window.push(X[0])
         
         # 当窗口中有足够数据时，计算统计量
         if len(self.window) >= 2:
-            window_data = np.array(self.window)
-            self.mean = np.mean(window_data)
-            self.std = np.std(window_data, ddof=1)  # 使用样本标准差
+            self.mean = self.window.mean()
+            self.std = self.window.std()  # 使用样本标准差
         
         return self
     
@@ -0,0 +1,51 @@
+import argparse
+import os
+
+from anomaly_utils.trace_archive import convert_csv, ARCHIVE_SUFFIX
+
+TIME_COLUMNS = ('Timestamp', 'timestamp', 'time')
+
+def find_csv_files(paths):
+    """CSV files given directly or found below the given directories."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for subdir, _, files in os.walk(path):
+            for file in sorted(files):
+                if file.endswith('.csv') or file.endswith('.log'):
+                    yield os.path.join(subdir, file)
+
+def detect_time_column(csv_path):
+    """First column named like a timestamp, read from the header line."""
+    with open(csv_path, 'r') as f:
+        header = f.readline().strip().split(',')
+    for name in header:
+        if name in TIME_COLUMNS:
+            return name
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert CSV trace outputs into columnar binary trace archives (<name>.trace directories).")
+    parser.add_argument("paths", nargs="*", default=["output", "traceOutput"],
+                        help="CSV files or directories to convert (default: output traceOutput).")
+    parser.add_argument("--time-column", default=None,
+                        help="Column to index for time range queries (default: Timestamp/timestamp if present).")
+    parser.add_argument("--chunk-rows", type=int, default=65536, help="Rows per archive chunk.")
+    parser.add_argument("--compression", choices=["zlib"], default=None,
+                        help="Compress every chunk (the archive can then not be memory mapped).")
+    args = parser.parse_args()
+
+    for csv_path in find_csv_files(args.paths):
+        time_column = args.time_column or detect_time_column(csv_path)
+        archive_path = os.path.splitext(csv_path)[0] + ARCHIVE_SUFFIX
+        try:
+            convert_csv(csv_path, archive_path, time_column, args.chunk_rows, args.compression)
+        except (OSError, ValueError) as e:
+            print(f"Skipping '{csv_path}': {e}")
+            continue
+        print(f"Converted '{csv_path}' -> '{archive_path}'")
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,21 @@
-import pandas as pd
 import numpy as np
 import json
 import os
 
+from anomaly_utils.trace_archive import read_table
+
 def determine_algorithm(data_file_path):
     """
     Determines the appropriate algorithm for a given data file based on its structure.
 
     Args:
-        data_file_path (str): The path to the CSV data file.
+        data_file_path (str): The path to the CSV data file or its trace archive.
 
     Returns:
         str: The name of the selected algorithm.
     """
     try:
-        df = pd.read_csv(data_file_path)
+        df = read_table(data_file_path)
 
         # Drop the timestamp column if it exists
         if 'timestamp' in df.columns:
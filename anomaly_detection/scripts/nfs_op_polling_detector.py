@@ -3,24 +3,27 @@ import sys
 import json
 import argparse
 import pandas as pd
-import subprocess
 import time
 
 # Add project root to allow imports from other directories
 # sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from model.detect import detect
-from model import EWMAControlThreeSigmaDetector
+from model.detect import detect, detect_bank
+from model import EWMAControlThreeSigmaDetector, EWMADetectorBank
+from anomaly_utils.csv_tailer import CSVTailer
+from anomaly_utils.checkpoint import Checkpoint
+from anomaly_utils.anomaly_sink import AnomalySink
+from anomaly_utils.anomaly_store import AnomalyStore
+from anomaly_utils.file_watcher import FileWatcher
+from anomaly_utils.pid_rollup import PidRollup
+from anomaly_utils.load_shedder import LoadShedder, SHEDDING_MODES
+from scripts.op_latency_analyzer import OpLatencyAnalyzer
 
 STATE_FILE = "anomaly_detection/scripts/nfs_op_polling_state.json"
-
-def get_file_line_count(filepath):
-    """Counts the number of lines in a file."""
-    if not os.path.exists(filepath):
-        return 0
-    # Efficiently count lines
-    with open(filepath, 'rb') as f:
-        return sum(1 for _ in f)
+ANALYZER_STATE_FILE = "anomaly_detection/scripts/op_latency_analyzer_state.json"
+CHECKPOINT_FILE = Checkpoint.path_for(STATE_FILE)
+# Parameters of the per-file EWMA detectors
+EWMA_PARAMS = dict(sigma_multiplier=3.0, window_size=50, alpha=0.1, data_pre_required=200, auto_optimize=True)
 
 def load_state():
     """Loads the last processed line number for each file."""
@@ -37,6 +40,26 @@ def save_state(state):
     with open(STATE_FILE, 'w') as f:
         json.dump(state, f, indent=4)
 
+def wait_for_data(args, watcher):
+    """Sleep poll_interval, or in event-driven mode until trace logs are written."""
+    if watcher is None:
+        time.sleep(args.poll_interval)
+    else:
+        watcher.wait()
+
+def checkpoint_models(models, bank):
+    """Detectors to checkpoint, including the streams held by the detector bank."""
+    if bank is None:
+        return models
+    return dict(models, **{data_file: bank.to_detector(data_file) for data_file in bank.keys()})
+
+def print_shedding(stats, dropped_before=0):
+    """Report the rows shed since dropped_before, with the totals per op."""
+    per_op = ", ".join(f"{op} {counts['dropped']}/{counts['offered']}"
+                       for op, counts in stats['per_op'].items() if counts['dropped'])
+    print(f"Load shedding ({stats['mode']}): dropped {stats['dropped'] - dropped_before} rows, "
+          f"{stats['dropped']} of {stats['offered']} in total ({per_op}).")
+
 def main():
     parser = argparse.ArgumentParser(description="Run NFS-OP anomaly detection in a continuous polling loop.")
     parser.add_argument("--mapping_file", type=str, 
@@ -48,11 +71,119 @@ def main():
                         help="Path to the file to save NFS-OP anomalies.")
     parser.add_argument("--nfs_output_dir", default="nfs_output/op_latency/",
                         help="Directory to read latency CSVs from.")
-    parser.add_argument("--poll_interval", type=int, default=10,
-                        help="Interval in seconds between polling for new data.")
+    parser.add_argument("--poll_interval", type=float, default=10,
+                        help="Interval in seconds between polling for new data (fractions allowed).")
+    parser.add_argument("--analyzer_state_file", default=ANALYZER_STATE_FILE,
+                        help="Path to the state file of the op latency analyzer.")
+    parser.add_argument("--event_driven", action="store_true",
+                        help="Run a cycle as soon as nfsdig appends to the trace logs (inotify) "
+                             "instead of sleeping poll_interval.")
+    parser.add_argument("--watch_poll_interval", type=float, default=1.0,
+                        help="Stat polling period used by --event_driven on filesystems without inotify.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep previous anomalies and state, and restore the detectors from the checkpoint.")
+    parser.add_argument("--checkpoint_file", default=CHECKPOINT_FILE,
+                        help="Path of the detector checkpoint.")
+    parser.add_argument("--checkpoint_interval", type=float, default=60,
+                        help="Seconds between detector checkpoints (0 disables them).")
+    parser.add_argument("--anomaly_max_bytes", type=int, default=0,
+                        help="Rotate the anomaly file once it would exceed this size (0 disables).")
+    parser.add_argument("--anomaly_rotate_interval", type=float, default=0,
+                        help="Rotate the anomaly file after this many seconds (0 disables).")
+    parser.add_argument("--anomaly_store", default=None,
+                        help="Directory of a columnar anomaly store to also record anomalies in "
+                             "(query it with scripts/query_anomalies.py).")
+    parser.add_argument("--op_ring", default=None,
+                        help="Shared-memory op ring written by nfsdig (e.g. /dev/shm/nfsdig_op.ring), read instead "
+                             "of the trace logs once it exists. Polled every poll_interval.")
+    parser.add_argument("--pid_rollup_file", default=None,
+                        help="JSON file to keep the per-PID anomaly summary (count, max latency, first/last seen) "
+                             "of every op in.")
+    parser.add_argument("--detector_bank", action="store_true",
+                        help="Update all EWMA detectors together in one vectorized detector bank, "
+                             "faster with many files receiving a few rows per cycle.")
+    parser.add_argument("--load_shedding", choices=("off",) + SHEDDING_MODES, default="off",
+                        help="Downsample busy-period op rows when they arrive faster than the detectors process "
+                             "them: uniform 'reservoir' sample, per-op 'stratified' sample, or per-op "
+                             "'max_latency' keeping the slowest ops. Dropped rows are counted per op.")
+    parser.add_argument("--shed_capacity", type=float, default=None,
+                        help="Detector throughput in rows/s for load shedding. Measured from the detection "
+                             "cycles by default.")
+    parser.add_argument("--shed_utilization", type=float, default=0.8,
+                        help="Fraction of the detector throughput admitted before rows are shed.")
     args = parser.parse_args()
 
-    # --- Initial Cleanup ---
+    checkpoint = Checkpoint(args.checkpoint_file, args.checkpoint_interval)
+    if not args.resume:
+        clear_previous_run(args, checkpoint)
+
+    print(f"Starting NFS-OP anomaly detection polling loop every {args.poll_interval} seconds...")
+    print(f"Anomalies will be saved to '{args.anomaly_file}'. Press Ctrl+C to stop.")
+
+    # 存储每个文件的模型实例
+    models = {}
+    # 存储每个文件的状态（最后处理的行数）
+    processing_state = {}
+    # 记录每个文件已读取的字节偏移，每次只解析新追加的数据
+    tailer = CSVTailer()
+    if args.resume:
+        restored = checkpoint.restore_detectors(models, processing_state, tailer)
+        if restored:
+            print(f"Restored {restored} detectors from checkpoint '{args.checkpoint_file}'.")
+        else:
+            # 没有可用的检查点: 从状态文件继续, 模型重新预热
+            processing_state = load_state()
+    # 向量化检测器组: 所有 EWMA 文件共用一组状态数组
+    bank = None
+    if args.detector_bank:
+        bank = EWMADetectorBank()
+        for data_file in list(models):
+            if isinstance(models[data_file], EWMAControlThreeSigmaDetector):
+                bank.add_detector(data_file, models.pop(data_file))
+    # 负载削减: 输入速率超过检测吞吐时对忙时数据降采样
+    shedder = None
+    if args.load_shedding != "off":
+        shedder = LoadShedder(args.load_shedding, capacity=args.shed_capacity, utilization=args.shed_utilization)
+    # 常驻的日志分析器，状态、文件句柄与映射均保存在内存中
+    analyzer = OpLatencyAnalyzer(args.log_dir, args.nfs_output_dir,
+                                 args.analyzer_state_file, args.mapping_file, args.op_ring, shedder)
+
+    # 事件驱动模式: 监听 trace 日志目录, 有新数据写入时才唤醒
+    watcher = None
+    if args.event_driven and args.op_ring:
+        # Writes to the mapped ring raise no inotify events
+        print("--event_driven has no effect with --op_ring, polling the ring instead.")
+    elif args.event_driven:
+        os.makedirs(args.log_dir, exist_ok=True)
+        watcher = FileWatcher(poll_interval=args.watch_poll_interval)
+        watcher.add_directory(args.log_dir)
+        if not watcher.inotify:
+            print(f"inotify unavailable for {args.log_dir}, falling back to stat polling.")
+
+    # 异常由后台线程批量写入, 并在内存中按文件计数
+    sink = AnomalySink(args.anomaly_file, max_bytes=args.anomaly_max_bytes,
+                       rotate_interval=args.anomaly_rotate_interval,
+                       store=AnomalyStore(args.anomaly_store) if args.anomaly_store else None)
+
+    # 按 (op, pid) 汇总异常, 用于快速定位最嘈杂的客户端
+    rollup = PidRollup()
+
+    try:
+        run_polling_loop(args, analyzer, tailer, models, processing_state, watcher, checkpoint, sink, bank, rollup)
+    finally:
+        analyzer.close()
+        if args.pid_rollup_file:
+            rollup.save(args.pid_rollup_file)
+        if shedder is not None:
+            print_shedding(shedder.stats())
+        if watcher is not None:
+            watcher.close()
+        if args.checkpoint_interval > 0:
+            checkpoint.save_detectors(checkpoint_models(models, bank), processing_state, tailer, sink=sink)
+        sink.close()
+
+def clear_previous_run(args, checkpoint):
+    """Delete the anomalies, state, checkpoint and outputs of a previous run."""
     # Clear previous anomaly file if starting fresh
     if os.path.exists(args.anomaly_file):
         print(f"Clearing previous anomaly file: {args.anomaly_file}")
@@ -61,6 +192,8 @@ def main():
     if os.path.exists(STATE_FILE):
         print(f"Clearing previous state file: {STATE_FILE}")
         os.remove(STATE_FILE)
+    # Clear detector checkpoint, models start cold
+    checkpoint.remove()
     # Clear mapping file to ensure a fresh start
     if os.path.exists(args.mapping_file):
         print(f"Clearing previous mapping file: {args.mapping_file}")
@@ -76,76 +209,73 @@ def main():
                 os.remove(file_path)
                 print(f"Removed: {file_path}")
 
-    print(f"Starting NFS-OP anomaly detection polling loop every {args.poll_interval} seconds...")
-    print(f"Anomalies will be saved to '{args.anomaly_file}'. Press Ctrl+C to stop.")
-
-    # 存储每个文件的模型实例
-    models = {}
-    # 存储每个文件的状态（最后处理的行数）
-    processing_state = {}
-
+def run_polling_loop(args, analyzer, tailer, models, processing_state, watcher=None, checkpoint=None, sink=None,
+                     bank=None, rollup=None):
+    # 已报告的削减行数
+    shed_before = 0
     while True:
         # --- 1. Run the log analyzer to process new op data ---
         try:
-            command = ['python3', 'anomaly_detection/op_latency_analyzer.py']
-            subprocess.run(command, check=True)
-        except (subprocess.CalledProcessError, FileNotFoundError) as e:
-            print(f"Error running op_latency_analyzer.py: {e}. Skipping this cycle.")
-            time.sleep(args.poll_interval)
+            analyzer.step()
+        except Exception as e:
+            print(f"Error running op latency analyzer: {e}. Skipping this cycle.")
+            wait_for_data(args, watcher)
             continue
 
-        # --- 2. Load the (potentially updated) algorithm mapping ---
-        try:
-            if not os.path.exists(args.mapping_file) or os.path.getsize(args.mapping_file) == 0:
-                time.sleep(args.poll_interval)
-                continue
-            with open(args.mapping_file, 'r') as f:
-                mapping_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading mapping file '{args.mapping_file}': {e}. Skipping this cycle.")
-            time.sleep(args.poll_interval)
+        # --- 2. Take the (potentially updated) algorithm mapping ---
+        mapping_data = dict(analyzer.mapping)
+        if not mapping_data:
+            wait_for_data(args, watcher)
             continue
         
         # --- 3. 清理不再存在的文件模型 ---
         current_files = set(mapping_data.keys())
         # 从models字典中移除不再存在于mapping_data中的文件
-        for file_path in list(models.keys()):
+        for file_path in list(models.keys()) + (bank.keys() if bank is not None else []):
             if file_path not in current_files:
                 # print(f"Removing model for discontinued file: {file_path}")
-                del models[file_path]
+                models.pop(file_path, None)
+                if bank is not None:
+                    bank.remove(file_path)
                 if file_path in processing_state:
                     del processing_state[file_path]
+                tailer.forget(file_path)
         
         # --- 4. 处理每个文件 ---
         total_anomalies_in_cycle = 0
         files_processed = 0
+        # 本周期检测的行数与耗时, 用于估计检测吞吐
+        rows_in_cycle = 0
+        detect_started = time.monotonic()
+        # 检测器组模式下, 有新数据的文件在本周期末尾一起处理
+        bank_files = []
 
         for data_file, algorithm_name in mapping_data.items():
             if not os.path.exists(data_file):
                 print(f"File not found, skipping: {data_file}")
                 continue
                 
+            if bank is not None and algorithm_name == "EWMAControlThreeSigmaDetector":
+                if data_file not in bank:
+                    bank.register(data_file, **EWMA_PARAMS)
+                if tailer.has_new_data(data_file):
+                    bank_files.append(data_file)
+                continue
+
             # 获取或创建模型实例
             if data_file not in models:
                 # print(f"Creating new model for: {data_file}")
                 if algorithm_name == "EWMAControlThreeSigmaDetector":
-                    models[data_file] = EWMAControlThreeSigmaDetector(
-                        sigma_multiplier=3.0, 
-                        window_size=50, 
-                        alpha=0.1, 
-                        data_pre_required=200,
-                        auto_optimize=True
-                    )
+                    models[data_file] = EWMAControlThreeSigmaDetector(**EWMA_PARAMS)
                 else:
                     print(f"Unsupported algorithm '{algorithm_name}' for file '{data_file}'. Skipping.")
                     continue
             
             # 获取最后处理的行数
             last_line = processing_state.get(data_file, 0)
-            current_line_count = get_file_line_count(data_file)
             
             # 如果没有新数据，跳过处理
-            if current_line_count <= last_line:
+            if not tailer.has_new_data(data_file):
                 # print(f"No new data for {data_file}, skipping.")
                 continue
                 
@@ -154,23 +284,58 @@ def main():
             
             if algorithm_name == "EWMAControlThreeSigmaDetector":
                 # 调用检测函数
-                detect(model, data_file, args.anomaly_file, data_file, has_pid=1, last_line=last_line)
+                anomalies_before = sink.count(data_file) if sink is not None else 0
+                new_rows = detect(model, data_file, args.anomaly_file, data_file,
+                                  has_pid=1, last_line=last_line, tailer=tailer, sink=sink, rollup=rollup)
                 
                 # 更新状态
-                processing_state[data_file] = current_line_count
+                processing_state[data_file] = last_line + new_rows
                 files_processed += 1
+                rows_in_cycle += new_rows
                 
-                # 检查是否有新异常（可选）
-                # 这里可以根据需要添加异常检测的逻辑
+                # 新异常数量直接取自内存计数，无需重读异常文件
+                if sink is not None:
+                    total_anomalies_in_cycle += sink.count(data_file) - anomalies_before
             else:
                 print(f"Warning: Unknown algorithm '{algorithm_name}' for file '{data_file}'.")
+
+        if bank_files:
+            anomalies_before = sink.count() if sink is not None else 0
+            new_rows = detect_bank(bank, bank_files, args.anomaly_file, processing_state,
+                                   has_pid=1, tailer=tailer, sink=sink, rollup=rollup)
+            for data_file, rows in new_rows.items():
+                processing_state[data_file] = processing_state.get(data_file, 0) + rows
+            files_processed += len(bank_files)
+            rows_in_cycle += sum(new_rows.values())
+            if sink is not None:
+                total_anomalies_in_cycle += sink.count() - anomalies_before
         
+        shedder = analyzer.shedder
+        if shedder is not None:
+            shedder.record_throughput(rows_in_cycle, time.monotonic() - detect_started)
+
         # --- 5. 保存状态并等待下一个周期 ---
         save_state(processing_state)
+        # 定期保存模型检查点，重启后无需重新预热
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save_detectors(checkpoint_models(models, bank), processing_state, tailer, sink=sink)
         
         if files_processed > 0:
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Processed {files_processed} files. {len(mapping_data)} total files monitored.")
-        time.sleep(args.poll_interval)
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Processed {files_processed} files, "
+                  f"{total_anomalies_in_cycle} new anomalies. {len(mapping_data)} total files monitored.")
+        if total_anomalies_in_cycle > 0 and rollup is not None:
+            noisiest = rollup.top(3)
+            print("Noisiest clients: " + ", ".join(
+                f"{row.metric} pid {row.pid} ({row.count} anomalies, max {row.max_value})"
+                for row in noisiest.itertuples()))
+            if args.pid_rollup_file:
+                rollup.save(args.pid_rollup_file)
+        if shedder is not None:
+            stats = shedder.stats()
+            if stats['dropped'] > shed_before:
+                print_shedding(stats, shed_before)
+                shed_before = stats['dropped']
+        wait_for_data(args, watcher)
 
 if __name__ == '__main__':
     try:
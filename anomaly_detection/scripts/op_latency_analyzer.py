@@ -1,11 +1,13 @@
 import os
+import numpy as np
 import pandas as pd
-from collections import Counter
-import glob
 import json
 import time
 import argparse
 
+from anomaly_utils.csv_tailer import CSVTailer
+from anomaly_utils.shm_ring import ShmRing
+
 BATCH_SIZE = 3
 BUSY_THRESHOLD_SECONDS = 5.0
 
@@ -23,73 +25,249 @@ def save_state(state, state_file):
     with open(state_file, 'w') as f:
         json.dump(state, f, indent=4)
 
-def update_mapping_file(new_filepath, mapping_file):
-    """Adds a new file path to the mapping JSON if it's not already there."""
+def load_mapping(mapping_file):
     try:
         if os.path.exists(mapping_file) and os.path.getsize(mapping_file) > 0:
             with open(mapping_file, 'r') as f:
-                mapping = json.load(f)
-        else:
-            mapping = {}
+                return json.load(f)
     except json.JSONDecodeError:
-        mapping = {}
+        pass
+    return {}
 
-    if new_filepath not in mapping:
-        mapping[new_filepath] = "EWMAControlThreeSigmaDetector"
-        with open(mapping_file, 'w') as f:
-            json.dump(mapping, f, indent=4)
-        # print(f"Registered new operation for analysis: {new_filepath}")
+def save_mapping(mapping, mapping_file):
+    with open(mapping_file, 'w') as f:
+        json.dump(mapping, f, indent=4)
 
-def process_log_file(filepath, start_line, output_dir, mapping_file):
-    try:
-        # A more robust way to read the CSV: read the whole file with its header,
-        # then slice the dataframe to get only the new rows.
-        # This is simpler and avoids errors with header/data type mismatches.
-        df = pd.read_csv(filepath, header=0)
-        new_rows_df = df.iloc[start_line:]
 
+class OpLatencyAnalyzer:
+    """Long-lived analyzer forwarding busy-period op latencies to per-op CSVs.
+
+    The analyzer keeps its state, the byte offsets of the trace logs, the open
+    per-op output files and the algorithm mapping in memory, so it can be
+    driven in-process by calling ``step()`` once per polling cycle.
+
+    When ``ring_path`` is given and the ring exists, op events are taken from
+    that ``ShmRing`` instead of parsing the CSV trace logs; the logs remain the
+    fallback while no ring is available.
+
+    With a ``LoadShedder`` the busy rows pass through it before they reach the
+    per-op CSVs, so the detectors only get as many rows as they can keep up
+    with; the shedder counts what it drops.
+
+    Args:
+        log_dir (str): Directory to read trace logs from.
+        output_dir (str): Directory to write latency CSVs to.
+        state_file (str): Path to the state file for the analyzer.
+        mapping_file (str): Path to the algorithm mapping file to update.
+        ring_path (str, optional): Shared-memory op ring written by the
+            tracer. Defaults to None.
+        shedder (LoadShedder, optional): Downsamples the busy rows when the
+            detectors are overloaded. Defaults to None.
+    """
+
+    def __init__(self, log_dir, output_dir, state_file, mapping_file, ring_path=None, shedder=None):
+        self.log_dir = log_dir
+        self.output_dir = output_dir
+        self.state_file = state_file
+        self.mapping_file = mapping_file
+        self.ring_path = ring_path
+        self._ring = None
+        self.shedder = shedder
+
+        self.state = load_state(state_file, log_dir)
+        self.mapping = load_mapping(mapping_file)
+        self.tailer = CSVTailer()
+
+        self._log_files = []
+        self._log_dir_mtime = None
+        # Rows of the current log that do not fill a whole batch yet
+        self._pending = None
+        # Open append handles of the per-op output CSVs
+        self._handles = {}
+
+    def _refresh_log_files(self):
+        """Rescan the log directory, only when its contents changed."""
+        try:
+            mtime = os.stat(self.log_dir).st_mtime_ns
+        except OSError:
+            self._log_files = []
+            return
+        if mtime != self._log_dir_mtime:
+            self._log_dir_mtime = mtime
+            self._log_files = sorted(
+                entry.path for entry in os.scandir(self.log_dir)
+                if entry.name.endswith('.log') and entry.is_file()
+            )
+
+    def _output_handle(self, op_name):
+        output_filepath = os.path.join(self.output_dir, f"{op_name}.csv")
+        handle = self._handles.get(output_filepath)
+        if handle is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            handle = open(output_filepath, 'a', newline='')
+            self._handles[output_filepath] = handle
+        return output_filepath, handle
+
+    def _register(self, output_filepath):
+        """Adds a new file path to the mapping if it's not already there.
+
+        Returns:
+            bool: Whether the mapping changed.
+        """
+        if output_filepath in self.mapping:
+            return False
+        self.mapping[output_filepath] = "EWMAControlThreeSigmaDetector"
+        return True
+
+    def _write_op_rows(self, op_name, op_data):
+        """Append op_data to the CSV of op_name, return whether the mapping changed."""
+        output_filepath, handle = self._output_handle(op_name)
+        # Write the three-column dataframe (Timestamp, latency, Pid)
+        op_data.to_csv(handle, header=handle.tell() == 0, index=False)
+        handle.flush()
+        return self._register(output_filepath)
+
+    def _process_rows(self, new_rows_df):
+        """Forward the busy batches of new_rows_df, return the rows consumed.
+
+        The rows are cut into consecutive batches of BATCH_SIZE; a batch is busy
+        when its first and last timestamps are less than BUSY_THRESHOLD_SECONDS
+        apart. The rows of all busy batches are split by OP_TYPE with a single
+        groupby, so every op file gets one append per call and the mapping is
+        saved at most once, when a new op shows up. A trailing partial batch is
+        left unconsumed for the next call.
+        """
+        num_batches = len(new_rows_df) // BATCH_SIZE
+        new_lines_processed = num_batches * BATCH_SIZE
+        if num_batches == 0:
+            return 0
+
+        rows = new_rows_df.iloc[:new_lines_processed]
+        timestamps = rows['Timestamp'].to_numpy().reshape(num_batches, BATCH_SIZE)
+        time_delta_seconds = (timestamps[:, -1] - timestamps[:, 0]) / 1e9
+        busy = np.repeat(time_delta_seconds < BUSY_THRESHOLD_SECONDS, BATCH_SIZE)
+        if not busy.any():
+            return new_lines_processed
+
+        # Select Timestamp, Latency, and Pid columns for context
+        busy_rows = rows.loc[busy, ['OP_TYPE', 'Timestamp', 'Pid', 'Latency(us)']]
+        # Rename 'Latency(us)' to 'latency' for consistency and compatibility
+        busy_rows = busy_rows.rename(columns={'Latency(us)': 'latency'})
+        if self.shedder is not None:
+            busy_rows = self.shedder.shed(busy_rows)
+
+        mapping_changed = False
+        for op_name, op_data in busy_rows.groupby('OP_TYPE', sort=False):
+            mapping_changed |= self._write_op_rows(op_name, op_data[['Timestamp', 'Pid', 'latency']])
+        if mapping_changed:
+            save_mapping(self.mapping, self.mapping_file)
+
+        return new_lines_processed
+
+    def _process_new_rows(self, new_rows_df):
+        """Process new_rows_df after the pending rows, return the rows consumed (pending ones included)."""
+        if self._pending is not None and not self._pending.empty:
+            new_rows_df = pd.concat([self._pending, new_rows_df], ignore_index=True)
         if new_rows_df.empty:
+            self._pending = None
+            return 0
+
+        processed = self._process_rows(new_rows_df)
+        self._pending = new_rows_df.iloc[processed:]
+        return processed
+
+    def _process_log_file(self, log_file, start_line):
+        try:
+            new_rows_df = self.tailer.read(log_file, skip_rows=start_line)
+        except Exception:
+            # Catch potential errors during file read, like file being empty or locked
             return start_line
-            
-    except Exception as e:
-        # Catch potential errors during file read, like file being empty or locked
-        # print(f"DEBUG: Could not read {filepath}: {e}")
-        return start_line
-
-    new_lines_processed = 0
-    # Process the new rows in batches
-    for i in range(0, len(new_rows_df), BATCH_SIZE):
-        batch = new_rows_df.iloc[i:i+BATCH_SIZE]
-        if len(batch) < BATCH_SIZE:
-            continue
-        
-        first_timestamp_ns = batch.iloc[0]['Timestamp']
-        last_timestamp_ns = batch.iloc[-1]['Timestamp']
-        time_delta_seconds = (last_timestamp_ns - first_timestamp_ns) / 1e9
-
-        if time_delta_seconds < BUSY_THRESHOLD_SECONDS:
-            op_counts = Counter(batch['OP_TYPE'])
-            top_3_ops = op_counts.most_common(BATCH_SIZE)
-
-            for op_name, _ in top_3_ops:
-                # Select Timestamp, Latency, and Pid columns for context
-                op_data = batch[batch['OP_TYPE'] == op_name][['Timestamp', 'Pid', 'Latency(us)']]
-                
-                # Rename 'Latency(us)' to 'latency' for consistency and compatibility
-                op_data = op_data.rename(columns={'Latency(us)': 'latency'})
-                
-                os.makedirs(output_dir, exist_ok=True)
-                output_filepath = os.path.join(output_dir, f"{op_name}.csv")
-
-                is_new_file = not os.path.exists(output_filepath)
-                # Write the three-column dataframe (Timestamp, latency, Pid)
-                op_data.to_csv(output_filepath, mode='a', header=is_new_file, index=False)
-                
-                update_mapping_file(output_filepath, mapping_file)
-
-        new_lines_processed += len(batch)
-
-    return start_line + new_lines_processed
+
+        return start_line + self._process_new_rows(new_rows_df)
+
+    def _open_ring(self):
+        """Attach to the op ring once the tracer has created it."""
+        if self._ring is None and self.ring_path and os.path.exists(self.ring_path):
+            try:
+                self._ring = ShmRing(self.ring_path)
+            except (OSError, ValueError) as e:
+                print(f"Cannot open op ring {self.ring_path}: {e}. Reading the trace logs instead.")
+                self.ring_path = None
+        return self._ring
+
+    def _step_ring(self, ring):
+        """Consume every op event waiting in the ring, return the number of events."""
+        consumed = 0
+        while True:
+            records = ring.peek()
+            if not len(records):
+                return consumed
+            # Same columns as the CSV trace logs; building the frame copies the view
+            new_rows_df = pd.DataFrame({
+                'Timestamp': records['timestamp'].copy(),
+                'OP_TYPE': np.char.decode(records['op']),
+                'Pid': records['pid'].copy(),
+                'Latency(us)': records['latency'].copy(),
+                'Xid': records['xid'].copy(),
+            })
+            # A trailing partial batch stays pending in memory until the next events arrive
+            self._process_new_rows(new_rows_df)
+            # Release the slots only once the events are processed; if processing raises they stay in
+            # the ring and are read again by the next step instead of being overwritten by the producer
+            ring.advance(len(records))
+            consumed += len(records)
+
+    def step(self):
+        """Process the rows appended to the trace logs since the last step.
+
+        Returns:
+            int: Number of log rows (or ring events) consumed in this step.
+        """
+        ring = self._open_ring()
+        if ring is not None:
+            return self._step_ring(ring)
+
+        self._refresh_log_files()
+        if not self._log_files:
+            return 0
+
+        # If the last processed file no longer exists, start from the beginning.
+        start_index = 0
+        if self.state['last_processed_file'] in self._log_files:
+            start_index = self._log_files.index(self.state['last_processed_file'])
+
+        consumed = 0
+        for log_file in self._log_files[start_index:]:
+            # Determine the line to start from
+            line_to_process = 0
+            if log_file == self.state['last_processed_file']:
+                # If it's the same file we processed last, continue from where we left off
+                line_to_process = self.state['last_processed_line']
+            else:
+                # Moving on to a newer log: the previous one is finished
+                self.tailer.forget(self.state['last_processed_file'])
+                self._pending = None
+
+            lines_processed = self._process_log_file(log_file, line_to_process)
+            consumed += lines_processed - line_to_process
+
+            # Update state
+            self.state['last_processed_file'] = log_file
+            self.state['last_processed_line'] = lines_processed
+
+        if consumed:
+            save_state(self.state, self.state_file)
+        return consumed
+
+    def close(self):
+        """Flush the output files and persist the state."""
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+        save_state(self.state, self.state_file)
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze NFS OP logs for latency anomalies during busy periods.")
@@ -101,43 +279,18 @@ def main():
                         help="Path to the state file for the analyzer.")
     parser.add_argument("--mapping-file", default="anomaly_detection/scripts/nfs_op_algorithm_mapping.json",
                         help="Path to the algorithm mapping file to update.")
+    parser.add_argument("--op-ring", default=None,
+                        help="Shared-memory op ring to read instead of the trace logs, when it exists.")
     args = parser.parse_args()
 
     os.makedirs(args.output_dir, exist_ok=True)
-    
-    state = load_state(args.state_file, args.log_dir)
-    
-    log_files = sorted(glob.glob(os.path.join(args.log_dir, '*.log')))
-    if not log_files:
-        return
-
-    # More robust logic for finding where to start processing.
-    # If the last processed file no longer exists, start from the beginning.
-    start_index = 0
-    if state['last_processed_file'] in log_files:
-        try:
-            start_index = log_files.index(state['last_processed_file'])
-        except ValueError:
-            # This case handles if the file disappears between glob and index call
-            pass
-    
-    for i in range(start_index, len(log_files)):
-        log_file = log_files[i]
-        
-        # Determine the line to start from
-        line_to_process = 0
-        if log_file == state['last_processed_file']:
-            # If it's the same file we processed last, continue from where we left off
-            line_to_process = state['last_processed_line']
-        
-        # Process the file
-        lines_processed = process_log_file(log_file, line_to_process, args.output_dir, args.mapping_file)
-        
-        # Update state
-        state['last_processed_file'] = log_file
-        state['last_processed_line'] = lines_processed
-    
-    save_state(state, args.state_file)
+
+    analyzer = OpLatencyAnalyzer(args.log_dir, args.output_dir, args.state_file, args.mapping_file,
+                                 args.op_ring)
+    try:
+        analyzer.step()
+    finally:
+        analyzer.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
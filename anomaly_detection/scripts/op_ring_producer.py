@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from anomaly_utils.shm_ring import ShmRing, RECORD_DTYPE
+
+def to_records(log_df):
+    """Convert rows of an op trace log (CSV columns) to ring records."""
+    records = np.zeros(len(log_df), dtype=RECORD_DTYPE)
+    records['timestamp'] = log_df['Timestamp'].to_numpy()
+    records['op'] = log_df['OP_TYPE'].astype(str).str.encode('ascii').to_numpy()
+    records['pid'] = log_df['Pid'].to_numpy()
+    records['latency'] = log_df['Latency(us)'].to_numpy()
+    records['xid'] = log_df['Xid'].to_numpy()
+    return records
+
+def replay(ring, log_files, chunk_size=1000, interval=0.0):
+    """Write the rows of CSV op logs into the ring, waiting while it is full.
+
+    Returns:
+        int: Number of records written.
+    """
+    written = 0
+    for log_file in log_files:
+        for chunk in pd.read_csv(log_file, chunksize=chunk_size):
+            records = to_records(chunk)
+            while len(records):
+                count = ring.write(records[:ring.free])
+                records = records[count:]
+                written += count
+                if len(records):
+                    time.sleep(0.01)
+            if interval:
+                time.sleep(interval)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stand-in for the nfsdig op printer: replay CSV op trace logs into a shared-memory op ring.")
+    parser.add_argument("log_files", nargs="+", help="CSV op trace logs (Timestamp,OP_TYPE,Pid,Latency(us),Xid).")
+    parser.add_argument("--ring", default="/dev/shm/nfsdig_op.ring", help="Path of the op ring.")
+    parser.add_argument("--capacity", type=int, default=65536,
+                        help="Record slots when creating the ring.")
+    parser.add_argument("--create", action="store_true",
+                        help="Create (or reset) the ring instead of appending to an existing one.")
+    parser.add_argument("--chunk_size", type=int, default=1000, help="Rows written at a time.")
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds to sleep between chunks.")
+    args = parser.parse_args()
+
+    ring = ShmRing(args.ring, args.capacity) if args.create else ShmRing(args.ring)
+    try:
+        written = replay(ring, args.log_files, args.chunk_size, args.interval)
+        print(f"Wrote {written} records to '{args.ring}' ({ring.dropped} dropped).")
+    finally:
+        ring.close()
+
+if __name__ == '__main__':
+    main()
@@ -2,39 +2,54 @@ import os
 import sys
 import json
 import argparse
-import pandas as pd
 import time
 import signal
+import asyncio
 import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # # Add project root to path to allow imports
 # sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from model.detect import detect
-from model import EWMAControlThreeSigmaDetector
-from detector.detect import detect as JumpStarterDetect
+from model import registry
+from anomaly_utils.csv_tailer import CSVTailer
+from anomaly_utils.checkpoint import Checkpoint
+from anomaly_utils.anomaly_sink import AnomalySink
+from anomaly_utils.anomaly_store import AnomalyStore
+from anomaly_utils.file_watcher import FileWatcher
+from anomaly_utils.process_pool import StickyProcessPool
+
+CHECKPOINT_FILE = "anomaly_detection/scripts/polling_detector_state.ckpt"
 
 # Global flag for graceful shutdown
 shutdown_event = threading.Event()
 
-def get_file_line_count(filepath):
-    """Counts the number of lines in a file."""
-    if not os.path.exists(filepath):
-        return 0
-    with open(filepath, 'r') as f:
-        return sum(1 for line in f)
-
 def create_model_for_algorithm(algorithm_name):
-    """Create a model instance for the specified algorithm."""
-    if algorithm_name == "adaptive-3-sigma":
-        return EWMAControlThreeSigmaDetector(sigma_multiplier=3.0, window_size=50, alpha=0.1, auto_optimize=True)
-    elif algorithm_name == "jumpstarter":
-        return None  # JumpStarterDetect is a function, not a model object
-    else:
-        return None
+    """Create a model instance for the specified algorithm, None for function algorithms like jumpstarter."""
+    if registry.is_model(algorithm_name):
+        return registry.create(algorithm_name)
+    return None
+
+def run_jumpstarter(data_file, output_file, last_line, sink, pool=None):
+    """Run JumpStarter on the new rows of a file, on its worker process when a pool is given.
 
-def process_files(mapping_data, output_file, processed_lines, models):
+    Returns:
+        int: Number of data rows of the file, the next last_line.
+    """
+    # cvxpy, sklearn and the rest of JumpStarter are only imported once a jumpstarter file is processed
+    jumpstarter_detect = registry.load("jumpstarter")
+    if pool is None:
+        return jumpstarter_detect(data_path=data_file, output_path=output_file, metric_name=data_file,
+                                  last_line=last_line, sink=sink)
+    from detector.detect import detect_records
+    # The worker returns its anomalies, the shared sink stays in this process
+    rows, records = pool.submit(data_file, detect_records, data_file, data_file, last_line).result()
+    sink.write(records, key=data_file)
+    return rows
+
+def process_files(mapping_data, output_file, processed_lines, models, tailer, sink, pool=None):
     """Process all files for anomaly detection."""
     total_anomalies = 0
     
@@ -50,37 +65,25 @@ def process_files(mapping_data, output_file, processed_lines, models):
 
         print(f"\nProcessing '{data_file}' with '{algorithm_name}'...")
         
-        anomalies_before = get_file_line_count(output_file)
+        anomalies_before = sink.count(data_file)
         last_line = processed_lines.get(data_file, 0)
 
-        if algorithm_name == "EWMAControlThreeSigmaDetector":
+        if registry.is_model(algorithm_name):
             model = models.get(data_file)
             if model:
                 # The 'detect' from scripts.detect takes a model object
-                detect(model, data_file, output_file, data_file, last_line=last_line)
+                processed_lines[data_file] = last_line + detect(
+                    model, data_file, output_file, data_file, last_line=last_line, tailer=tailer, sink=sink)
             else:
                 print(f"Warning: Model for '{algorithm_name}' not found. Skipping.")
                 continue
         elif algorithm_name == "jumpstarter":
-            jumpstarter_detect_func = JumpStarterDetect
-            if jumpstarter_detect_func:
-                # This is a direct call to the detection function
-                jumpstarter_detect_func(data_path=data_file, output_path=output_file, metric_name=data_file, last_line=last_line)
-            else:
-                print(f"Warning: Function for '{algorithm_name}' not found. Skipping.")
-                continue
+            processed_lines[data_file] = run_jumpstarter(data_file, output_file, last_line, sink, pool)
         else:
             print(f"Warning: Unknown algorithm '{algorithm_name}' for file '{data_file}'. Skipping.")
             continue
         
-        # Update processed lines count
-        try:
-            df = pd.read_csv(data_file)
-            processed_lines[data_file] = len(df)
-        except Exception as e:
-            print(f"Warning: Could not update processed lines for {data_file}: {e}")
-        
-        anomalies_after = get_file_line_count(output_file)
+        anomalies_after = sink.count(data_file)
 
         newly_detected = anomalies_after - anomalies_before
         if newly_detected > 0:
@@ -91,9 +94,78 @@ def process_files(mapping_data, output_file, processed_lines, models):
     
     return total_anomalies
 
-def process_file_worker(data_file, algorithm_name, output_file, model, polling_interval, processed_lines):
+def wait_for_next_poll(seconds, wake_event=None):
+    """Sleep until the next poll of a file is due.
+
+    In event-driven mode the worker blocks on wake_event instead, which is set
+    when bytes are appended to its file (or on shutdown).
+
+    Returns:
+        bool: False if shutdown was requested.
+    """
+    if wake_event is not None:
+        wake_event.wait()
+        wake_event.clear()
+        return not shutdown_event.is_set()
+    # Sleep with frequent checks for shutdown signal (every 0.5 seconds)
+    for _ in range(int(seconds * 2)):
+        if shutdown_event.is_set():
+            return False
+        time.sleep(0.5)
+    return not shutdown_event.is_set()
+
+def dispatch_file_events(watcher, wake_events):
+    """Wake the worker of every watched file that received new bytes."""
+    while not shutdown_event.is_set():
+        for path in watcher.wait():
+            wake_event = wake_events.get(path)
+            if wake_event is not None:
+                wake_event.set()
+
+def checkpoint_worker(checkpoint, models, processed_lines, tailer, file_locks, sink):
+    """Periodically snapshot the detectors of every monitored file."""
+    while not shutdown_event.wait(checkpoint.interval):
+        try:
+            checkpoint.save_detectors(models, processed_lines, tailer, file_locks, sink)
+        except Exception as e:
+            print(f"Error saving checkpoint: {e}")
+
+def run_detection(data_file, algorithm_name, output_file, model, processed_lines, tailer, file_lock, sink,
+                  pool=None):
+    """Run the detector of one file over its new rows.
+
+    Returns:
+        int: Number of new anomalies, or None if the file has no usable detector.
+    """
+    anomalies_before = sink.count(data_file)
+
+    if registry.is_model(algorithm_name):
+        if not model:
+            print(f"[{data_file}] Warning: Model not found. Skipping.")
+            return None
+        # 检查点线程在锁内读取模型和行数，保证两者一致
+        with file_lock:
+            last_line = processed_lines.get(data_file, 0)
+            processed_lines[data_file] = last_line + detect(
+                model, data_file, output_file, data_file, last_line=last_line, tailer=tailer, sink=sink)
+    elif algorithm_name == "jumpstarter":
+        with file_lock:
+            last_line = processed_lines.get(data_file, 0)
+            processed_lines[data_file] = run_jumpstarter(data_file, output_file, last_line, sink, pool)
+
+    newly_detected = sink.count(data_file) - anomalies_before
+    if newly_detected > 0:
+        print(f"[{data_file}] Found and wrote {newly_detected} anomalies.")
+    else:
+        print(f"[{data_file}] No new anomalies found.")
+    return newly_detected
+
+def process_file_worker(data_file, algorithm_name, output_file, model, polling_interval, processed_lines, tailer,
+                        wake_event=None, file_lock=None, sink=None, pool=None):
     """Worker function for processing a single file in a separate thread."""
     print(f"Started monitoring thread for {data_file}")
+    file_lock = file_lock or threading.Lock()
+    sink = sink or AnomalySink(output_file)
     
     while not shutdown_event.is_set():
         try:
@@ -101,68 +173,148 @@ def process_file_worker(data_file, algorithm_name, output_file, model, polling_i
             
             if not os.path.exists(data_file):
                 print(f"[{data_file}] Warning: Data file not found, skipping...")
-                # Sleep with frequent checks for shutdown
-                for _ in range(polling_interval):
-                    if shutdown_event.is_set():
-                        return
-                    time.sleep(0.5)
+                if not wait_for_next_poll(polling_interval / 2, wake_event):
+                    return
                 continue
 
-            anomalies_before = get_file_line_count(output_file)
-            last_line = processed_lines.get(data_file, 0)
-
-            if algorithm_name == "EWMAControlThreeSigmaDetector":
-                if model:
-                    detect(model, data_file, output_file, data_file, last_line=last_line)
-                else:
-                    print(f"[{data_file}] Warning: Model not found. Skipping.")
-                    for _ in range(polling_interval):
-                        if shutdown_event.is_set():
-                            return
-                        time.sleep(0.5)
-                    continue
-            elif algorithm_name == "jumpstarter":
-                jumpstarter_detect_func = JumpStarterDetect
-                if jumpstarter_detect_func:
-                    jumpstarter_detect_func(data_path=data_file, output_path=output_file, metric_name=data_file, last_line=last_line)
-                else:
-                    print(f"[{data_file}] Warning: Function not found. Skipping.")
-                    for _ in range(polling_interval):
-                        if shutdown_event.is_set():
-                            return
-                        time.sleep(0.5)
-                    continue
-            
-            # Update processed lines count
-            try:
-                df = pd.read_csv(data_file)
-                processed_lines[data_file] = len(df)
-            except Exception as e:
-                print(f"[{data_file}] Warning: Could not update processed lines: {e}")
-            
-            anomalies_after = get_file_line_count(output_file)
-            newly_detected = anomalies_after - anomalies_before
-            
-            if newly_detected > 0:
-                print(f"[{data_file}] Found and wrote {newly_detected} anomalies.")
-            else:
-                print(f"[{data_file}] No new anomalies found.")
-            
-            # Sleep with frequent checks for shutdown signal (every 0.5 seconds)
-            for _ in range(polling_interval * 2):
-                if shutdown_event.is_set():
+            if run_detection(data_file, algorithm_name, output_file, model, processed_lines, tailer,
+                             file_lock, sink, pool) is None:
+                if not wait_for_next_poll(polling_interval / 2, wake_event):
                     return
-                time.sleep(0.5)
+                continue
+            
+            if not wait_for_next_poll(polling_interval, wake_event):
+                return
                 
         except Exception as e:
             print(f"[{data_file}] Error in processing: {e}")
-            for _ in range(polling_interval):
-                if shutdown_event.is_set():
-                    return
-                time.sleep(0.5)
+            if not wait_for_next_poll(polling_interval / 2, wake_event):
+                return
     
     print(f"[{data_file}] Monitoring thread stopped.")
 
+async def watch_files(watcher, wake_events):
+    """Set the wake event of every watched file that received new bytes.
+
+    inotify readiness is delivered by the event loop (add_reader), files on
+    filesystems without inotify are stat-polled every watcher.poll_interval.
+    """
+    loop = asyncio.get_running_loop()
+
+    def wake(paths):
+        for path in paths:
+            wake_event = wake_events.get(path)
+            if wake_event is not None:
+                wake_event.set()
+
+    fd = watcher.fileno()
+    if fd is not None and watcher.inotify:
+        loop.add_reader(fd, lambda: wake(watcher.read_events()))
+    try:
+        while True:
+            # wait(0) never blocks: drains inotify and runs the stat poll when due
+            wake(watcher.wait(timeout=0))
+            await asyncio.sleep(watcher.poll_interval)
+    finally:
+        if fd is not None and watcher.inotify:
+            loop.remove_reader(fd)
+
+async def monitor_file(data_file, algorithm_name, output_file, model, polling_interval, processed_lines, tailer,
+                       file_lock, sink, executor, limiter, wake_event=None, pool=None):
+    """Asyncio counterpart of process_file_worker.
+
+    The file is scheduled by its own deadline (polling_interval after the start
+    of the previous run) or, in event-driven mode, by its wake event. Detection
+    runs on the executor once a slot of the shared limiter is free.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        deadline = loop.time() + polling_interval
+        if not os.path.exists(data_file):
+            print(f"[{data_file}] Warning: Data file not found, skipping...")
+            newly_detected = None
+        else:
+            try:
+                async with limiter:
+                    newly_detected = await loop.run_in_executor(
+                        executor, run_detection, data_file, algorithm_name, output_file, model, processed_lines,
+                        tailer, file_lock, sink, pool)
+            except Exception as e:
+                print(f"[{data_file}] Error in processing: {e}")
+                newly_detected = None
+        if newly_detected is None:
+            # Retry sooner, like the threaded worker
+            deadline = loop.time() + polling_interval / 2
+
+        if wake_event is not None:
+            await wake_event.wait()
+            wake_event.clear()
+        else:
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+async def checkpoint_task(checkpoint, models, processed_lines, tailer, file_locks, sink, executor):
+    """Periodically snapshot the detectors of every monitored file."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(checkpoint.interval)
+        try:
+            await loop.run_in_executor(executor, checkpoint.save_detectors, models, processed_lines, tailer,
+                                       file_locks, sink)
+        except Exception as e:
+            print(f"Error saving checkpoint: {e}")
+
+async def run_async(args, mapping_data, models, processed_lines, tailer, file_locks, sink, checkpoint, pool=None):
+    """Monitor every file from a single event loop until SIGINT/SIGTERM.
+
+    At most args.max_concurrency detections run at a time, on a thread pool of
+    that size. On shutdown the pending runs are cancelled, running ones are
+    allowed to finish, and the final checkpoint is written before returning.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    executor = ThreadPoolExecutor(max_workers=args.max_concurrency, thread_name_prefix="detector")
+    limiter = asyncio.Semaphore(args.max_concurrency)
+    tasks = []
+    watcher = None
+    wake_events = {}
+    if args.event_driven:
+        watcher = FileWatcher(poll_interval=args.watch_poll_interval)
+        for data_file in mapping_data:
+            watcher.add(data_file)
+            wake_events[os.path.normpath(data_file)] = asyncio.Event()
+        if not watcher.inotify:
+            print("inotify unavailable for the monitored files, falling back to stat polling.")
+        tasks.append(asyncio.create_task(watch_files(watcher, wake_events)))
+    if args.checkpoint_interval > 0:
+        tasks.append(asyncio.create_task(
+            checkpoint_task(checkpoint, models, processed_lines, tailer, file_locks, sink, executor)))
+
+    for data_file, algorithm_name in mapping_data.items():
+        tasks.append(asyncio.create_task(monitor_file(
+            data_file, algorithm_name, args.anomaly_file, models.get(data_file), args.polling_interval,
+            processed_lines, tailer, file_locks[data_file], sink, executor, limiter,
+            wake_events.get(os.path.normpath(data_file)), pool)))
+
+    print(f"Monitoring {len(mapping_data)} files from one event loop, "
+          f"at most {args.max_concurrency} detections at a time.")
+    print("Press Ctrl+C to stop.")
+    try:
+        await stop.wait()
+    finally:
+        print("\nShutting down...")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Let detections already running on the pool finish before the final snapshot
+        await loop.run_in_executor(None, executor.shutdown, True)
+        if watcher is not None:
+            watcher.close()
+        if args.checkpoint_interval > 0:
+            checkpoint.save_detectors(models, processed_lines, tailer, file_locks, sink)
+
 def signal_handler(signum, frame):
     """Handle interrupt signals."""
     print(f"\nReceived signal {signum}. Initiating graceful shutdown...")
@@ -187,6 +339,24 @@ def main():
                         help="Polling interval in seconds (default: 30).")
     parser.add_argument("--run_once", action="store_true",
                         help="Run detection once and exit (no polling).")
+    parser.add_argument("--event_driven", action="store_true",
+                        help="Wake a detector only when its file is appended to (inotify), "
+                             "instead of sleeping polling_interval between runs.")
+    parser.add_argument("--watch_poll_interval", type=float, default=1.0,
+                        help="Stat polling period used by --event_driven on filesystems without inotify.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep previous anomalies and restore the detectors from the checkpoint.")
+    parser.add_argument("--checkpoint_file", default=CHECKPOINT_FILE,
+                        help="Path of the detector checkpoint.")
+    parser.add_argument("--checkpoint_interval", type=float, default=60,
+                        help="Seconds between detector checkpoints (0 disables them).")
+    parser.add_argument("--anomaly_max_bytes", type=int, default=0,
+                        help="Rotate the anomaly file once it would exceed this size (0 disables).")
+    parser.add_argument("--anomaly_rotate_interval", type=float, default=0,
+                        help="Rotate the anomaly file after this many seconds (0 disables).")
+    parser.add_argument("--anomaly_store", default=None,
+                        help="Directory of a columnar anomaly store to also record anomalies in "
+                             "(query it with scripts/query_anomalies.py).")
     parser.add_argument("--log-dir", default="traceOutput/op",
                         help="Directory to read trace logs from.")
     parser.add_argument("--output-dir", default="nfs_output/op_latency/",
@@ -195,6 +365,19 @@ def main():
                         help="Path to the state file for the analyzer.")
     parser.add_argument("--mapping-file", default="anomaly_detection/nfs_op_algorithm_mapping.json",
                         help="Path to the algorithm mapping file to update.")
+    parser.add_argument("--scheduler", choices=["asyncio", "threads"], default="asyncio",
+                        help="Continuous mode: multiplex every file in one asyncio event loop, "
+                             "or run one thread per file.")
+    parser.add_argument("--max_concurrency", type=int, default=os.cpu_count() or 4,
+                        help="Detections run at the same time by the asyncio scheduler.")
+    parser.add_argument("--jumpstarter_workers", type=int, default=0,
+                        help="Run JumpStarter files on this many worker processes, each file always on the "
+                             "same worker (0 runs them in-process).")
+    parser.add_argument("--jumpstarter_max_pending", type=int, default=None,
+                        help="JumpStarter jobs queued before detectors wait for a free worker "
+                             "(default: twice the workers).")
+    parser.add_argument("--import_report", action="store_true",
+                        help="Import the algorithms used by the mapping at startup and print their import times.")
     args = parser.parse_args()
 
     # Load the algorithm mapping
@@ -204,24 +387,28 @@ def main():
     except (FileNotFoundError, json.JSONDecodeError) as e:
         print(f"Error loading mapping file '{args.mapping_file}': {e}")
         sys.exit(1)
-        
-    # Clear previous anomaly file if it exists
-    if os.path.exists(args.anomaly_file):
-        os.remove(args.anomaly_file)
-    
-    # Clear all files in output directory if it exists
-    output_dir = os.path.dirname(args.output_file)
-    if os.path.exists(output_dir):
-        print(f"Clearing all files in output directory: {output_dir}")
-        for file in os.listdir(output_dir):
-            file_path = os.path.join(output_dir, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-                print(f"Removed: {file_path}")
+
+    checkpoint = Checkpoint(args.checkpoint_file, args.checkpoint_interval)
+    if not args.resume:
+        # Clear previous anomaly file and its rotated backups (anomalies.csv.1, ...) if they exist.
+        # Only files written by this script are removed; the data files it watches are left alone.
+        if os.path.exists(args.anomaly_file):
+            os.remove(args.anomaly_file)
+            print(f"Removed: {args.anomaly_file}")
+        anomaly_dir = os.path.dirname(args.anomaly_file) or '.'
+        anomaly_name = os.path.basename(args.anomaly_file)
+        for file in (os.listdir(anomaly_dir) if os.path.isdir(anomaly_dir) else []):
+            suffix = file[len(anomaly_name) + 1:]
+            if file.startswith(anomaly_name + '.') and suffix.isdigit():
+                os.remove(os.path.join(anomaly_dir, file))
+                print(f"Removed: {os.path.join(anomaly_dir, file)}")
+        checkpoint.remove()
 
     print(f"Starting anomaly detection for {len(mapping_data)} files...")
     print(f"Anomalies will be saved to '{args.anomaly_file}'.")
-    if not args.run_once:
+    if args.event_driven and not args.run_once:
+        print("Event-driven mode: detectors run when their files are appended to")
+    elif not args.run_once:
         print(f"Polling interval: {args.polling_interval} seconds")
     else:
         print("Running once (no polling)")
@@ -229,18 +416,57 @@ def main():
     # Create model instances for each file
     models = {}
     for data_file, algorithm_name in mapping_data.items():
-        if algorithm_name == "EWMAControlThreeSigmaDetector":
+        if registry.is_model(algorithm_name):
             models[data_file] = create_model_for_algorithm(algorithm_name)
             print(f"Created {algorithm_name} model for {data_file}")
-        elif algorithm_name == "jumpstarter":
-            models[data_file] = None  # JumpStarterDetect is a function
+        elif registry.is_registered(algorithm_name):
+            models[data_file] = None  # e.g. jumpstarter, a function run on the whole file
             print(f"Using {algorithm_name} function for {data_file}")
+        else:
+            print(f"Warning: Unknown algorithm '{algorithm_name}' for file '{data_file}'.")
+    if args.import_report:
+        # Import the algorithms of the mapping now, so the report covers every one in use
+        for algorithm_name in set(mapping_data.values()):
+            if registry.is_registered(algorithm_name):
+                registry.load(algorithm_name)
+        print("Detector import times:")
+        print(registry.format_import_report())
 
     # Track processed lines for each file
     processed_lines = defaultdict(int)
+    # Byte offsets of the monitored files, so each poll only parses appended rows
+    tailer = CSVTailer()
+    if args.resume:
+        restored = checkpoint.restore_detectors(models, processed_lines, tailer)
+        print(f"Restored {restored} detectors from checkpoint '{args.checkpoint_file}'.")
+    # One lock per file, held while the file is processed or checkpointed
+    file_locks = {data_file: threading.Lock() for data_file in mapping_data}
+    # All threads write anomalies through a single buffered writer
+    sink = AnomalySink(args.anomaly_file, max_bytes=args.anomaly_max_bytes,
+                       rotate_interval=args.anomaly_rotate_interval,
+                       store=AnomalyStore(args.anomaly_store) if args.anomaly_store else None)
+    # CPU-bound JumpStarter runs on worker processes, lightweight detectors stay in-process
+    pool = None
+    if args.jumpstarter_workers > 0 and "jumpstarter" in mapping_data.values():
+        pool = StickyProcessPool(args.jumpstarter_workers, max_pending=args.jumpstarter_max_pending)
+        print(f"Running JumpStarter files on {pool.workers} worker processes.")
+
+    if not args.run_once and args.scheduler == "asyncio":
+        # 单个事件循环调度所有文件, 退出时刷新异常并保存检查点
+        try:
+            asyncio.run(run_async(args, mapping_data, models, processed_lines, tailer, file_locks, sink,
+                                  checkpoint, pool))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            sink.close()
+        return
     
     def signal_handler(signum, frame):
         print(f"\nReceived signal {signum}. Force exiting immediately...")
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        sink.close()
         os._exit(1)
     
     signal.signal(signal.SIGINT, signal_handler)
@@ -248,19 +474,42 @@ def main():
 
     if args.run_once:
         # 单次运行模式
-        total_anomalies = process_files(mapping_data, args.output_file, processed_lines, models)
+        total_anomalies = process_files(mapping_data, args.anomaly_file, processed_lines, models, tailer, sink, pool)
         print(f"\nAnomaly detection complete. Total anomalies found: {total_anomalies}.")
+        if args.checkpoint_interval > 0:
+            checkpoint.save_detectors(models, processed_lines, tailer, sink=sink)
+        if pool is not None:
+            pool.shutdown()
+        sink.close()
     else:
         # 持续监控模式
         threads = []
+        # 事件驱动模式下每个文件一个唤醒事件
+        wake_events = {}
         
         try:
+            if args.event_driven:
+                watcher = FileWatcher(poll_interval=args.watch_poll_interval)
+                for data_file in mapping_data:
+                    watcher.add(data_file)
+                    wake_events[os.path.normpath(data_file)] = threading.Event()
+                if not watcher.inotify:
+                    print("inotify unavailable for the monitored files, falling back to stat polling.")
+                dispatcher = threading.Thread(target=dispatch_file_events, args=(watcher, wake_events), daemon=True)
+                dispatcher.start()
+
+            if args.checkpoint_interval > 0:
+                threading.Thread(target=checkpoint_worker,
+                                 args=(checkpoint, models, processed_lines, tailer, file_locks, sink),
+                                 daemon=True).start()
+
             # 创建工作线程
             for data_file, algorithm_name in mapping_data.items():
                 model = models.get(data_file)
                 thread = threading.Thread(
                     target=process_file_worker,
-                    args=(data_file, algorithm_name, args.anomaly_file, model, args.polling_interval, processed_lines),
+                    args=(data_file, algorithm_name, args.anomaly_file, model, args.polling_interval, processed_lines, tailer,
+                          wake_events.get(os.path.normpath(data_file)), file_locks[data_file], sink, pool),
                     daemon=True  # 设置为守护线程
                 )
                 threads.append(thread)
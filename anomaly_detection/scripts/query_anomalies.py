@@ -0,0 +1,30 @@
+import argparse
+
+import pandas as pd
+
+from anomaly_utils.anomaly_store import AnomalyStore
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the columnar anomaly store written by the polling detectors.")
+    parser.add_argument("--store", required=True,
+                        help="Directory of the anomaly store (--anomaly_store of the polling detectors).")
+    parser.add_argument("--metric", default=None, help="Only anomalies of this metric, e.g. READ.")
+    parser.add_argument("--t0", type=int, default=None, help="Earliest timestamp (inclusive).")
+    parser.add_argument("--t1", type=int, default=None, help="Latest timestamp (inclusive).")
+    parser.add_argument("--pid", type=int, default=None, help="Only anomalies of this process id.")
+    parser.add_argument("--detector", default=None, help="Only anomalies raised by this detector.")
+    parser.add_argument("--csv", default=None,
+                        help="Export the matching anomalies to this CSV file instead of printing them.")
+    args = parser.parse_args()
+
+    store = AnomalyStore(args.store)
+    filters = dict(metric=args.metric, t0=args.t0, t1=args.t1, pid=args.pid, detector=args.detector)
+    if args.csv:
+        exported = store.export_csv(args.csv, **filters)
+        print(f"Exported {exported} anomalies to '{args.csv}'.")
+    else:
+        with pd.option_context('display.max_rows', None, 'display.width', None):
+            print(store.query(**filters))
+
+if __name__ == '__main__':
+    main()